@@ -30,6 +30,20 @@ class InputContent:
         return "".join(self.rawLines)
 
 
+# {path => ((mtime, size), content)} of files already read,
+# so unchanged files don't get re-read. See cacheFileReads().
+_fileReadCache: dict[str, tuple[tuple[int, int], InputContent]] | None = None
+
+
+def cacheFileReads(enabled: bool) -> None:
+    """
+    Turns on (or off, clearing it) caching of FileInputSource.read(),
+    for long-running processes like watch mode that re-read the same files repeatedly.
+    """
+    global _fileReadCache
+    _fileReadCache = {} if enabled else None
+
+
 def inputFromName(sourceName: str, **kwargs: t.Any) -> InputSource:
     if sourceName == "-":
         return StdinInputSource(sourceName)
@@ -170,11 +184,25 @@ class FileInputSource(InputSource):
         return self.sourceName
 
     def read(self) -> InputContent:
+        fileKey = None
+        if _fileReadCache is not None:
+            try:
+                stat = os.stat(self.sourceName)
+                fileKey = (stat.st_mtime_ns, stat.st_size)
+            except OSError:
+                pass
+            cached = _fileReadCache.get(self.sourceName)
+            if cached is not None and cached[0] == fileKey:
+                return InputContent(list(cached[1].rawLines), cached[1].date)
         with open(self.sourceName, encoding="utf-8") as f:
-            return InputContent(
+            content = InputContent(
                 f.readlines(),
                 datetime.datetime.fromtimestamp(os.path.getmtime(self.sourceName)).date(),
             )
+        if _fileReadCache is not None and fileKey is not None:
+            _fileReadCache[self.sourceName] = (fileKey, content)
+            return InputContent(list(content.rawLines), content.date)
+        return content
 
     def hasDirectory(self) -> bool:
         return True
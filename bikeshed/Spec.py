@@ -1,9 +1,11 @@
 # pylint: disable=attribute-defined-outside-init
 from __future__ import annotations
 
+import contextlib
 import glob
 import json
 import os
+import shutil
 import sys
 from collections import defaultdict, OrderedDict
 from datetime import datetime
@@ -40,13 +42,19 @@ from . import (
     shorthands,
     t,
     testsuite,
+    timings,
     unsortedJunk as u,
+    watcher,
     wpt,
 )
 
 if t.TYPE_CHECKING:
     import widlparser
 
+    from . import highlightcache, idlcache, outputcache
+
+    StepResultT = t.TypeVar("StepResultT")
+
 
 class Spec:
     def __init__(
@@ -76,6 +84,14 @@ class Spec:
         self.debug: bool = debug
         self.token: str | None = token
         self.testing: bool = testing
+        # Set to a timings.Timings to record how long each step of the build takes.
+        self.timings: timings.Timings | None = None
+        # Set to a highlightcache.HighlightCache to reuse syntax highlighting from earlier builds.
+        self.highlightCache: highlightcache.HighlightCache | None = None
+        # Set to an idlcache.IDLCache to reuse parsed IDL from earlier builds.
+        self.idlCache: idlcache.IDLCache | None = None
+        # How many processes to syntax-highlight code blocks in.
+        self.highlightJobs: int = 1
         self.dataFile: retrieve.DataFileRequester
         if fileRequester is None:
             self.dataFile = retrieve.defaultRequester
@@ -85,10 +101,15 @@ class Spec:
         self.lines: list[line.Line] = []
         self.valid = self.initializeState()
 
-    def initializeState(self) -> bool:
+    def initializeState(self, previousRefs: refs.ReferenceManager | None = None) -> bool:
+        # If previousRefs is given (when rebuilding in watch mode),
+        # the doc-independent data loaded by the previous build is carried over,
+        # rather than being loaded again.
         self.normativeRefs: dict[str, biblio.BiblioEntry] = {}
         self.informativeRefs: dict[str, biblio.BiblioEntry] = {}
         self.refs: refs.ReferenceManager = refs.ReferenceManager(fileRequester=self.dataFile, testing=self.testing)
+        if previousRefs is not None:
+            self.refs.reuseDataFrom(previousRefs)
         self.externalRefsUsed: refs.ExternalRefsManager = refs.ExternalRefsManager()
 
         self.md: metadata.MetadataManager
@@ -109,8 +130,9 @@ class Spec:
 
         self.widl: widlparser.Parser = idl.getParser()
 
-        self.testSuites: dict[str, testsuite.TestSuite] = fetchTestSuites(self.dataFile)
-        self.languages: dict[str, language.Language] = fetchLanguages(self.dataFile)
+        if previousRefs is None:
+            self.testSuites: dict[str, testsuite.TestSuite] = fetchTestSuites(self.dataFile)
+            self.languages: dict[str, language.Language] = fetchLanguages(self.dataFile)
 
         self.extraStyles: t.DefaultDict[str, str] = defaultdict(str)
         self.extraStyles["style-colors"] = styleColors
@@ -141,18 +163,87 @@ class Spec:
 
     def preprocess(self) -> Spec:
         self.transitiveDependencies.clear()
-        self.assembleDocument()
-        self.processDocument()
+        with self.phase("assembleDocument"):
+            self.assembleDocument()
+        with self.phase("processDocument"):
+            self.processDocument()
         return self
 
+    def step(self, fn: t.Callable[..., StepResultT], *args: t.Any) -> StepResultT:
+        # Runs one step of the build on the doc,
+        # timing it if a timings report was requested.
+        if self.timings is None:
+            return fn(self, *args)
+        with self.timings.measure(timings.stepName(fn)):
+            return fn(self, *args)
+
+    def timed(self, name: str) -> t.ContextManager[None]:
+        # Like step(), for steps that aren't a single function call.
+        if self.timings is None:
+            return contextlib.nullcontext()
+        return self.timings.measure(name)
+
+    def phase(self, name: str) -> t.ContextManager[None]:
+        if self.timings is None:
+            return contextlib.nullcontext()
+        return self.timings.phase(name)
+
     def assembleDocument(self) -> Spec:
         # Textual hacks
-        u.stripBOM(self)
+        self.step(u.stripBOM)
         if self.lineNumbers:
             self.lines = u.hackyLineNumbers(self.lines)
         self.lines = markdown.stripComments(self.lines)
         self.recordDependencies(self.inputSource)
         # Extract and process metadata
+        with self.timed("metadata"):
+            self.assembleMetadata()
+        self.step(extensions.load)
+
+        # Initialize things
+        with self.timed("refs.initializeRefs"):
+            self.refs.initializeRefs(doc=self, datablocks=datablocks)
+        with self.timed("refs.initializeBiblio"):
+            self.refs.initializeBiblio()
+
+        # Deal with further <pre> blocks, and markdown
+        self.lines = self.step(datablocks.transformDataBlocks, self.lines)
+
+        markdownFeatures: set[str] = {"headings"}
+        if "mixed-indents" in self.md.complainAbout:
+            markdownFeatures.add("lint-indentation")
+        with self.timed("markdown.parse"):
+            self.lines = markdown.parse(
+                self.lines,
+                self.md.indent,
+                opaqueElements=self.md.opaqueElements,
+                blockElements=self.md.blockElements,
+                features=markdownFeatures,
+            )
+
+        self.refs.setSpecData(self.md)
+
+        # Convert to a single string of html now, for convenience.
+        self.html = "".join(x.text for x in self.lines)
+        self.step(boilerplate.addHeaderFooter)
+        self.html = self.fixText(self.html)
+
+        # Build the document
+        with self.timed("h.parseDocument"):
+            self.document = h.parseDocument(self.html)
+        headEl = h.find("head", self)
+        bodyEl = h.find("body", self)
+        assert headEl is not None
+        assert bodyEl is not None
+        self.head = headEl
+        self.body = bodyEl
+        self.step(u.correctFrontMatter)
+        self.step(includes.processInclusions)
+        self.step(metadata.parseDoc)
+        return self
+
+    def assembleMetadata(self) -> None:
+        # Parses the doc's metadata, and joins it with all the other metadata sources.
         self.lines, self.mdDocument = metadata.parse(lines=self.lines)
         # First load the metadata sources from 'local' data
         self.md = metadata.join(self.mdBaseline, self.mdDocument, self.mdCommandLine)
@@ -182,153 +273,145 @@ class Spec:
         # And compute macros again, in case the preceding steps changed them.
         self.md.fillTextMacros(self.macros, doc=self)
         self.md.validate()
-        extensions.load(self)
-
-        # Initialize things
-        self.refs.initializeRefs(doc=self, datablocks=datablocks)
-        self.refs.initializeBiblio()
-
-        # Deal with further <pre> blocks, and markdown
-        self.lines = datablocks.transformDataBlocks(self, self.lines)
-
-        markdownFeatures: set[str] = {"headings"}
-        if "mixed-indents" in self.md.complainAbout:
-            markdownFeatures.add("lint-indentation")
-        self.lines = markdown.parse(
-            self.lines,
-            self.md.indent,
-            opaqueElements=self.md.opaqueElements,
-            blockElements=self.md.blockElements,
-            features=markdownFeatures,
-        )
-
-        self.refs.setSpecData(self.md)
-
-        # Convert to a single string of html now, for convenience.
-        self.html = "".join(x.text for x in self.lines)
-        boilerplate.addHeaderFooter(self)
-        self.html = self.fixText(self.html)
-
-        # Build the document
-        self.document = h.parseDocument(self.html)
-        headEl = h.find("head", self)
-        bodyEl = h.find("body", self)
-        assert headEl is not None
-        assert bodyEl is not None
-        self.head = headEl
-        self.body = bodyEl
-        u.correctFrontMatter(self)
-        includes.processInclusions(self)
-        metadata.parseDoc(self)
-        return self
 
     def processDocument(self) -> Spec:
         # Fill in and clean up a bunch of data
-        conditional.processConditionals(self)
-        self.fillContainers: t.FillContainersT = u.locateFillContainers(self)
-        lint.exampleIDs(self)
-        wpt.processWptElements(self)
-
-        boilerplate.addBikeshedVersion(self)
-        boilerplate.addCanonicalURL(self)
-        boilerplate.addFavicon(self)
-        boilerplate.addSpecVersion(self)
-        boilerplate.addStatusSection(self)
-        boilerplate.addLogo(self)
-        boilerplate.addCopyright(self)
-        boilerplate.addSpecMetadataSection(self)
-        boilerplate.addAbstract(self)
-        boilerplate.addExpiryNotice(self)
-        boilerplate.addObsoletionNotice(self)
-        boilerplate.addAtRisk(self)
-        u.addNoteHeaders(self)
-        boilerplate.removeUnwantedBoilerplate(self)
-        shorthands.run(self)
-        inlineTags.processTags(self)
-        u.canonicalizeShortcuts(self)
-        u.addImplicitAlgorithms(self)
-        u.fixManualDefTables(self)
-        headings.processHeadings(self)
-        u.checkVarHygiene(self)
-        u.processIssuesAndExamples(self)
-        idl.markupIDL(self)
-        u.inlineRemoteIssues(self)
-        u.addImageSize(self)
+        self.step(conditional.processConditionals)
+        self.fillContainers: t.FillContainersT = self.step(u.locateFillContainers)
+        self.step(lint.exampleIDs)
+        self.step(wpt.processWptElements)
+
+        self.step(boilerplate.addBikeshedVersion)
+        self.step(boilerplate.addCanonicalURL)
+        self.step(boilerplate.addFavicon)
+        self.step(boilerplate.addSpecVersion)
+        self.step(boilerplate.addStatusSection)
+        self.step(boilerplate.addLogo)
+        self.step(boilerplate.addCopyright)
+        self.step(boilerplate.addSpecMetadataSection)
+        self.step(boilerplate.addAbstract)
+        self.step(boilerplate.addExpiryNotice)
+        self.step(boilerplate.addObsoletionNotice)
+        self.step(boilerplate.addAtRisk)
+        self.step(u.addNoteHeaders)
+        self.step(boilerplate.removeUnwantedBoilerplate)
+        self.step(shorthands.run)
+        self.step(inlineTags.processTags)
+        self.step(u.canonicalizeShortcuts)
+        self.step(u.addImplicitAlgorithms)
+        self.step(u.fixManualDefTables)
+        self.step(headings.processHeadings)
+        self.step(u.checkVarHygiene)
+        self.step(u.processIssuesAndExamples)
+        self.step(idl.markupIDL)
+        self.step(u.inlineRemoteIssues)
+        self.step(u.addImageSize)
 
         # Handle all the links
-        u.processBiblioLinks(self)
-        u.processDfns(self)
-        u.processIDL(self)
-        dfns.annotateDfns(self)
-        u.formatArgumentdefTables(self)
-        u.formatElementdefTables(self)
-        u.processAutolinks(self)
-        u.fixInterDocumentReferences(self)
-        biblio.dedupBiblioReferences(self)
-        caniuse.addCanIUsePanels(self)
-        boilerplate.addIndexSection(self)
-        boilerplate.addExplicitIndexes(self)
-        boilerplate.addStyles(self)
-        boilerplate.addReferencesSection(self)
-        boilerplate.addPropertyIndex(self)
-        boilerplate.addIDLSection(self)
-        boilerplate.addIssuesSection(self)
-        boilerplate.addCustomBoilerplate(self)
-        headings.processHeadings(self, "all")  # again
-        boilerplate.removeUnwantedBoilerplate(self)
-        boilerplate.addTOCSection(self)
-        u.addSelfLinks(self)
-        u.processAutolinks(self)
-        boilerplate.removeUnwantedBoilerplate(self)
+        self.step(u.processBiblioLinks)
+        self.step(u.processDfns)
+        self.step(u.processIDL)
+        self.step(dfns.annotateDfns)
+        self.step(u.formatArgumentdefTables)
+        self.step(u.formatElementdefTables)
+        self.step(u.processAutolinks)
+        self.step(u.fixInterDocumentReferences)
+        self.step(biblio.dedupBiblioReferences)
+        self.step(caniuse.addCanIUsePanels)
+        self.step(boilerplate.addIndexSection)
+        self.step(boilerplate.addExplicitIndexes)
+        self.step(boilerplate.addStyles)
+        self.step(boilerplate.addReferencesSection)
+        self.step(boilerplate.addPropertyIndex)
+        self.step(boilerplate.addIDLSection)
+        self.step(boilerplate.addIssuesSection)
+        self.step(boilerplate.addCustomBoilerplate)
+        self.step(headings.processHeadings, "all")  # again
+        self.step(boilerplate.removeUnwantedBoilerplate)
+        self.step(boilerplate.addTOCSection)
+        self.step(u.addSelfLinks)
+        self.step(u.processAutolinks)
+        self.step(boilerplate.removeUnwantedBoilerplate)
         # Add MDN panels after all IDs/anchors have been added
-        mdn.addMdnPanels(self)
-        highlight.addSyntaxHighlighting(self)
-        boilerplate.addBikeshedBoilerplate(self)
-        fingerprinting.addTrackingVector(self)
-        u.fixIntraDocumentReferences(self)
-        u.fixInterDocumentReferences(self)
-        u.verifyUsageOfAllLocalBiblios(self)
-        u.removeMultipleLinks(self)
-        u.forceCrossorigin(self)
-        addDomintroStyles(self)
-        lint.brokenLinks(self)
-        lint.accidental2119(self)
-        lint.missingExposed(self)
-        lint.requiredIDs(self)
-        lint.unusedInternalDfns(self)
+        self.step(mdn.addMdnPanels)
+        self.step(highlight.addSyntaxHighlighting)
+        self.step(boilerplate.addBikeshedBoilerplate)
+        self.step(fingerprinting.addTrackingVector)
+        self.step(u.fixIntraDocumentReferences)
+        self.step(u.fixInterDocumentReferences)
+        self.step(u.verifyUsageOfAllLocalBiblios)
+        self.step(u.removeMultipleLinks)
+        self.step(u.forceCrossorigin)
+        self.step(addDomintroStyles)
+        self.step(lint.brokenLinks)
+        self.step(lint.accidental2119)
+        self.step(lint.missingExposed)
+        self.step(lint.requiredIDs)
+        self.step(lint.unusedInternalDfns)
 
         # Any final HTML cleanups
-        u.cleanupHTML(self)
+        self.step(u.cleanupHTML)
         if self.md.prepTR:
-            # Don't try and override the W3C's icon.
-            for el in h.findAll("[rel ~= 'icon']", self):
-                h.removeNode(el)
-            # Make sure the W3C stylesheet is after all other styles.
-            for el in h.findAll("link", self):
-                if el.get("href", "").startswith("https://www.w3.org/StyleSheets/TR"):
-                    h.appendChild(self.head, el)
-            # Ensure that all W3C links are https.
-            for el in h.findAll("a", self):
-                href = el.get("href", "")
-                if href.startswith("http://www.w3.org") or href.startswith("http://lists.w3.org"):
-                    el.set("href", "https" + href[4:])
-                text = el.text or ""
-                if text.startswith("http://www.w3.org") or text.startswith("http://lists.w3.org"):
-                    el.text = "https" + text[4:]
-            # Loaded from .include files
-            extensions.BSPrepTR(self)  # type: ignore # pylint: disable=no-member
+            with self.timed("prepTR"):
+                # Don't try and override the W3C's icon.
+                for el in h.findAll("[rel ~= 'icon']", self):
+                    h.removeNode(el)
+                # Make sure the W3C stylesheet is after all other styles.
+                for el in h.findAll("link", self):
+                    if el.get("href", "").startswith("https://www.w3.org/StyleSheets/TR"):
+                        h.appendChild(self.head, el)
+                # Ensure that all W3C links are https.
+                for el in h.findAll("a", self):
+                    href = el.get("href", "")
+                    if href.startswith("http://www.w3.org") or href.startswith("http://lists.w3.org"):
+                        el.set("href", "https" + href[4:])
+                    text = el.text or ""
+                    if text.startswith("http://www.w3.org") or text.startswith("http://lists.w3.org"):
+                        el.text = "https" + text[4:]
+                # Loaded from .include files
+                extensions.BSPrepTR(self)  # type: ignore # pylint: disable=no-member
 
         return self
 
     def serialize(self) -> str | None:
         try:
-            rendered = h.Serializer(self.md.opaqueElements, self.md.blockElements).serialize(self.document)
+            with self.timed("h.Serializer.serialize"):
+                rendered = h.Serializer(self.md.opaqueElements, self.md.blockElements).serialize(self.document)
         except Exception as e:
             m.die(str(e))
             return None
-        rendered = u.finalHackyCleanup(rendered)
+        with self.timed("u.finalHackyCleanup"):
+            rendered = u.finalHackyCleanup(rendered)
         return rendered
 
+    def serializeTo(self, writer: t.Callable[[str], t.Any], chunkSize: int = 2**16) -> None:
+        """
+        Like serialize(), but streams the output into the writer
+        in chunks of roughly chunkSize characters as the tree is walked,
+        rather than building the whole document as one string first.
+        Each chunk gets finalHackyCleanup() on its own.
+        Raises whatever the serializer or the writer raises.
+        """
+        pieces: list[str] = []
+        buffered = 0
+
+        def flush() -> None:
+            nonlocal buffered
+            writer(u.finalHackyCleanup("".join(pieces)))
+            pieces.clear()
+            buffered = 0
+
+        def bufferedWriter(text: str) -> None:
+            nonlocal buffered
+            pieces.append(text)
+            buffered += len(text)
+            if buffered >= chunkSize:
+                flush()
+
+        with self.timed("h.Serializer.serialize"):
+            h.Serializer(self.md.opaqueElements, self.md.blockElements).serializeTo(self.document, bufferedWriter)
+            flush()
+
     def fixMissingOutputFilename(self, outputFilename: str | None) -> str:
         if outputFilename is None:
             # More sensible defaults!
@@ -344,20 +427,64 @@ class Spec:
                 outputFilename = "-"
         return outputFilename
 
-    def finish(self, outputFilename: str | None = None, newline: str | None = None) -> None:
+    def finish(
+        self,
+        outputFilename: str | None = None,
+        newline: str | None = None,
+        outputCache: outputcache.OutputCache | None = None,
+    ) -> None:
         catchArgparseBug(outputFilename)
         self.printResultMessage()
         outputFilename = self.fixMissingOutputFilename(outputFilename)
-        rendered = self.serialize()
+        if outputCache is None and not constants.dryRun:
+            # Nothing needs the whole output as a string,
+            # so stream it straight out.
+            with self.phase("serialize"):
+                self.streamOutput(outputFilename, newline)
+            return
+        with self.phase("serialize"):
+            rendered = self.serialize()
+        if rendered and outputCache is not None:
+            outputCache.store(self, rendered)
         if rendered and not constants.dryRun:
+            self.saveOutput(rendered, outputFilename, newline)
+
+    def saveOutput(self, rendered: str, outputFilename: str, newline: str | None = None) -> None:
+        try:
+            if outputFilename == "-":
+                sys.stdout.write(rendered)
+            else:
+                with open(outputFilename, "w", encoding="utf-8", newline=newline) as f:
+                    f.write(rendered)
+        except Exception as e:
+            m.die(f"Something prevented me from saving the output document to {outputFilename}:\n{e}")
+
+    def streamOutput(self, outputFilename: str, newline: str | None = None) -> None:
+        if outputFilename == "-":
             try:
-                if outputFilename == "-":
-                    sys.stdout.write(rendered)
-                else:
-                    with open(outputFilename, "w", encoding="utf-8", newline=newline) as f:
-                        f.write(rendered)
+                self.serializeTo(sys.stdout.write)
             except Exception as e:
-                m.die(f"Something prevented me from saving the output document to {outputFilename}:\n{e}")
+                m.die(str(e))
+            return
+        # Stream into a temp file and swap it in once it's complete,
+        # so a failed build leaves the previous output alone,
+        # and nothing watching the output ever sees it half-written.
+        # (If the output is a symlink, swap out the file it points to, not the link itself.)
+        targetFilename = os.path.realpath(outputFilename)
+        tempFilename = targetFilename + ".tmp"
+        try:
+            with open(tempFilename, "w", encoding="utf-8", newline=newline) as f:
+                self.serializeTo(f.write)
+            if os.path.exists(targetFilename):
+                shutil.copymode(targetFilename, tempFilename)
+            os.replace(tempFilename, targetFilename)
+        except OSError as e:
+            m.die(f"Something prevented me from saving the output document to {outputFilename}:\n{e}")
+        except Exception as e:
+            m.die(str(e))
+        finally:
+            if os.path.exists(tempFilename):
+                os.remove(tempFilename)
 
     def printResultMessage(self) -> None:
         # If I reach this point, I've succeeded, but maybe with reservations.
@@ -377,8 +504,6 @@ class Spec:
             return
 
     def watch(self, outputFilename: str | None, port: int | None = None, localhost: bool = False) -> None:
-        import time
-
         outputFilename = self.fixMissingOutputFilename(outputFilename)
         if self.inputSource.mtime() is None:
             m.die(f"Watch mode doesn't support {self.inputSource}")
@@ -408,27 +533,36 @@ class Spec:
             server = None
 
         mdCommandLine = self.mdCommandLine
+        # Rebuilds will mostly be re-reading the same files, so cache them.
+        InputSource.cacheFileReads(True)
+        # And re-highlighting the same code blocks.
+        if self.highlightCache is None:
+            from .highlightcache import HighlightCache
+
+            self.highlightCache = HighlightCache()
+        # And re-parsing the same IDL.
+        if self.idlCache is None:
+            from .idlcache import IDLCache
+
+            self.idlCache = IDLCache()
 
+        fileWatcher = watcher.makeWatcher()
         try:
             self.preprocess()
             self.finish(outputFilename)
-            lastInputModified = {dep: dep.mtime() for dep in self.transitiveDependencies}
+            fileWatcher.watch(self.transitiveDependencies)
             printDone()
             try:
                 while True:
-                    # Comparing mtimes with "!=" handles when a file starts or
-                    # stops existing, and it's fine to rebuild if an mtime
-                    # somehow gets older.
-                    if any(input.mtime() != lastModified for input, lastModified in lastInputModified.items()):
-                        m.resetSeenMessages()
-                        m.p("\nSource file modified. Rebuilding...")
-                        self.initializeState()
-                        self.mdCommandLine = mdCommandLine
-                        self.preprocess()
-                        self.finish(outputFilename)
-                        lastInputModified = {dep: dep.mtime() for dep in self.transitiveDependencies}
-                        printDone()
-                    time.sleep(1)
+                    fileWatcher.wait()
+                    m.resetSeenMessages()
+                    m.p("\nSource file modified. Rebuilding...")
+                    self.initializeState(previousRefs=self.refs)
+                    self.mdCommandLine = mdCommandLine
+                    self.preprocess()
+                    self.finish(outputFilename)
+                    fileWatcher.watch(self.transitiveDependencies)
+                    printDone()
             except KeyboardInterrupt:
                 m.p("Exiting~")
                 if server:
@@ -437,6 +571,8 @@ class Spec:
                 sys.exit(0)
         except Exception as e:
             m.die(f"Something went wrong while watching the file:\n{e}")
+        finally:
+            fileWatcher.close()
 
     def fixText(self, text: str, moreMacros: dict[str, str] | None = None) -> str:
         # Do several textual replacements that need to happen *before* the document is parsed as h.
@@ -539,13 +675,12 @@ def catchArgparseBug(string: str | None) -> bool:
 
 
 def fetchTestSuites(dataFile: retrieve.DataFileRequester) -> dict[str, testsuite.TestSuite]:
-    return {k: testsuite.TestSuite(**v) for k, v in json.loads(dataFile.fetch("test-suites.json", str=True)).items()}
+    return {k: testsuite.TestSuite(**v) for k, v in dataFile.fetchParsed("test-suites.json").items()}
 
 
 def fetchLanguages(dataFile: retrieve.DataFileRequester) -> dict[str, language.Language]:
     return {
-        k: language.Language(v["name"], v["native-name"])
-        for k, v in json.loads(dataFile.fetch("languages.json", str=True)).items()
+        k: language.Language(v["name"], v["native-name"]) for k, v in dataFile.fetchParsed("languages.json").items()
     }
 
 
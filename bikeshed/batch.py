@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+import contextlib
+import glob
+import io
+import json
+import os
+import sys
+import time
+import traceback
+
+from . import messages as m, t
+
+# `bikeshed batch` builds a bunch of specs at once across a pool of worker processes.
+#
+# The read-only spec-data is loaded once, in the parent,
+# and the workers are forked from it, so they all share it copy-on-write.
+# Each document gets its own fresh message state,
+# and its messages are captured and printed as a single block when it finishes,
+# so the reports for different specs don't interleave.
+
+
+if t.TYPE_CHECKING:
+
+    class BatchResultT(t.TypedDict):
+        input: str
+        output: str | None
+        exitCode: int
+        time: float
+        messageCounts: dict[str, int]
+        messages: str
+
+
+def expandInputs(patterns: list[str]) -> list[str]:
+    paths = []
+    seen = set()
+    for pattern in patterns:
+        if os.path.exists(pattern):
+            matches = [pattern]
+        else:
+            matches = sorted(glob.glob(pattern, recursive=True))
+            if not matches:
+                m.warn(f"'{pattern}' didn't match any files.")
+        for path in matches:
+            if os.path.isdir(path) or path in seen:
+                continue
+            seen.add(path)
+            paths.append(path)
+    return paths
+
+
+def runBatch(
+    patterns: list[str],
+    jobs: int | None = None,
+    summaryFilename: str | None = None,
+    extras: list[str] | None = None,
+    cacheDir: str | None = None,
+) -> bool:
+    paths = expandInputs(patterns)
+    if not paths:
+        m.die("No input files were found.")
+        return False
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    jobs = max(1, min(jobs, len(paths)))
+
+    from . import daemon
+
+    summaryToStdout = summaryFilename is None or summaryFilename == "-"
+    # If the summary's going to stdout, it has to be the only thing there,
+    # so it can be piped straight into a JSON consumer;
+    # the progress lines and each spec's messages go to stderr instead.
+    with contextlib.redirect_stdout(sys.stderr) if summaryToStdout else contextlib.nullcontext():
+        daemon.warmUp()
+
+        start = time.perf_counter()
+        results: dict[str, BatchResultT] = {}
+        for result in buildAll(paths, jobs, extras or [], cacheDir):
+            results[result["input"]] = result
+            reportResult(result)
+        elapsed = time.perf_counter() - start
+
+    summary = {
+        "jobs": jobs,
+        "time": round(elapsed, 3),
+        "specs": [summarize(results[path]) for path in paths],
+    }
+    summaryText = json.dumps(summary, indent=2)
+    if summaryFilename is None or summaryFilename == "-":
+        sys.stdout.write(summaryText + "\n")
+    else:
+        try:
+            with open(summaryFilename, "w", encoding="utf-8") as fh:
+                fh.write(summaryText + "\n")
+        except OSError as e:
+            m.die(f"Couldn't save the batch summary to {summaryFilename}:\n{e}")
+    return all(result["exitCode"] == 0 for result in results.values())
+
+
+def buildAll(paths: list[str], jobs: int, extras: list[str], cacheDir: str | None) -> t.Iterator[BatchResultT]:
+    import multiprocessing
+
+    if jobs == 1 or "fork" not in multiprocessing.get_all_start_methods():
+        # Without fork(), workers would have to reload all the data themselves,
+        # so just build them one at a time instead.
+        for path in paths:
+            yield buildSpec(path, extras, cacheDir)
+        return
+    with multiprocessing.get_context("fork").Pool(jobs) as pool:
+        yield from pool.imap_unordered(buildSpecStar, [(path, extras, cacheDir) for path in paths])
+
+
+def buildSpecStar(args: tuple[str, list[str], str | None]) -> BatchResultT:
+    return buildSpec(*args)
+
+
+def buildSpec(path: str, extras: list[str], cacheDir: str | None = None) -> BatchResultT:
+    from . import highlightcache, idlcache, metadata, outputcache
+    from .Spec import Spec
+
+    m.resetSeenMessages()
+    output = io.StringIO()
+    outputFilename = None
+    exitCode = 0
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(output):
+        try:
+            doc = Spec(inputFilename=path)
+            doc.mdCommandLine = metadata.fromCommandLine(extras)
+            outputFilename = doc.fixMissingOutputFilename(None)
+            cache = outputcache.OutputCache(cacheDir) if cacheDir else None
+            if cache is None or not cache.replay(doc, outputFilename):
+                if cacheDir:
+                    doc.highlightCache = highlightcache.HighlightCache(os.path.join(cacheDir, "highlight"))
+                    doc.idlCache = idlcache.IDLCache(os.path.join(cacheDir, "idl"))
+                doc.preprocess()
+                doc.finish(outputFilename=outputFilename, outputCache=cache)
+        except SystemExit as e:
+            exitCode = e.code if isinstance(e.code, int) else 1
+        except Exception:  # pylint: disable=broad-except
+            traceback.print_exc(file=sys.stdout)
+            exitCode = 1
+    return {
+        "input": path,
+        "output": outputFilename,
+        "exitCode": exitCode,
+        "time": time.perf_counter() - start,
+        "messageCounts": dict(m.messageCounts),
+        "messages": output.getvalue(),
+    }
+
+
+def reportResult(result: BatchResultT) -> None:
+    if result["exitCode"] == 0:
+        m.success(f"{result['input']} ({result['time']:.2f}s)")
+    else:
+        m.failure(f"{result['input']} ({result['time']:.2f}s)")
+    if result["messages"]:
+        m.p(result["messages"], end="")
+
+
+def summarize(result: BatchResultT) -> dict[str, t.Any]:
+    return {
+        "input": result["input"],
+        "output": result["output"],
+        "exitCode": result["exitCode"],
+        "time": round(result["time"], 3),
+        "fatal": result["messageCounts"].get("fatal", 0),
+        "linkerror": result["messageCounts"].get("linkerror", 0),
+        "lint": result["messageCounts"].get("lint", 0),
+        "warning": result["messageCounts"].get("warning", 0),
+    }
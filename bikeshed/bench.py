@@ -0,0 +1,262 @@
+from __future__ import annotations
+
+import glob
+import json
+import os
+import statistics
+import sys
+import time
+
+from . import constants, messages as m, t
+
+# `bikeshed bench` times builds of a set of specs,
+# so Bikeshed upgrades can be gated on performance
+# the way `bikeshed test` gates them on output.
+#
+# Each spec is built --runs times, each time in a fresh fork of a process
+# that already has Bikeshed and its data loaded,
+# so every run starts from the same state and its peak RSS is its own.
+# Specs are built the same way `bikeshed test` builds them
+# (fixed date, no network, readonly data files),
+# so the numbers only change when Bikeshed does.
+#
+# The results (median and p95 build time, peak RSS, and the median time of each pipeline step)
+# can be saved as a baseline, and later runs compared against it;
+# any spec whose median got slower by more than --threshold percent is a regression.
+
+
+if t.TYPE_CHECKING:
+
+    class RunResultT(t.TypedDict):
+        time: float
+        peakRSS: int | None
+        phases: dict[str, float]
+        steps: dict[str, float]
+
+    class SpecResultT(t.TypedDict):
+        runs: int
+        median: float
+        p95: float
+        min: float
+        peakRSS: int | None
+        phases: dict[str, float]
+        steps: dict[str, float]
+
+
+FORMAT_VERSION = 1
+
+
+def benchPaths(patterns: list[str] | None, specDirs: list[str] | None) -> list[str]:
+    from . import test
+
+    paths = []
+    if patterns or not specDirs:
+        paths.extend(test.testPaths(patterns))
+    for specDir in specDirs or []:
+        found = sorted(glob.glob(os.path.join(specDir, "**", "*.bs"), recursive=True))
+        if not found:
+            m.warn(f"Didn't find any .bs files in '{specDir}'.")
+        paths.extend(os.path.abspath(path) for path in found)
+    return paths
+
+
+def runBench(
+    patterns: list[str] | None = None,
+    specDirs: list[str] | None = None,
+    runs: int = 5,
+    baselineFilename: str | None = None,
+    saveFilename: str | None = None,
+    threshold: float = 10,
+) -> bool:
+    from . import daemon, retrieve, test
+
+    paths = benchPaths(patterns, specDirs)
+    if not paths:
+        m.die("No specs were found to benchmark.")
+        return False
+    runs = max(1, runs)
+
+    baseline = None
+    if baselineFilename is not None:
+        baseline = loadResults(baselineFilename)
+        if baseline is None:
+            return False
+
+    # Same data files the builds use.
+    daemon.warmUp(retrieve.DataFileRequester(fileType="readonly"))
+
+    results: dict[str, SpecResultT] = {}
+    for path in paths:
+        name = test.testNameForPath(path)
+        runResults = [benchInSubprocess(path) for _ in range(runs)]
+        results[name] = summarizeRuns(runResults)
+        m.p(formatResult(name, results[name], baseline["specs"].get(name) if baseline else None))
+
+    if saveFilename is not None:
+        saveResults(saveFilename, results, runs)
+    if baseline is None:
+        return True
+    return reportRegressions(results, baseline["specs"], threshold)
+
+
+def benchInSubprocess(path: str) -> RunResultT:
+    import multiprocessing
+
+    if "fork" not in multiprocessing.get_all_start_methods():
+        # Without fork(), every run would have to reload everything,
+        # so just build in this process; peak RSS is then cumulative.
+        return benchOnce(path)
+    with multiprocessing.get_context("fork").Pool(1) as pool:
+        return pool.apply(benchOnce, (path,))
+
+
+def benchOnce(path: str) -> RunResultT:
+    from . import retrieve, test, timings
+    from .Spec import Spec
+
+    m.resetSeenMessages()
+    timer = timings.Timings()
+    # Like `bikeshed test`, ignore the spec's errors, and don't print anything.
+    oldQuiet, oldErrorLevel = constants.quiet, constants.errorLevel[0]
+    constants.quiet = float("infinity")
+    constants.setErrorLevel("nothing")
+    try:
+        start = time.perf_counter()
+        doc = Spec(inputFilename=path, fileRequester=retrieve.DataFileRequester(fileType="readonly"), testing=True)
+        doc.timings = timer
+        test.addTestMetadata(doc)
+        doc.preprocess()
+        with doc.phase("serialize"):
+            doc.serialize()
+        elapsed = time.perf_counter() - start
+    finally:
+        constants.quiet = oldQuiet
+        constants.setErrorLevel(oldErrorLevel)
+
+    report = timer.report(doc)
+    return {
+        "time": elapsed,
+        "peakRSS": peakRSS(),
+        "phases": {name: data["wall"] for name, data in report["phases"].items()},
+        "steps": {name: data["wall"] for name, data in report["byName"].items()},
+    }
+
+
+def peakRSS() -> int | None:
+    # In bytes.
+    try:
+        import resource
+    except ImportError:
+        return None
+    maxRSS = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS reports bytes.
+    return maxRSS if sys.platform == "darwin" else maxRSS * 1024
+
+
+def summarizeRuns(runResults: list[RunResultT]) -> SpecResultT:
+    times = [run["time"] for run in runResults]
+    rssValues = [run["peakRSS"] for run in runResults if run["peakRSS"] is not None]
+    return {
+        "runs": len(times),
+        "median": round(statistics.median(times), 4),
+        "p95": round(percentile(times, 95), 4),
+        "min": round(min(times), 4),
+        "peakRSS": max(rssValues) if rssValues else None,
+        "phases": medianByName([run["phases"] for run in runResults]),
+        "steps": medianByName([run["steps"] for run in runResults]),
+    }
+
+
+def percentile(values: list[float], pct: float) -> float:
+    # Nearest-rank percentile.
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def medianByName(dicts: list[dict[str, float]]) -> dict[str, float]:
+    names = {name for d in dicts for name in d}
+    return {name: round(statistics.median(d.get(name, 0) for d in dicts), 4) for name in sorted(names)}
+
+
+def formatResult(name: str, result: SpecResultT, baseline: SpecResultT | None) -> str:
+    text = f"{name}: median {result['median']:.3f}s, p95 {result['p95']:.3f}s"
+    if result["peakRSS"] is not None:
+        text += f", peak RSS {result['peakRSS'] / 2**20:.0f}MiB"
+    if baseline:
+        text += f" ({percentChange(baseline['median'], result['median']):+.1f}% vs baseline)"
+    return text
+
+
+def percentChange(old: float, new: float) -> float:
+    if old == 0:
+        return 0
+    return (new - old) / old * 100
+
+
+def reportRegressions(results: dict[str, SpecResultT], baseline: dict[str, SpecResultT], threshold: float) -> bool:
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        change = percentChange(baseline[name]["median"], result["median"])
+        if change > threshold:
+            # Point at the steps that got slower, to narrow down the cause.
+            oldSteps = baseline[name].get("steps", {})
+            slowerSteps = sorted(
+                (
+                    (stepTime - oldSteps[step], step)
+                    for step, stepTime in result["steps"].items()
+                    if step in oldSteps and stepTime > oldSteps[step]
+                ),
+                reverse=True,
+            )[:3]
+            details = ", ".join(f"{step} +{delta:.3f}s" for delta, step in slowerSteps)
+            regressions.append(f"{name}: {change:+.1f}%" + (f" ({details})" if details else ""))
+    missing = sorted(set(results) - set(baseline))
+    if missing:
+        m.say("Not in the baseline, so not compared:\n" + "\n".join("* " + name for name in missing))
+    if regressions:
+        m.failure(f"{len(regressions)} spec(s) got more than {threshold:g}% slower than the baseline:")
+        for regression in regressions:
+            m.p("* " + regression)
+        return False
+    m.success(f"No spec got more than {threshold:g}% slower than the baseline.")
+    return True
+
+
+def loadResults(filename: str) -> dict[str, t.Any] | None:
+    try:
+        with open(filename, encoding="utf-8") as fh:
+            data = json.load(fh)
+    except OSError as e:
+        m.die(f"Couldn't read the benchmark baseline '{filename}':\n{e}")
+        return None
+    except ValueError as e:
+        m.die(f"The benchmark baseline '{filename}' isn't valid JSON:\n{e}")
+        return None
+    if not isinstance(data, dict) or data.get("version") != FORMAT_VERSION or "specs" not in data:
+        m.die(f"'{filename}' isn't a benchmark baseline saved by this version of Bikeshed.")
+        return None
+    return data
+
+
+def saveResults(filename: str, results: dict[str, SpecResultT], runs: int) -> None:
+    from .timings import bikeshedVersion
+
+    data = {
+        "version": FORMAT_VERSION,
+        "bikeshedVersion": bikeshedVersion(),
+        "python": sys.version.split()[0],
+        "runs": runs,
+        "specs": results,
+    }
+    text = json.dumps(data, indent=2, sort_keys=True)
+    if filename == "-":
+        sys.stdout.write(text + "\n")
+        return
+    try:
+        with open(filename, "w", encoding="utf-8") as fh:
+            fh.write(text + "\n")
+    except OSError as e:
+        m.die(f"Couldn't save the benchmark results to '{filename}':\n{e}")
@@ -1,12 +1,18 @@
 from __future__ import annotations
 
 import abc
+import bisect
 import dataclasses
+import io
 import re
 from collections import defaultdict
 
 from . import constants, h, messages as m, t
 
+if t.TYPE_CHECKING:
+    # {bigram => [(key, how many times the key contains it)]}
+    BigramPostingsT: t.TypeAlias = defaultdict[str, list[tuple[str, int]]]
+
 
 @dataclasses.dataclass
 class BiblioEntry(metaclass=abc.ABCMeta):
@@ -337,6 +343,11 @@ def processSpecrefBiblioFile(text: str, storage: t.BiblioStorageT, order: int) -
     return storage
 
 
+def splitLines(text: str) -> list[str]:
+    # Same lines as iterating over the file would give.
+    return io.StringIO(text).readlines()
+
+
 def loadBiblioDataFile(lines: t.Iterator[str], storage: t.BiblioStorageT) -> None:
     b: dict[str, t.Any]
     biblio: BiblioEntry
@@ -389,54 +400,94 @@ def loadBiblioDataFile(lines: t.Iterator[str], storage: t.BiblioStorageT) -> Non
 
 
 def levenshtein(a: str, b: str) -> int:
-    "Calculates the Levenshtein distance between a and b."
-    n, m = len(a), len(b)  # pylint: disable=redefined-outer-name
-    if n > m:
-        # Make sure n <= m, to use O(min(n,m)) space
+    """
+    Calculates the Levenshtein distance between a and b.
+    Uses Myers' bit-parallel algorithm (in Hyyrö's global-distance form),
+    with each column of the usual DP table packed into an int,
+    so it only loops over the characters of one string.
+    """
+    if len(a) > len(b):
+        # Make sure a is the shorter, to keep the bitmasks small
         a, b = b, a
-        n, m = m, n
-
-    current: list[int] = list(range(n + 1))
-    for i in range(1, m + 1):
-        previous, current = current, [i] + [0] * n
-        for j in range(1, n + 1):
-            add, delete = previous[j] + 1, current[j - 1] + 1
-            change = previous[j - 1]
-            if a[j - 1] != b[i - 1]:
-                change = change + 1
-            current[j] = min(add, delete, change)
-
-    return current[n]
-
-
-def findCloseBiblios(biblioKeys: t.Sequence[str], target: str, n: int = 5) -> list[str]:
+    n = len(a)
+    if n == 0:
+        return len(b)
+
+    # Bitmask of the positions in a where each character occurs
+    positions: dict[str, int] = {}
+    for i, char in enumerate(a):
+        positions[char] = positions.get(char, 0) | (1 << i)
+    mask = (1 << n) - 1
+    lastBit = 1 << (n - 1)
+
+    # Bitmasks of where the vertical deltas are +1/-1
+    plusV, minusV = mask, 0
+    distance = n
+    for char in b:
+        eq = positions.get(char, 0)
+        xv = eq | minusV
+        xh = (((eq & plusV) + plusV) ^ plusV) | eq
+        plusH = minusV | ~(xh | plusV)
+        minusH = plusV & xh
+        if plusH & lastBit:
+            distance += 1
+        elif minusH & lastBit:
+            distance -= 1
+        # Shifting in a 1 makes the top row 0, 1, 2..., for global distance
+        plusH = (plusH << 1) | 1
+        minusH <<= 1
+        plusV = (minusH | ~(xv | plusH)) & mask
+        minusV = plusH & xv & mask
+    return distance
+
+
+def bigramCounts(text: str) -> dict[str, int]:
+    counts: defaultdict[str, int] = defaultdict(int)
+    for i in range(len(text) - 1):
+        counts[text[i : i + 2]] += 1
+    return counts
+
+
+def addBigrams(postings: BigramPostingsT, keys: t.Iterable[str]) -> None:
+    for key in keys:
+        for bigram, count in bigramCounts(key).items():
+            postings[bigram].append((key, count))
+
+
+def findCloseBiblios(biblioKeys: t.AbstractSet[str], postings: BigramPostingsT, target: str, n: int = 5) -> list[str]:
     """
     Finds biblio entries close to the target.
     Returns all biblios with target as the substring,
-    plus the 5 closest ones per levenshtein distance.
+    plus the 5 closest ones per levenshtein distance
+    (alphabetically first, among equally close ones).
+    postings is the bigram index of biblioKeys, built by addBigrams().
     """
     target = target.lower()
-    names: list[tuple[str, int]] = []
-    superStrings: list[str] = []
-
-    for name in biblioKeys:
-        if target in name:
-            superStrings.append(name)
-        else:
-            distance = levenshtein(name, target)
-            tup = (name, distance)
-            if len(names) < n:
-                names.append(tup)
-                names.sort(key=lambda x: x[1])
-            elif distance >= names[-1][1]:
-                pass
-            else:
-                for i, entry in enumerate(names):
-                    if distance < entry[1]:
-                        names.insert(i, tup)
-                        names.pop()
-                        break
-    return sorted(s.strip() for s in superStrings) + [name.strip() for name, d in names]
+    superStrings = [name for name in biblioKeys if target in name]
+
+    # Each edit changes at most two bigrams,
+    # so two strings sharing few bigrams (or differing a lot in length) can't be close.
+    # Check the keys with the lowest such bound first,
+    # and stop once no remaining key can beat the current top n.
+    shared: defaultdict[str, int] = defaultdict(int)
+    for bigram, count in bigramCounts(target).items():
+        for key, keyCount in postings.get(bigram, ()):
+            shared[key] += min(count, keyCount)
+
+    def lowerBound(name: str) -> int:
+        longest = max(len(name), len(target))
+        return max(abs(len(name) - len(target)), (longest - 1 - shared.get(name, 0) + 1) // 2)
+
+    candidates = sorted((lowerBound(name), name) for name in biblioKeys if target not in name)
+    closest: list[tuple[int, str]] = []
+    for bound, name in candidates:
+        if len(closest) == n and bound > closest[-1][0]:
+            break
+        distance = levenshtein(name, target)
+        if len(closest) < n or (distance, name) < closest[-1]:
+            bisect.insort(closest, (distance, name))
+            del closest[n:]
+    return sorted(s.strip() for s in superStrings) + [name.strip() for _, name in closest]
 
 
 def dedupBiblioReferences(doc: t.SpecT) -> None:
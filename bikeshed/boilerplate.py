@@ -2,13 +2,14 @@ from __future__ import annotations
 
 import copy
 import dataclasses
+import functools
 import os
 import re
 import subprocess
 from collections import OrderedDict, defaultdict
 from datetime import datetime
 
-from . import conditional, config, dfnpanels, h, messages as m, refs as r, retrieve, t
+from . import conditional, config, constants, dfnpanels, h, messages as m, refs as r, retrieve, t
 from .translate import _
 
 if t.TYPE_CHECKING:
@@ -18,11 +19,24 @@ if t.TYPE_CHECKING:
 
 def boilerplateFromHtml(doc: t.SpecT, htmlString: str) -> t.NodesT:
     htmlString = doc.fixText(htmlString)
-    bp = h.E.div({}, h.parseHTML(htmlString))
+    bp = h.E.div({}, [copy.deepcopy(node) for node in parseBoilerplateFragment(htmlString, constants.htmlParser)])
     conditional.processConditionals(doc, bp)
     return h.childNodes(bp, clear=True)
 
 
+@functools.lru_cache(maxsize=256)
+def parseBoilerplateFragment(
+    htmlString: str,
+    htmlParser: str,  # pylint: disable=unused-argument
+) -> tuple[t.NodesT, ...]:
+    # Most boilerplate comes out the same for every spec in a group, even after its macros are filled in,
+    # so batch builds and watch mode only parse each distinct fragment once.
+    # The nodes are shared, so callers have to copy them before using them.
+    # (htmlParser is the current constants.htmlParser, which h.parseHTML() uses;
+    # it's only passed in so a fragment parsed by a different parser isn't reused.)
+    return tuple(h.parseHTML(htmlString))
+
+
 def loadBoilerplate(doc: t.SpecT, filename: str, bpname: str | None = None) -> None:
     if bpname is None:
         bpname = filename
@@ -82,8 +96,15 @@ def addSpecVersion(doc: t.SpecT) -> None:
     if "document-revision" not in doc.md.boilerplate:
         return
 
+    revision = getSpecRevision(doc)
+    if revision:
+        h.appendChild(doc.head, h.E.meta({"name": "document-revision", "content": revision}))
+
+
+def getSpecRevision(doc: t.SpecT) -> str | None:
+    # The VCS revision of the folder the spec is in, if there is one.
     if not doc.inputSource.hasDirectory():
-        return
+        return None
 
     revision = None
     source_dir = doc.inputSource.directory()
@@ -111,8 +132,7 @@ def addSpecVersion(doc: t.SpecT) -> None:
                 )
         except subprocess.CalledProcessError:
             pass
-    if revision:
-        h.appendChild(doc.head, h.E.meta({"name": "document-revision", "content": revision}))
+    return revision
 
 
 def addHeaderFooter(doc: t.SpecT) -> None:
@@ -0,0 +1,195 @@
+from __future__ import annotations
+
+import collections
+import functools
+import hashlib
+import os
+import stat
+import tempfile
+
+from . import config, messages as m, t
+
+# The storage shared by the build caches that keep one entry per block
+# (highlightcache and idlcache).
+#
+# Entries are always kept in memory for the life of the store
+# (so watch mode reuses them across rebuilds),
+# and with a cache folder, also on disk, one file per entry.
+# Reading an entry bumps its file's mtime,
+# and once the folder grows past its size limit,
+# the least-recently-used entries are deleted.
+#
+# The store itself only deals in bytes on disk;
+# each cache's decode() turns an entry's bytes into whatever it keeps in memory,
+# returning None if they're unusable, in which case the entry is treated as missing.
+#
+# A store holding entries that run code when they're loaded (like pickles)
+# has to be `private`: it then only reads from a folder, and files,
+# that belong to the current user and that no one else can write to,
+# since anyone who could write there could otherwise run code in the next build.
+
+
+class CacheStore:
+    def __init__(
+        self,
+        cacheDir: str | None,
+        name: str,
+        suffix: str,
+        decode: t.Callable[[bytes], t.Any],
+        maxDiskBytes: int,
+        maxMemoryEntries: int,
+        private: bool = False,
+    ) -> None:
+        # The folder the entries are stored in, if they're stored on disk at all.
+        self.cacheDir = cacheDir
+        # What's cached, for messages.
+        self.name = name
+        self.suffix = suffix
+        self.decode = decode
+        self.maxDiskBytes = maxDiskBytes
+        self.maxMemoryEntries = maxMemoryEntries
+        self.private = private
+        # Whether the folder's ownership and permissions have been checked yet.
+        self.checkedFolder = False
+        self.entries: collections.OrderedDict[str, t.Any] = collections.OrderedDict()
+        # Whether anything was written to disk since the last prune().
+        self.dirty = False
+
+    def get(self, key: str) -> t.Any:
+        value = self.entries.get(key)
+        if value is not None:
+            self.entries.move_to_end(key)
+            return value
+        data = self.loadEntry(key)
+        if data is None:
+            return None
+        value = self.decode(data)
+        if value is not None:
+            self.remember(key, value)
+        return value
+
+    def put(self, key: str, value: t.Any, data: bytes) -> None:
+        # Stores the value in memory, and its encoded form on disk.
+        self.remember(key, value)
+        self.saveEntry(key, data)
+
+    def forget(self, key: str) -> None:
+        self.entries.pop(key, None)
+
+    def remember(self, key: str, value: t.Any) -> None:
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxMemoryEntries:
+            self.entries.popitem(last=False)
+
+    def entryPath(self, key: str) -> str:
+        assert self.cacheDir is not None
+        return os.path.join(self.cacheDir, key + self.suffix)
+
+    def loadEntry(self, key: str) -> bytes | None:
+        if self.cacheDir is None or not self.folderIsUsable():
+            return None
+        path = self.entryPath(key)
+        try:
+            with open(path, "rb") as fh:
+                if self.private and not isPrivate(os.fstat(fh.fileno())):
+                    return None
+                data = fh.read()
+        except OSError:
+            return None
+        try:
+            # Mark it as recently used.
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def saveEntry(self, key: str, data: bytes) -> None:
+        if self.cacheDir is None or not self.folderIsUsable():
+            return
+        try:
+            os.makedirs(self.cacheDir, mode=0o700 if self.private else 0o777, exist_ok=True)
+            # Write to a temp file and swap it in,
+            # so a concurrent build never sees a half-written entry.
+            fd, tempPath = tempfile.mkstemp(dir=self.cacheDir, suffix=".tmp")
+            with open(fd, "wb") as fh:
+                fh.write(data)
+            os.replace(tempPath, self.entryPath(key))
+            self.dirty = True
+        except OSError as e:
+            m.say(f"Couldn't save the {self.name} to the cache in '{self.cacheDir}':\n{e}")
+            # Don't keep trying (and complaining) for every entry.
+            self.cacheDir = None
+
+    def folderIsUsable(self) -> bool:
+        if not self.private or self.checkedFolder:
+            return self.cacheDir is not None
+        self.checkedFolder = True
+        assert self.cacheDir is not None
+        try:
+            info = os.lstat(self.cacheDir)
+        except FileNotFoundError:
+            # saveEntry() will create it.
+            return True
+        except OSError:
+            info = None
+        if info is None or not stat.S_ISDIR(info.st_mode) or not isPrivate(info):
+            m.say(
+                f"Not using the {self.name} cache in '{self.cacheDir}', since it isn't a folder that only you can write to."
+            )
+            self.cacheDir = None
+            return False
+        return True
+
+    def prune(self) -> None:
+        # Deletes the least-recently-used entries until the folder is back under maxDiskBytes.
+        if self.cacheDir is None or not self.dirty:
+            return
+        self.dirty = False
+        try:
+            files = [
+                (entry.stat().st_mtime_ns, entry.stat().st_size, entry.path)
+                for entry in os.scandir(self.cacheDir)
+                if entry.name.endswith(self.suffix)
+            ]
+        except OSError:
+            return
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.maxDiskBytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+
+def isPrivate(info: os.stat_result) -> bool:
+    # Whether the file belongs to the current user, and no one else can write to it.
+    if not hasattr(os, "geteuid"):
+        # No Unix-style ownership to check (Windows).
+        return True
+    return info.st_uid == os.geteuid() and not info.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+
+
+@functools.lru_cache(maxsize=None)
+def codeFingerprint(packages: tuple[str, ...], filenames: tuple[str, ...]) -> str:
+    # A hash of the installed versions of the given packages,
+    # and the contents of the given Bikeshed source files,
+    # for keying entries on the code that produced them.
+    from importlib import metadata
+
+    hasher = hashlib.sha256()
+    for package in packages:
+        try:
+            hasher.update(f"{package} {metadata.version(package)}\n".encode("utf-8"))
+        except metadata.PackageNotFoundError:
+            pass
+    for filename in filenames:
+        try:
+            with open(config.scriptPath(filename), "rb") as fh:
+                hasher.update(fh.read())
+        except OSError:
+            pass
+    return hasher.hexdigest()
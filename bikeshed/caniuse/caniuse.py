@@ -146,10 +146,7 @@ def validateCanIUseURLs(doc: t.SpecT, canIUseData: CanIUseManager, elements: lis
 class CanIUseManager:
     def __init__(self, dataFile: t.DataFileRequester):
         self.dataFile = dataFile
-        data = json.loads(
-            self.dataFile.fetch("caniuse", "data.json", str=True),
-            object_pairs_hook=OrderedDict,
-        )
+        data = self.dataFile.fetchParsed("caniuse", "data.json", parser=loadOrderedJson)
         self.updated = data["updated"]
         self.agents = data["agents"]
         self.urlFromFeature = data["features"]
@@ -163,14 +160,15 @@ class CanIUseManager:
             return t.cast("t.JSONT", self.features[featureName])
         if not self.hasFeature(featureName):
             return {}
-        data = json.loads(
-            self.dataFile.fetch("caniuse", f"feature-{featureName}.json", str=True),
-            object_pairs_hook=OrderedDict,
-        )
+        data = self.dataFile.fetchParsed("caniuse", f"feature-{featureName}.json", parser=loadOrderedJson)
         self.features[featureName] = data
         return t.cast("t.JSONT", data)
 
 
+def loadOrderedJson(text: str) -> t.Any:
+    return json.loads(text, object_pairs_hook=OrderedDict)
+
+
 def getModuleFile(filename: str) -> str:
     with open(config.scriptPath("caniuse", filename), "r", encoding="utf-8") as fh:
         return fh.read()
@@ -4,7 +4,7 @@ import json
 import os
 import sys
 
-from . import config, constants, update, messages as m
+from . import config, constants, daemon, update, messages as m
 
 
 def main() -> None:
@@ -12,6 +12,11 @@ def main() -> None:
     if len(sys.argv) == 1:
         sys.argv.append("spec")
 
+    # If there's a daemon running, hand the command off to it instead.
+    exitCode = daemon.runThruDaemon(sys.argv[1:])
+    if exitCode is not None:
+        sys.exit(exitCode)
+
     try:
         with open(config.scriptPath("..", "semver.txt"), encoding="utf-8") as fh:
             semver = fh.read().strip()
@@ -84,6 +89,13 @@ def main() -> None:
         action="store_true",
         help="Allow some features to execute arbitrary code from outside the Bikeshed codebase.",
     )
+    argparser.add_argument(
+        "--html-parser",
+        dest="htmlParser",
+        choices=["html5lib", "html5-parser"],
+        default="html5lib",
+        help="Which HTML parser to use. 'html5-parser' is much faster, but needs the html5-parser package installed. Defaults to 'html5lib'.",
+    )
 
     subparsers = argparser.add_subparsers(title="Subcommands", dest="subparserName")
 
@@ -125,6 +137,34 @@ def main() -> None:
         action="store_true",
         help="Hacky support for outputting line numbers on all error messages. Disables output, as this is hacky and might mess up your source.",
     )
+    specParser.add_argument(
+        "--cache-dir",
+        dest="cacheDir",
+        default=None,
+        metavar="DIR",
+        help="Cache finished specs (and their syntax highlighting) in this folder, and reuse the cached output when nothing the spec depends on has changed.",
+    )
+    specParser.add_argument(
+        "--highlight-jobs",
+        dest="highlightJobs",
+        type=int,
+        default=1,
+        metavar="N",
+        help="Syntax-highlight code blocks in N processes at once. Defaults to 1.",
+    )
+    specParser.add_argument(
+        "--timings",
+        dest="timings",
+        default=None,
+        metavar="FILE",
+        help="Write a JSON report of how long each step of the build took to FILE (or stdout, with '-', if the spec isn't going there too).",
+    )
+    specParser.add_argument(
+        "--timings-memory",
+        dest="timingsMemory",
+        action="store_true",
+        help="Also record how much memory each step allocated in the --timings report. Slows the build down considerably.",
+    )
 
     echidnaParser = subparsers.add_parser(
         "echidna",
@@ -362,6 +402,22 @@ def main() -> None:
         action="store_true",
         help="Skip testing the real-world files in the repo, and only run the manually-written ones.",
     )
+    testParser.add_argument(
+        "-j",
+        "--jobs",
+        dest="jobs",
+        type=int,
+        default=1,
+        metavar="N",
+        help="Run N tests at once, in separate processes. Defaults to 1.",
+    )
+    testParser.add_argument(
+        "--fail-fast",
+        dest="failFast",
+        default=False,
+        action="store_true",
+        help="Stop at the first test that fails.",
+    )
     testParser.add_argument(
         "testFiles",
         default=[],
@@ -370,6 +426,56 @@ def main() -> None:
         help="Run these tests. If called with no args, tests everything.",
     )
 
+    benchParser = subparsers.add_parser(
+        "bench",
+        help="Time builds of Bikeshed's test specs (and/or your own), optionally comparing them against a saved baseline.",
+    )
+    benchParser.add_argument(
+        "testFiles",
+        default=[],
+        metavar="FILE",
+        nargs="*",
+        help="Time these tests. If called with no args (and no --dir), times everything.",
+    )
+    benchParser.add_argument(
+        "--dir",
+        dest="specDirs",
+        action="append",
+        default=[],
+        metavar="DIR",
+        help="Also time every .bs file in this folder. Can be given more than once.",
+    )
+    benchParser.add_argument(
+        "--runs",
+        dest="runs",
+        type=int,
+        default=5,
+        metavar="N",
+        help="How many times to build each spec. Defaults to 5.",
+    )
+    benchParser.add_argument(
+        "--baseline",
+        dest="baseline",
+        default=None,
+        metavar="FILE",
+        help="Compare the results against a baseline saved by --save, failing if any spec got slower.",
+    )
+    benchParser.add_argument(
+        "--save",
+        dest="save",
+        default=None,
+        metavar="FILE",
+        help="Save the results as JSON to FILE (or stdout, with '-'), to use as a later --baseline.",
+    )
+    benchParser.add_argument(
+        "--threshold",
+        dest="threshold",
+        type=float,
+        default=10,
+        metavar="PERCENT",
+        help="How much slower (in percent) a spec's median build time can get before it counts as a regression. Defaults to 10.",
+    )
+
     profileParser = subparsers.add_parser(
         "profile",
         help="Profiling Bikeshed. Needs graphviz, gprof2dot, and xdot installed.",
@@ -405,6 +511,52 @@ def main() -> None:
         help="Outputs a skeleton WPT file for you to start with.",
     )
 
+    batchParser = subparsers.add_parser(
+        "batch",
+        help="Process several spec source files at once, in parallel, printing a JSON summary of the results.",
+        epilog="Each spec is output next to its source file, like 'spec' does by default.",
+    )
+    batchParser.add_argument(
+        "infiles",
+        nargs="+",
+        metavar="FILE",
+        help="Paths to the source files. Globs (like 'specs/**/*.bs') are expanded.",
+    )
+    batchParser.add_argument(
+        "-j",
+        "--jobs",
+        dest="jobs",
+        type=int,
+        default=None,
+        help="Number of specs to build at once. Defaults to the number of CPUs.",
+    )
+    batchParser.add_argument(
+        "--summary",
+        dest="summary",
+        default=None,
+        metavar="FILE",
+        help="Write the JSON summary to this file, rather than to stdout.",
+    )
+    batchParser.add_argument(
+        "--cache-dir",
+        dest="cacheDir",
+        default=None,
+        metavar="DIR",
+        help="Cache finished specs in this folder, like 'spec --cache-dir'.",
+    )
+
+    daemonParser = subparsers.add_parser(
+        "daemon",
+        help="Keep Bikeshed and its data loaded in memory, running commands sent to it over a Unix socket.",
+        epilog=f"Set {daemon.ENV_VAR}=SOCKET to make the bikeshed command run thru the daemon.",
+    )
+    daemonParser.add_argument(
+        "--socket",
+        dest="socket",
+        default=None,
+        help="Path of the Unix socket to listen on. Defaults to bikeshed-UID.sock in the temp directory.",
+    )
+
     options, extras = argparser.parse_known_args()
 
     constants.quiet = options.quiet
@@ -422,6 +574,7 @@ def main() -> None:
         constants.printMode = options.printMode
     constants.chroot = not options.allowNonlocalFiles
     constants.executeCode = options.allowExecute
+    constants.htmlParser = options.htmlParser
 
     update.fixupDataFiles()
     if options.subparserName == "update":
@@ -444,12 +597,18 @@ def main() -> None:
         handleSource(options)
     elif options.subparserName == "test":
         handleTest(options, extras)
+    elif options.subparserName == "bench":
+        handleBench(options)
     elif options.subparserName == "profile":
         handleProfile(options)
     elif options.subparserName == "template":
         handleTemplate()
     elif options.subparserName == "wpt":
         handleWpt(options)
+    elif options.subparserName == "batch":
+        handleBatch(options, extras)
+    elif options.subparserName == "daemon":
+        handleDaemon(options)
 
 
 def handleUpdate(options: argparse.Namespace) -> None:
@@ -472,6 +631,11 @@ def handleSpec(options: argparse.Namespace, extras: list[str]) -> None:
     from . import metadata
     from .Spec import Spec
 
+    if options.timings == "-" and options.outfile == "-":
+        m.die(
+            "The spec is being written to stdout, so the --timings report can't be. Give --timings a filename instead."
+        )
+        return
     doc = Spec(
         inputFilename=options.infile,
         debug=options.debug,
@@ -479,10 +643,32 @@ def handleSpec(options: argparse.Namespace, extras: list[str]) -> None:
         lineNumbers=options.lineNumbers,
     )
     doc.mdCommandLine = metadata.fromCommandLine(extras)
+    doc.highlightJobs = options.highlightJobs
     if options.byos:
         doc.mdCommandLine.addData("Group", "byos")
-    doc.preprocess()
-    doc.finish(outputFilename=options.outfile)
+    if options.timings:
+        from . import timings
+
+        doc.timings = timings.Timings(traceMemory=options.timingsMemory)
+        doc.timings.start()
+    try:
+        cache = None
+        if options.cacheDir:
+            from . import outputcache
+            from .highlightcache import HighlightCache
+            from .idlcache import IDLCache
+
+            cache = outputcache.OutputCache(options.cacheDir)
+            if cache.replay(doc, options.outfile):
+                return
+            doc.highlightCache = HighlightCache(os.path.join(options.cacheDir, "highlight"))
+            doc.idlCache = IDLCache(os.path.join(options.cacheDir, "idl"))
+        doc.preprocess()
+        doc.finish(outputFilename=options.outfile, outputCache=cache)
+    finally:
+        if doc.timings is not None:
+            doc.timings.stop()
+            doc.timings.save(doc, options.timings)
 
 
 def handleEchidna(options: argparse.Namespace, extras: list[str]) -> None:
@@ -630,12 +816,32 @@ def handleTest(options: argparse.Namespace, extras: list[str]) -> None:
     constants.setErrorLevel("nothing")
     constants.quiet = 100
     if options.rebase:
-        test.rebase(options.testFiles, md=md)
+        test.rebase(options.testFiles, md=md, jobs=options.jobs)
     else:
-        result = test.runAllTests(options.testFiles, manualOnly=options.manualOnly, md=md)
+        result = test.runAllTests(
+            options.testFiles,
+            manualOnly=options.manualOnly,
+            md=md,
+            jobs=options.jobs,
+            failFast=options.failFast,
+        )
         sys.exit(0 if result else 1)
 
 
+def handleBench(options: argparse.Namespace) -> None:
+    from . import bench
+
+    result = bench.runBench(
+        options.testFiles,
+        specDirs=options.specDirs,
+        runs=options.runs,
+        baselineFilename=options.baseline,
+        saveFilename=options.save,
+        threshold=options.threshold,
+    )
+    sys.exit(0 if result else 1)
+
+
 def handleProfile(options: argparse.Namespace) -> None:
     root = f'--root="{options.root}"' if options.root else ""
     leaf = f'--leaf="{options.leaf}"' if options.leaf else ""
@@ -723,3 +929,20 @@ assert_equals(ACTUAL VALUE HERE, EXPECTED VALUE HERE, "TEST DESCRIPTION");
 </script>
 """
         )
+
+
+def handleBatch(options: argparse.Namespace, extras: list[str]) -> None:
+    from . import batch
+
+    if not batch.runBatch(
+        options.infiles,
+        jobs=options.jobs,
+        summaryFilename=options.summary,
+        extras=extras,
+        cacheDir=options.cacheDir,
+    ):
+        sys.exit(1)
+
+
+def handleDaemon(options: argparse.Namespace) -> None:
+    daemon.serve(main, socketPath=options.socket)
@@ -206,9 +206,13 @@ def flatten(arr: t.Iterable) -> t.Generator:
             yield el
 
 
+# The bikeshed/ folder. Resolving it costs a syscall per path segment,
+# and scriptPath() gets called a lot, so only do it once.
+_scriptFolder = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+
 def scriptPath(*pathSegs: str) -> str:
-    startPath = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
-    path = os.path.join(startPath, *pathSegs)
+    path = os.path.join(_scriptFolder, *pathSegs)
     return path
 
 
@@ -11,6 +11,8 @@ biblioDisplay: StringEnum = StringEnum("index", "inline", "direct")
 testAnnotationURL: str = "https://test.csswg.org/harness/annotate.js"
 chroot: bool = True
 executeCode: bool = False
+# Which backend h.parseHTML()/h.parseDocument() use; see h.htmlParsers.
+htmlParser: str = "html5lib"
 
 
 def errorLevelAt(target: str) -> bool:
@@ -0,0 +1,249 @@
+from __future__ import annotations
+
+import array
+import json
+import os
+import socket
+import sys
+import tempfile
+import traceback
+
+from . import messages as m, t
+
+# `bikeshed daemon` keeps Bikeshed and its read-only spec-data loaded in a long-lived process,
+# and runs commands sent to it over a Unix socket.
+#
+# Each request is handled in a fresh fork of the warmed-up daemon,
+# so it starts with all the code and data already in memory (shared copy-on-write),
+# but with completely fresh per-document state,
+# exactly as if it were its own `bikeshed` invocation.
+#
+# The client sends its argv, cwd, and environment as a line of JSON,
+# along with its stdin/stdout/stderr file descriptors,
+# so the forked child reads and writes the client's terminal directly.
+# The child answers with a line of JSON holding the exit code.
+#
+# Setting the BIKESHED_DAEMON environment variable to the daemon's socket path
+# makes the normal `bikeshed` command hand its work off to the daemon.
+
+ENV_VAR = "BIKESHED_DAEMON"
+
+# Long-running or interactive commands, which always run locally.
+localOnlyCommands = {"daemon", "watch", "serve"}
+
+
+def supported() -> bool:
+    return hasattr(socket, "AF_UNIX") and hasattr(socket, "SCM_RIGHTS") and hasattr(os, "fork")
+
+
+def defaultSocketPath() -> str:
+    return os.path.join(tempfile.gettempdir(), f"bikeshed-{os.getuid()}.sock")
+
+
+def subcommandName(argv: list[str]) -> str:
+    # Finds the subcommand without running the whole argparser.
+    # (--print and --die-on are the only global options that take a separate value.)
+    args = iter(argv)
+    for arg in args:
+        if arg in ("--print", "--die-on"):
+            next(args, None)
+        elif not arg.startswith("-"):
+            return arg
+    return "spec"
+
+
+def runThruDaemon(argv: list[str]) -> int | None:
+    """
+    If BIKESHED_DAEMON is set, runs the command in the daemon and returns its exit code.
+    Returns None if the command should just be run locally instead.
+    """
+    socketPath = os.environ.get(ENV_VAR)
+    if not socketPath or not supported():
+        return None
+    if subcommandName(argv) in localOnlyCommands:
+        return None
+    try:
+        fds = [sys.stdin.fileno(), sys.stdout.fileno(), sys.stderr.fileno()]
+    except (AttributeError, ValueError, OSError):
+        return None
+    request = {"argv": argv, "cwd": os.getcwd(), "env": dict(os.environ)}
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    with sock:
+        try:
+            sock.connect(socketPath)
+        except OSError as e:
+            m.warn(f"Couldn't reach the Bikeshed daemon at '{socketPath}', so running locally instead.\n{e}")
+            return None
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            sock.sendmsg(
+                [json.dumps(request).encode("utf-8") + b"\n"],
+                [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array("i", fds))],
+            )
+            with sock.makefile("rb") as fh:
+                response = json.loads(fh.readline() or b"{}")
+        except (OSError, ValueError) as e:
+            m.warn(f"Lost the connection to the Bikeshed daemon.\n{e}")
+            return 1
+    return int(response.get("exitCode", 1))
+
+
+def serve(main: t.Callable[[], None], socketPath: str | None = None) -> None:
+    # `main` is the command-line entry point each request runs (cli.main).
+    import signal
+    import socketserver
+
+    if not supported():
+        m.die("The Bikeshed daemon needs Unix domain sockets and fork(), which this platform doesn't have.")
+        return
+    if socketPath is None:
+        socketPath = defaultSocketPath()
+
+    if os.path.exists(socketPath):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+            try:
+                probe.connect(socketPath)
+            except OSError:
+                # Left over from a daemon that didn't shut down cleanly.
+                os.unlink(socketPath)
+            else:
+                m.die(f"There's already a Bikeshed daemon listening at '{socketPath}'.")
+                return
+
+    m.say("Loading spec-data...")
+    warmUp()
+
+    class Server(socketserver.ForkingMixIn, socketserver.UnixStreamServer):
+        pass
+
+    class RequestHandler(socketserver.BaseRequestHandler):
+        def handle(self) -> None:
+            # Runs in a forked child, which exits once this returns.
+            exitCode = runRequest(self.request, main)
+            try:
+                self.request.sendall(json.dumps({"exitCode": exitCode}).encode("utf-8") + b"\n")
+            except OSError:
+                pass
+
+    # Requests run with the client's fds and permissions,
+    # so only this user can ever be allowed to connect:
+    # the socket has to be created owner-only, not chmodded after bind().
+    oldUmask = os.umask(0o077)
+    try:
+        server = Server(socketPath, RequestHandler)
+    finally:
+        os.umask(oldUmask)
+    with server:
+        os.chmod(socketPath, 0o600)
+        m.success(
+            f"Bikeshed daemon listening at '{socketPath}'.\nRun commands thru it by setting {ENV_VAR}={socketPath}"
+        )
+        # Shut down cleanly (removing the socket) on SIGTERM as well as Ctrl-C.
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.unlink(socketPath)
+
+
+def warmUp(dataFile: t.DataFileRequester | None = None) -> None:
+    # Import everything a build uses and parse the read-only data files,
+    # so that every forked child starts with them in memory.
+    from . import retrieve, Spec  # noqa: F401 pylint: disable=unused-import
+    from .caniuse import caniuse
+    from .mdn import mdnspeclinks
+    from .refs import anchorindex, biblioindex
+
+    if dataFile is None:
+        dataFile = retrieve.defaultRequester
+    for filename in (
+        "specs.json",
+        "methods.json",
+        "fors.json",
+        "biblio-keys.json",
+        "biblio-numeric-suffixes.json",
+        "test-suites.json",
+        "languages.json",
+    ):
+        tryParse(dataFile, filename)
+    tryParse(dataFile, "link-defaults.infotree", parser=str)
+    tryParse(dataFile, "wpt-tests.txt", parser=str)
+    for filename in dataFile.walkFiles("caniuse"):
+        tryParse(dataFile, "caniuse", filename, parser=caniuse.loadOrderedJson)
+    for filename in dataFile.walkFiles("mdn"):
+        tryParse(dataFile, "mdn", filename, parser=mdnspeclinks.loadOrderedJson)
+    anchorindex.openAnchorIndex(dataFile)
+    biblioindex.openBiblioIndex(dataFile)
+    m.resetSeenMessages()
+
+
+def tryParse(dataFile: t.DataFileRequester, *segs: str, parser: t.Callable[[str], t.Any] = json.loads) -> None:
+    try:
+        dataFile.fetchParsed(*segs, parser=parser)
+    except (OSError, ValueError) as e:
+        m.warn(f"Couldn't preload {'/'.join(segs)}; it'll be loaded on each request instead.\n{e}")
+
+
+def runRequest(sock: socket.socket, main: t.Callable[[], None]) -> int:
+    try:
+        request, fds = receiveRequest(sock)
+    except (OSError, ValueError) as e:
+        m.warn(f"Received a malformed request.\n{e}")
+        return 1
+
+    # Take over the client's stdin/stdout/stderr.
+    for target, fd in enumerate(fds[:3]):
+        os.dup2(fd, target)
+    for fd in fds:
+        if fd > 2:
+            os.close(fd)
+    sys.stdin = open(0, encoding="utf-8", closefd=False)  # pylint: disable=consider-using-with
+    sys.stdout = open(1, "w", encoding="utf-8", closefd=False)  # pylint: disable=consider-using-with
+    sys.stderr = open(2, "w", encoding="utf-8", closefd=False)  # pylint: disable=consider-using-with
+
+    os.chdir(request["cwd"])
+    os.environ.clear()
+    os.environ.update(request["env"])
+    # Don't let the child try to hand the command back to the daemon.
+    os.environ.pop(ENV_VAR, None)
+    sys.argv = [sys.argv[0], *request["argv"]]
+
+    exitCode: int
+    try:
+        main()
+        exitCode = 0
+    except SystemExit as e:
+        if e.code is None:
+            exitCode = 0
+        elif isinstance(e.code, int):
+            exitCode = e.code
+        else:
+            print(e.code, file=sys.stderr)
+            exitCode = 1
+    except Exception:  # pylint: disable=broad-except
+        traceback.print_exc()
+        exitCode = 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+    return exitCode
+
+
+def receiveRequest(sock: socket.socket) -> tuple[dict[str, t.Any], list[int]]:
+    fds = array.array("i")
+    data, ancdata, _, _ = sock.recvmsg(65536, socket.CMSG_SPACE(3 * fds.itemsize))
+    for level, kind, payload in ancdata:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            fds.frombytes(payload[: len(payload) - (len(payload) % fds.itemsize)])
+    chunks = [data]
+    while data and not data.endswith(b"\n"):
+        data = sock.recv(65536)
+        chunks.append(data)
+    if len(fds) != 3:
+        for fd in fds:
+            os.close(fd)
+        raise ValueError(f"Expected 3 file descriptors, got {len(fds)}.")
+    return json.loads(b"".join(chunks)), list(fds)
@@ -654,9 +654,7 @@ def transformRailroad(lines: list[str], tagName: str, firstLine: str, lineNum: i
 def transformBiblio(lines: list[str], tagName: str, firstLine: str, lineNum: int | None, doc: t.SpecT) -> list[str]:
     storage: t.BiblioStorageT = defaultdict(list)
     biblio.processSpecrefBiblioFile("".join(lines), storage, order=1)
-    for k, vs in storage.items():
-        doc.refs.biblioKeys.add(k)
-        doc.refs.biblios[k].extend(vs)
+    doc.refs.addLocalBiblios(storage)
     return []
 
 
@@ -750,6 +748,7 @@ def processAnchors(anchors: InfoTreeT, doc: t.SpecT, lineNum: int | None = None)
         methodishStart = re.match(r"([^(]+\()[^)]", anchor["text"][0])
         if methodishStart:
             doc.refs.anchorBlockRefs.addMethodVariants(anchor["text"][0], anchor.get("for", []), doc.md.shortname)
+    doc.refs.refCache.clear()
 
 
 def transformLinkDefaults(
@@ -820,6 +819,7 @@ def processIgnoredSpecs(specs: InfoTreeT, doc: t.SpecT, lineNum: int | None = No
                 doc.refs.replacedSpecs.add((specName, replacedBy))
             else:
                 doc.refs.ignoredSpecs.add(specName)
+    doc.refs.refCache.clear()
 
 
 def transformInfo(lines: list[str], tagName: str, firstLine: str, lineNum: int | None, doc: t.SpecT) -> list[str]:
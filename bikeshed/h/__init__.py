@@ -1,5 +1,6 @@
 from .dom import (
     E,
+    ElementIndex,
     addClass,
     addOldIDs,
     appendChild,
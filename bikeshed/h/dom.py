@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import collections.abc
+import functools
 import hashlib
 import re
 
@@ -11,11 +12,15 @@ from lxml import etree
 from lxml.cssselect import CSSSelector
 from lxml.html import tostring
 
-from .. import t
+from .. import constants, t
 from ..messages import die, warn
 
 if t.TYPE_CHECKING:
     ElementPredT: t.TypeAlias = t.Callable[[t.ElementT], bool]
+    # A simple selector, as a list of tests that must all pass, like
+    # (("tag", "a", None), ("notAttr", "href", None)) for "a:not([href])"
+    SimpleSelectorT: t.TypeAlias = tuple[tuple[str, str, str | None], ...]
+    IndexKeyT: t.TypeAlias = tuple[str, str]
 
 
 def flatten(arr: t.Iterable) -> t.Iterator:
@@ -34,13 +39,25 @@ def unescape(string: str) -> str:
 
 def findAll(sel: str, context: t.SpecT | t.ElementT | t.DocumentT) -> list[t.ElementT]:
     context = t.cast("t.ElementT", getattr(context, "document", context))
+    for index in ElementIndex.active:
+        if index.covers(context):
+            result = index.findAll(sel)
+            if result is not None:
+                return result
     try:
-        return t.cast("list[t.ElementT]", CSSSelector(sel, namespaces={"svg": "http://www.w3.org/2000/svg"})(context))
+        return t.cast("list[t.ElementT]", compiledSelector(sel)(context))
     except Exception as e:
         die(f"The selector '{sel}' returned an error:\n{e}")
         return []
 
 
+@functools.lru_cache(maxsize=512)
+def compiledSelector(sel: str) -> CSSSelector:
+    # Most selectors get used over and over during a build,
+    # and compiling them to XPath isn't free.
+    return CSSSelector(sel, namespaces={"svg": "http://www.w3.org/2000/svg"})
+
+
 def find(sel: str, context: t.SpecT | t.ElementT | t.DocumentT) -> t.ElementT | None:
     result = findAll(sel, context)
     if result:
@@ -49,6 +66,195 @@ def find(sel: str, context: t.SpecT | t.ElementT | t.DocumentT) -> t.ElementT |
         return None
 
 
+class ElementIndex:
+    """
+    A single-pass index of a tree's elements by tag, id, class, and attribute name,
+    so simple selectors (like "dfn", "[data-dfn-type]", "a:not([href])", or "[id='foo']")
+    don't have to walk the whole tree every time they're run.
+
+    While one is active (`with h.ElementIndex(doc):`),
+    findAll()/find() over that tree are answered from it
+    whenever the selector is simple enough, and fall back to a normal search otherwise.
+    The h insertion helpers (appendChild(), insertBefore(), etc) and addClass()
+    keep active indexes up to date,
+    and removed elements or removed attributes are filtered out when queried,
+    but an element that *gains* a tag, id, class, or attribute some other way
+    (like a direct el.set()) won't be found,
+    so only keep an index active over code that sticks to the h helpers.
+    """
+
+    active: list[ElementIndex] = []
+
+    def __init__(self, context: t.SpecT | t.ElementT | t.DocumentT) -> None:
+        context = getattr(context, "document", context)
+        if isinstance(context, etree._ElementTree):  # pylint: disable=protected-access
+            context = context.getroot()
+        self.root: t.ElementT = t.cast("t.ElementT", context)
+        self.elements: dict[IndexKeyT, list[t.ElementT]] = collections.defaultdict(list)
+        # Which keys each element has been filed under.
+        self.keysOf: dict[t.ElementT, set[IndexKeyT]] = {}
+        # Keys whose elements might no longer be in document order.
+        self.unsorted: set[IndexKeyT] = set()
+        for el in self.root.iter(etree.Element):
+            self.keysOf[el] = keys = indexKeys(el)
+            for key in keys:
+                self.elements[key].append(el)
+
+    def __enter__(self) -> ElementIndex:
+        ElementIndex.active.append(self)
+        return self
+
+    def __exit__(self, *args: t.Any) -> None:
+        ElementIndex.active.remove(self)
+
+    def covers(self, context: t.ElementT | t.DocumentT) -> bool:
+        if isinstance(context, etree._ElementTree):  # pylint: disable=protected-access
+            return context.getroot() is self.root
+        return context is self.root
+
+    def addInserted(self, el: t.ElementT) -> None:
+        # Files a newly-inserted (or moved) element and its descendants.
+        for child in el.iter(etree.Element):
+            self.addChanged(child)
+            # Either appended out of order, or moved.
+            self.unsorted |= self.keysOf[child]
+
+    def addChanged(self, el: t.ElementT) -> None:
+        # Files an element under any keys it's gained.
+        oldKeys = self.keysOf.setdefault(el, set())
+        newKeys = indexKeys(el) - oldKeys
+        for key in newKeys:
+            self.elements[key].append(el)
+        oldKeys |= newKeys
+        self.unsorted |= newKeys
+
+    def findAll(self, sel: str) -> list[t.ElementT] | None:
+        # Returns None if the selector is too complex for the index.
+        selector = parseSimpleSelector(sel)
+        if selector is None:
+            return None
+        key = bestIndexKey(selector)
+        if key is None:
+            return None
+        if key in self.unsorted:
+            positions = {el: i for i, el in enumerate(self.root.iter(etree.Element))}
+            self.elements[key] = sorted((el for el in self.elements[key] if el in positions), key=positions.__getitem__)
+            self.unsorted.discard(key)
+        return [el for el in self.elements[key] if matchesSimpleSelector(el, selector) and self.isAttached(el)]
+
+    def isAttached(self, el: t.ElementT) -> bool:
+        while True:
+            parent = el.getparent()
+            if parent is None:
+                return el is self.root
+            el = parent
+
+
+def noteInserted(el: t.ElementT) -> None:
+    for index in ElementIndex.active:
+        index.addInserted(el)
+
+
+def noteChanged(el: t.ElementT) -> None:
+    for index in ElementIndex.active:
+        index.addChanged(el)
+
+
+def indexKeys(el: t.ElementT) -> set[IndexKeyT]:
+    keys: set[IndexKeyT] = {("tag", el.tag)}
+    for name, value in el.attrib.items():
+        keys.add(("attr", name))
+        if name == "id":
+            keys.add(("id", value))
+        elif name == "class":
+            keys.update(("class", cls) for cls in classNames(value))
+    return keys
+
+
+def classNames(classAttr: str) -> list[str]:
+    # The same whitespace that the class selector's normalize-space() uses.
+    return [cls for cls in re.split(r"[ \t\r\n]+", classAttr) if cls]
+
+
+_selectorPart = re.compile(
+    r"""
+    (?P<tag>[a-zA-Z][\w-]*)
+    |\#(?P<id>-?[_a-zA-Z][\w-]*)
+    |\.(?P<class>-?[_a-zA-Z][\w-]*)
+    |\[(?P<attr>[_a-zA-Z][\w-]*)
+        (?:=(?:'(?P<single>[^'\\]*)'|"(?P<double>[^"\\]*)"|(?P<bare>-?[_a-zA-Z][\w-]*)))?\]
+    |:not\(\[(?P<notAttr>[_a-zA-Z][\w-]*)\]\)
+    """,
+    re.X,
+)
+
+
+@functools.lru_cache(maxsize=512)
+def parseSimpleSelector(sel: str) -> SimpleSelectorT | None:
+    # Parses a single compound selector made of a tag name, #ids, .classes,
+    # [attr], [attr=value], and :not([attr]); anything else returns None.
+    sel = sel.strip()
+    tests: list[tuple[str, str, str | None]] = []
+    pos = 0
+    while pos < len(sel):
+        match = _selectorPart.match(sel, pos)
+        if match is None or (match["tag"] and pos != 0):
+            return None
+        pos = match.end()
+        if match["tag"]:
+            tests.append(("tag", match["tag"], None))
+        elif match["id"]:
+            tests.append(("attrValue", "id", match["id"]))
+        elif match["class"]:
+            tests.append(("class", match["class"], None))
+        elif match["attr"]:
+            value = next((v for v in (match["single"], match["double"], match["bare"]) if v is not None), None)
+            if value is None:
+                tests.append(("attr", match["attr"], None))
+            else:
+                tests.append(("attrValue", match["attr"], value))
+        else:
+            tests.append(("notAttr", match["notAttr"], None))
+    return tuple(tests) or None
+
+
+def bestIndexKey(selector: SimpleSelectorT) -> IndexKeyT | None:
+    # The key that probably has the fewest elements filed under it.
+    rankedKeys = []
+    for kind, name, value in selector:
+        if kind == "attrValue" and name == "id":
+            rankedKeys.append((0, ("id", t.cast(str, value))))
+        elif kind == "class":
+            rankedKeys.append((1, ("class", name)))
+        elif kind in ("attr", "attrValue"):
+            rankedKeys.append((2, ("attr", name)))
+        elif kind == "tag":
+            rankedKeys.append((3, ("tag", name)))
+    if not rankedKeys:
+        return None
+    return min(rankedKeys)[1]
+
+
+def matchesSimpleSelector(el: t.ElementT, selector: SimpleSelectorT) -> bool:
+    for kind, name, value in selector:
+        if kind == "tag":
+            if el.tag != name:
+                return False
+        elif kind == "attr":
+            if el.get(name) is None:
+                return False
+        elif kind == "attrValue":
+            if el.get(name) != value:
+                return False
+        elif kind == "class":
+            if name not in classNames(el.get("class") or ""):
+                return False
+        elif kind == "notAttr":
+            if el.get(name) is not None:
+                return False
+    return True
+
+
 def escapeCSSIdent(val: str) -> str:
     if len(val) == 0:
         die("Programming error: can't escape an empty ident.")
@@ -180,7 +386,7 @@ def foldWhitespace(text: str) -> str:
 
 
 def parseHTML(text: str) -> list[t.ElementT]:
-    doc = html5lib.parse(text, treebuilder="lxml", namespaceHTMLElements=False)
+    doc = parseDocument(text)
     head = doc.getroot()[0]
     body = doc.getroot()[1]
     if len(body) > 0 or body.text is not None:
@@ -198,10 +404,317 @@ def parseHTML(text: str) -> list[t.ElementT]:
 
 
 def parseDocument(text: str) -> t.DocumentT:
+    parser = htmlParsers.get(constants.htmlParser, parseWithHtml5lib)
+    return parser(text)
+
+
+def parseWithHtml5lib(text: str) -> t.DocumentT:
     doc = html5lib.parse(text, treebuilder="lxml", namespaceHTMLElements=False)
     return t.cast("t.DocumentT", doc)
 
 
+def parseWithHtml5Parser(text: str) -> t.DocumentT:
+    # html5-parser is a C port of Gumbo that builds the lxml tree directly,
+    # many times faster than html5lib's pure-Python tokenizer.
+    # It's optional, so fall back to html5lib if it's not installed.
+    try:
+        import html5_parser
+    except ImportError:
+        warn(
+            "The 'html5-parser' HTML parser was requested, but the html5-parser package isn't installed, so html5lib was used instead. Run `pip install html5-parser` to install it."
+        )
+        constants.htmlParser = "html5lib"
+        return parseWithHtml5lib(text)
+    # The fix-ups below use a private-use character as a placeholder,
+    # so leave the rare text that already has one to html5lib.
+    if _privateChar in text:
+        return parseWithHtml5lib(text)
+    originalText = text
+    # html5-parser turns xmlns attributes into namespace declarations, losing them,
+    # while html5lib keeps them as attributes,
+    # so hide them from it behind a placeholder name, and put them back afterwards.
+    hidXmlns = "xmlns" in text
+    if hidXmlns:
+        text = text.replace("xmlns", _xmlnsPlaceholder)
+    # html5lib turns form feeds in text into spaces (and can't handle them anywhere else),
+    # so do that up front, leaving only form feeds from character references to fix afterwards.
+    text = text.replace("\x0c", " ")
+    fixFormFeeds = _formFeedRef.search(text) is not None
+    markedText = markUnknownEndTags(text)
+    if markedText is None:
+        return parseWithHtml5lib(originalText)
+    # Parse with namespaces, so SVG and MathML elements get theirs, like with html5lib,
+    # and then take the HTML namespace back off everything else.
+    # (Always hand it utf-8 bytes; it sniffs the encoding of anything else, like an empty string.)
+    root = html5_parser.parse(
+        markedText.encode("utf-8"),
+        transport_encoding="utf-8",
+        treebuilder="lxml",
+        namespace_elements=True,
+        sanitize_names=False,
+    )
+    if markedText is not text and not removeEndTagMarkers(root):
+        return parseWithHtml5lib(originalText)
+    matchHtml5libTree(root, hidXmlns=hidXmlns, fixFormFeeds=fixFormFeeds)
+    return t.cast("t.DocumentT", root.getroottree())
+
+
+_xhtmlNS = "{http://www.w3.org/1999/xhtml}"
+_simpleXmlName = re.compile(r"[A-Za-z_][A-Za-z0-9_.-]*$")
+# A private-use character, so it's never going to be in a real spec.
+_privateChar = "\uf8ff"
+_xmlnsPlaceholder = _privateChar + "xmlns"
+_formFeedRef = re.compile(r"&#(0*12|[xX]0*[cC])\b")
+
+# Every tag html5-parser knows by name.
+# It treats all the *other* tags as the same tag,
+# so an end tag for one unknown element will close whatever unknown element is open,
+# rather than being ignored like html5lib (and the HTML spec) would.
+_gumboKnownTags = frozenset(
+    """
+    a abbr acronym address annotation-xml applet area article aside audio b base basefont bdi bdo bgsound big
+    blink blockquote body br button canvas caption center cite code col colgroup data datalist dd del desc
+    details dfn dialog dir div dl dt em embed fieldset figcaption figure font footer foreignobject form frame
+    frameset h1 h2 h3 h4 h5 h6 head header hgroup hr html i iframe image img input ins isindex kbd keygen label
+    legend li link listing main malignmark map mark marquee math menu menuitem meta meter mglyph mi mn mo ms
+    mtext multicol nav nextid nobr noembed noframes noscript object ol optgroup option output p param plaintext
+    pre progress q rb rp rt rtc ruby s samp script section select small source spacer span strike strong style
+    sub summary sup svg table tbody td template textarea tfoot th thead time title tr track tt u ul var video wbr
+    xmp
+    """.split()
+)
+# Just enough of the HTML tokenizer to find the real end tags,
+# skipping over comments, attribute values, and the contents of raw-text elements.
+_markupTokenRe = re.compile(
+    r"""
+    <!--(?:-?>|.*?--!?>|.*)
+    | <[!?][^>]*>?
+    | </(?![A-Za-z])[^>]*>?
+    | <(?P<rawTextTag>script|style|xmp|iframe|noembed|noframes|textarea|title)(?=[\t\n\f\r\ />])
+        (?:[^>"']+|"[^"]*"|'[^']*')*>?
+        (?P<rawText>.*?)(?:</(?P=rawTextTag)(?=[\t\n\f\r\ />])|\Z)
+    | <plaintext(?=[\t\n\f\r\ />]).*
+    | <(?P<startTag>[A-Za-z][^\t\n\f\r\ />]*)(?:[^>"']+|"[^"]*"|'[^']*')*>?
+    | </(?P<endTag>[A-Za-z][^\t\n\f\r\ />]*)[^>]*>
+    """,
+    re.DOTALL | re.IGNORECASE | re.VERBOSE,
+)
+
+
+def markUnknownEndTags(text: str) -> str | None:
+    # Puts a marker comment right after every end tag for an element html5-parser doesn't know,
+    # naming the element it should close.
+    # A comment goes into the current element,
+    # so if the end tag closed the right element, the marker lands right after it;
+    # removeEndTagMarkers() then checks that, and takes them back out.
+    # Returns None if the text can't be marked reliably.
+    if "<![CDATA[" in text:
+        return None
+    # How many <svg>/<math> elements are open, roughly.
+    foreignDepth = 0
+    # Where the last <pre>/<listing> start tag ended.
+    newlineEaterEnd = -1
+    pieces = []
+    lastEnd = 0
+    for match in _markupTokenRe.finditer(text):
+        rawText = match.group("rawText")
+        if rawText is not None:
+            # Script escapes can make a raw-text element end somewhere else,
+            # and in SVG and MathML, <script>/<style>/<title> aren't raw text at all,
+            # so give up if there might be tags hiding in there.
+            if "<!--" in rawText or (foreignDepth and re.search(r"</?[A-Za-z]", rawText)):
+                return None
+            continue
+        startName = match.group("startTag")
+        if startName is not None:
+            if startName.lower() in ("svg", "math") and not match.group().endswith("/>"):
+                foreignDepth += 1
+            elif startName.lower() in ("pre", "listing"):
+                newlineEaterEnd = match.end()
+            continue
+        name = match.group("endTag")
+        if name is None:
+            continue
+        if match.start() == newlineEaterEnd:
+            # html5lib still drops the newline starting a <pre>
+            # when an ignored end tag comes between them, but html5-parser doesn't.
+            return None
+        name = name.lower()
+        if name in ("svg", "math"):
+            foreignDepth = max(0, foreignDepth - 1)
+        if name in _gumboKnownTags:
+            continue
+        if not name.isascii():
+            # Only ASCII gets lowercased in tag names.
+            return None
+        pieces.append(text[lastEnd : match.end()])
+        pieces.append(f"<!--{_privateChar}{name}-->")
+        lastEnd = match.end()
+    if not pieces:
+        return text
+    pieces.append(text[lastEnd:])
+    return "".join(pieces)
+
+
+def removeEndTagMarkers(root: t.ElementT) -> bool:
+    # Removes the markers left by markUnknownEndTags(),
+    # returning False if any of them show that an end tag closed the wrong element
+    # (or was ignored, which html5lib might have handled differently).
+    import itertools
+
+    for node in itertools.chain(root.itersiblings(preceding=True), root.itersiblings()):
+        if node.tag is etree.Comment and (node.text or "").startswith(_privateChar):
+            return False
+    for marker in root.xpath("//comment()[starts-with(., $c)]", c=_privateChar):
+        prev = marker.getprevious()
+        # (SVG elements get their names' case fixed, like "clipPath", but their end tags don't.)
+        if prev is None or not isinstance(prev.tag, str) or prev.tag.rpartition("}")[2].lower() != marker.text[1:]:
+            return False
+        # The marker went in before any text following the end tag,
+        # so move that back to where it would have been.
+        if marker.tail:
+            prev.tail = (prev.tail or "") + marker.tail
+        marker.getparent().remove(marker)
+    return True
+
+
+def matchHtml5libTree(root: t.ElementT, hidXmlns: bool, fixFormFeeds: bool) -> None:
+    # Fixes up a tree parsed by html5-parser to be exactly what html5lib would have built:
+    # HTML elements aren't namespaced,
+    # names that aren't valid in XML (like "@click" or "foo:bar") are escaped the same way html5lib does,
+    # comments (and, if fixFormFeeds, text) get the same XML-compatibility tweaks,
+    # and if hidXmlns, every "xmlns" hidden behind _xmlnsPlaceholder is restored.
+    import itertools
+
+    from html5lib import _ihatexml
+    from html5lib.constants import adjustForeignAttributes
+
+    infosetFilter = _ihatexml.InfosetFilter(preventDoubleDashComments=True)
+
+    def unhide(text: str) -> str:
+        if hidXmlns and _privateChar in text:
+            return text.replace(_xmlnsPlaceholder, "xmlns")
+        return text
+
+    def fixName(name: str, coerce: t.Callable[[str], str]) -> str:
+        if _simpleXmlName.match(name):
+            return name
+        return coerce(unhide(name))
+
+    def fixAttrName(el: t.ElementT, name: str) -> str:
+        if name.startswith("{"):
+            return name
+        if hidXmlns and el.tag.startswith("{"):
+            # On SVG and MathML elements, the xmlns attributes get put in the xmlns namespace.
+            foreignAttr = adjustForeignAttributes.get(unhide(name))
+            if foreignAttr is not None:
+                _, localName, ns = foreignAttr
+                return f"{{{ns}}}{localName}"
+        return fixName(name, infosetFilter.coerceAttribute)
+
+    def fixText(text: str) -> str:
+        text = unhide(text)
+        if "\x0c" in text:
+            text = infosetFilter.coerceCharacters(text)
+        return text
+
+    def fixAttrs(el: t.ElementT) -> None:
+        # Renaming an attribute would move it to the end,
+        # so rebuild them all, to keep their order.
+        attrs = el.items()
+        el.attrib.clear()
+        for name, value in attrs:
+            el.set(fixAttrName(el, name), value)
+
+    # Lots of elements share tags and attribute names,
+    # so only work out whether each one needs fixing once.
+    newTags: dict[str, str] = {}
+    okAttrNames: set[str] = set()
+    for el in root.iter(etree.Element):
+        tag = el.tag
+        newTag = newTags.get(tag)
+        if newTag is None:
+            if tag.startswith(_xhtmlNS):
+                newTag = fixName(tag[len(_xhtmlNS) :].translate(_asciiLowercase), infosetFilter.coerceElement)
+            else:
+                newTag = unhide(fixForeignTagCase(tag))
+            newTags[tag] = newTag
+        if newTag != tag:
+            el.tag = newTag
+        for name in el.keys():
+            if name not in okAttrNames:
+                if name.startswith("{") or _simpleXmlName.match(name):
+                    okAttrNames.add(name)
+                else:
+                    fixAttrs(el)
+                    break
+
+    outsideRoot = [*root.itersiblings(preceding=True), *root.itersiblings()]
+    for node in itertools.chain(outsideRoot, root.iter(etree.Comment)):
+        if node.tag is etree.Comment and node.text:
+            node.text = infosetFilter.coerceComment(unhide(node.text))
+
+    if fixFormFeeds:
+        for node in itertools.chain(outsideRoot, root.iter()):
+            if node.text:
+                node.text = fixText(node.text)
+            if node.tail:
+                node.tail = fixText(node.tail)
+    elif hidXmlns:
+        # Only a few text nodes will have an xmlns in them, if any,
+        # so find them with XPath rather than looking at every one.
+        for text in root.xpath("//text()[contains(., $c)]", c=_privateChar):
+            parent = text.getparent()
+            if text.is_tail:
+                parent.tail = fixText(parent.tail)
+            else:
+                parent.text = fixText(parent.text)
+        for node in outsideRoot:
+            if node.tail:
+                node.tail = fixText(node.tail)
+    if hidXmlns:
+        for attr in root.xpath("//@*[contains(., $c)]", c=_privateChar):
+            attr.getparent().set(attr.attrname, unhide(attr))
+
+    # Drop the now-unused namespace declarations.
+    etree.cleanup_namespaces(root)
+
+
+def fixForeignTagCase(tag: str) -> str:
+    # html5-parser keeps the case of tags it doesn't know,
+    # but html5lib lowercases every tag, then fixes the case of the SVG tags that have some.
+    ns, _, localName = tag[1:].partition("}")
+    lowerName = localName.translate(_asciiLowercase)
+    if lowerName == localName:
+        return tag
+    if ns == _svgNS:
+        lowerName = _svgTagsWithCase.get(lowerName, lowerName)
+    return f"{{{ns}}}{lowerName}"
+
+
+_asciiLowercase = str.maketrans("ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz")
+_svgNS = "http://www.w3.org/2000/svg"
+_svgTagsWithCase = {
+    name.lower(): name
+    for name in """
+    altGlyph altGlyphDef altGlyphItem animateColor animateMotion animateTransform clipPath feBlend feColorMatrix
+    feComponentTransfer feComposite feConvolveMatrix feDiffuseLighting feDisplacementMap feDistantLight feFlood
+    feFuncA feFuncB feFuncG feFuncR feGaussianBlur feImage feMerge feMergeNode feMorphology feOffset fePointLight
+    feSpecularLighting feSpotLight feTile feTurbulence foreignObject glyphRef linearGradient radialGradient textPath
+    """.split()
+}
+
+
+# The available backends for parseHTML()/parseDocument(),
+# chosen by constants.htmlParser.
+# They all must produce the same tree shape as html5lib:
+# no namespaces, and always an <html> with a <head> and <body>.
+htmlParsers: dict[str, t.Callable[[str], t.DocumentT]] = {
+    "html5lib": parseWithHtml5lib,
+    "html5-parser": parseWithHtml5Parser,
+}
+
+
 def escapeHTML(text: str) -> str:
     # Escape HTML
     return text.replace("&", "&amp;").replace("<", "&lt;")
@@ -270,6 +783,7 @@ def appendChild(parent: t.ElementT, *els: t.NodesT, allowEmpty: bool = False) ->
                 # when the parent already has children; the last child's tail
                 # doesn't get moved into the appended child or anything.
                 parent.append(child)
+            noteInserted(child)
     if child is None and not allowEmpty:
         raise Exception("Empty child list appended without allowEmpty=True")
     if isElement(child):
@@ -289,6 +803,7 @@ def prependChild(parent: t.ElementT, *children: t.NodesT) -> None:
         else:
             removeNode(child)
             parent.insert(0, child)
+            noteInserted(child)
             if parent.text is not None:
                 child.tail = (child.tail or "") + parent.text
                 parent.text = None
@@ -307,6 +822,7 @@ def insertBefore(target: t.ElementT, *els: t.NodesT) -> t.ElementT:
                 parent.text = (parent.text or "") + el
         else:
             parent.insert(index, el)
+            noteInserted(el)
             index += 1
             prevSibling = el
     return target
@@ -320,6 +836,7 @@ def insertAfter(target: t.ElementT, *els: t.NodesT) -> t.ElementT:
             target.tail = (target.tail or "") + el
         else:
             parent.insert(parent.index(target) + 1, el)
+            noteInserted(el)
             target = el
     return target
 
@@ -616,6 +1133,7 @@ def addClass(doc: t.SpecT, el: t.ElementT, cls: str) -> t.ElementT:
         pass
     else:
         el.set("class", "{} {}".format(el.get("class"), cls))
+    noteChanged(el)
     return el
 
 
@@ -863,16 +1381,26 @@ def addOldIDs(els: t.Iterable[t.ElementT]) -> None:
         removeAttr(el, "oldids")
 
 
+_allIDValues = etree.XPath("//*/@id", smart_strings=False)
+# These results know which element they came from.
+_allIDAttrs = etree.XPath("//*/@id")
+
+
 def dedupIDs(doc: t.SpecT) -> None:
     import itertools as iter
 
-    ids: OrderedDict[str, list[t.ElementT]] = OrderedDict()
-    for el in findAll("[id]", doc):
-        ids.setdefault(t.cast(str, el.get("id")), []).append(el)
-    for dupeId, els in list(ids.items()):
-        if len(els) < 2:
-            # Only one instance, so nothing to do.
-            continue
+    # Pulling just the id values out (rather than the elements) keeps the
+    # whole-document scan inside lxml, and usually shows there's nothing to do.
+    idValues = t.cast("list[str]", _allIDValues(doc.document))
+    ids: set[str] = set(idValues)
+    if len(ids) == len(idValues):
+        return
+    dupeIds = {id for id, count in collections.Counter(idValues).items() if count > 1}
+    dupes: OrderedDict[str, list[t.ElementT]] = OrderedDict()
+    for idAttr in t.cast("list[t.Any]", _allIDAttrs(doc.document)):
+        if idAttr in dupeIds:
+            dupes.setdefault(str(idAttr), []).append(idAttr.getparent())
+    for dupeId, els in dupes.items():
         warnAboutDupes = True
         if re.match(r"issue-[0-9a-fA-F]{8}$", dupeId):
             # Don't warn about issues, it's okay if they have the same ID because they're identical text.
@@ -885,7 +1413,7 @@ def dedupIDs(doc: t.SpecT) -> None:
                 assert altId is not None
                 if altId not in ids:
                     el.set("id", safeID(doc, altId))
-                    ids.setdefault(altId, []).append(el)
+                    ids.add(altId)
                     continue
             if el.get("data-silently-dedup") is not None:
                 warnAboutDupes = False
@@ -901,7 +1429,7 @@ def dedupIDs(doc: t.SpecT) -> None:
                 altId = "{}{}".format(dupeId, circledDigits(x))
                 if altId not in ids:
                     el.set("id", safeID(doc, altId))
-                    ids.setdefault(altId, []).append(el)
+                    ids.add(altId)
                     break
 
 
@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 import io
-import itertools
+import string
 
 from . import dom
 from .. import t
@@ -9,9 +9,15 @@ from .. import t
 if t.TYPE_CHECKING:
     WriterFn: t.TypeAlias = t.Callable[[str], t.Any]
 
-    # more specific than t.NodesT, as nested lists can't happen
-    Nodes: t.TypeAlias = t.ElementT | list[str | t.ElementT]
-    Blocks: t.TypeAlias = list[Nodes]
+    # A run of inline content (text and inline elements), or a single block element
+    Block: t.TypeAlias = t.ElementT | list[str | t.ElementT]
+
+    # (serialized tag name, how its contents are written, whether it starts its own block)
+    TagInfoT: t.TypeAlias = tuple[str, str, bool]
+
+    # An element still to be serialized:
+    # (element, the context it's in ("block", "inline", or "opaque"), its indent, the block after it)
+    PendingT: t.TypeAlias = tuple[t.ElementT, str, int, Block | None]
 
 
 class Serializer:
@@ -94,233 +100,229 @@ class Serializer:
     def __init__(self, opaqueElements: t.Iterable[str], blockElements: t.Iterable[str]):
         self.opaqueEls = frozenset(opaqueElements)
         self.blockEls = frozenset(blockElements)
+        # {lxml tag => TagInfoT}, filled in as tags are seen,
+        # so each distinct tag is only categorized once.
+        self.tagInfos: dict[str, TagInfoT] = {}
 
     def serialize(self, tree: t.DocumentT) -> str:
         output = io.StringIO()
-        writer = output.write
-        writer("<!doctype html>")
-        self._serializeEl(tree.getroot(), writer)
+        self.serializeTo(tree, output.write)
         s = output.getvalue()
         output.close()
         return s
 
+    def serializeTo(self, tree: t.DocumentT, writer: WriterFn) -> None:
+        # Writes the document piece by piece as it walks the tree,
+        # so the caller can stream it out without ever holding the whole string.
+        # The tree isn't modified.
+        writer("<!doctype html>")
+        self._writeTree(tree.getroot(), writer)
+
     def unfuckName(self, n: str) -> str:
         # LXML does namespaces stupidly
         if n.startswith("{"):
             return n.partition("}")[2]
         return n
 
-    def groupIntoBlocks(self, nodes: t.Iterable[t.NodeT]) -> t.Generator[Nodes, None, None]:
-        nonBlockNodes: list[str | t.ElementT] = []
-        for node in nodes:
-            if self.isElement(node) and self.isBlockElement(node.tag):
-                if nonBlockNodes:
-                    yield nonBlockNodes
-                    nonBlockNodes = []
-                yield node
-                continue
-            else:
-                nonBlockNodes.append(node)
-        if nonBlockNodes:
-            yield nonBlockNodes
-
-    def fixWS(self, text: str) -> str:
-        import string
-
-        t1 = text.lstrip(string.whitespace)
-        if text != t1:
-            t1 = " " + t1
-        t2 = t1.rstrip(string.whitespace)
-        if t1 != t2:
-            t2 = t2 + " "
-        return t2
+    def tagInfo(self, tag: str) -> TagInfoT:
+        info = self.tagInfos.get(tag)
+        if info is not None:
+            return info
+        name = self.unfuckName(tag)
+        if name in self.voidEls:
+            kind = "void"
+        elif name in self.rawEls:
+            kind = "raw"
+        elif name in self.opaqueEls:
+            kind = "opaque"
+        else:
+            kind = "normal"
+        # Block-ness has always been decided on the un-unfucked tag.
+        info = (name, kind, not self.isInlineElement(tag))
+        self.tagInfos[tag] = info
+        return info
 
-    def startTag(self, tag: str, el: Nodes, write: WriterFn) -> None:
-        if isinstance(el, list):
-            return
-        if not dom.hasAttrs(el):
-            write("<" + tag + ">")
-            return
+    def isInlineElement(self, tag: str) -> bool:
+        return (tag in self.inlineEls) or ("-" in tag and tag not in self.blockEls)
 
-        strs = []
-        strs.append("<" + tag)
-        for attrName, attrVal in sorted(el.items()):
+    def startTag(self, name: str, el: t.ElementT) -> str:
+        attrs = el.items()
+        if not attrs:
+            return "<" + name + ">"
+        attrs.sort()
+        strs = ["<" + name]
+        for attrName, attrVal in attrs:
+            if attrName.startswith("{"):
+                attrName = self.unfuckName(attrName)
             if attrVal == "":
-                strs.append(" " + self.unfuckName(str(attrName)))
+                strs.append(" " + attrName)
             else:
-                strs.append(" " + self.unfuckName(str(attrName)) + '="' + dom.escapeAttr(str(attrVal)) + '"')
+                strs.append(" " + attrName + '="' + dom.escapeAttr(attrVal) + '"')
         strs.append(">")
-        write("".join(strs))
-
-    def endTag(self, tag: str, write: WriterFn) -> None:
-        if tag != "[]":
-            write("</" + tag + ">")
-
-    def isElement(self, node: t.Any) -> t.TypeGuard[t.ElementT]:
-        return dom.isElement(node)
-
-    def isAnonBlock(self, block: t.Any) -> bool:
-        return not dom.isElement(block)
-
-    def isVoidElement(self, tag: str) -> bool:
-        return tag in self.voidEls
-
-    def isRawElement(self, tag: str) -> bool:
-        return tag in self.rawEls
-
-    def isOpaqueElement(self, tag: str) -> bool:
-        return tag in self.opaqueEls
-
-    def isInlineElement(self, tag: str) -> bool:
-        return (tag in self.inlineEls) or ("-" in tag and tag not in self.blockEls)
-
-    def isBlockElement(self, tag: str) -> bool:
-        return not self.isInlineElement(tag)
+        return "".join(strs)
 
-    def needsEndTag(self, el: t.ElementT, nextEl: Nodes | None = None) -> bool:
+    def needsEndTag(self, el: t.ElementT, nextEl: Block | None = None) -> bool:
         if el.tag not in self.omitEndTagEls:
             return True
         if el.tag in ["dt", "dd"]:
             if nextEl is None:
                 return False
-            if self.isElement(nextEl) and nextEl.tag in ["dt", "dd"]:
+            if not isinstance(nextEl, list) and nextEl.tag in ["dt", "dd"]:
                 return False
             return True
         return False
 
-    def justWS(self, block: t.NodesT) -> bool:
-        if self.isElement(block):
-            return False
-        return len(block) == 1 and isinstance(block[0], str) and block[0].strip() == ""
-
-    def _writeVoidElement(self, tag: str, el: t.ElementT, write: WriterFn, indent: int) -> None:
-        write(" " * indent)
-        self.startTag(tag, el, write)
-
-    def _writeRawElement(self, tag: str, el: t.ElementT, write: WriterFn) -> None:
-        self.startTag(tag, el, write)
-        for node in dom.childNodes(el):
-            if self.isElement(node):
-                raise Exception(f"Somehow a CDATA element got an element child:\n{dom.outerHTML(el)}")
-            else:
-                assert isinstance(node, str)
-                write(node)
-        self.endTag(tag, write)
-
-    def _writeOpaqueElement(self, tag: str, el: t.ElementT, write: WriterFn, indent: int) -> None:
-        self.startTag(tag, el, write)
-        for node in dom.childNodes(el):
-            if self.isElement(node):
-                self._serializeEl(node, write, indent=indent, pre=True)
+    def childNodes(self, el: t.ElementT) -> list[str | t.ElementT]:
+        # Like dom.childNodes(), but without clearing anything.
+        nodes: list[str | t.ElementT] = []
+        if el.text:
+            nodes.append(el.text)
+        for child in el:
+            if isinstance(child.tag, str):
+                nodes.append(child)
+            if child.tail:
+                nodes.append(child.tail)
+        return nodes
+
+    def groupIntoBlocks(self, nodes: list[str | t.ElementT]) -> list[Block]:
+        # Groups runs of inline content into anonymous blocks,
+        # dropping the ones that are just whitespace.
+        # (This maintains whitespace between *inline* elements, which is required.
+        #  It just avoids serializing a line of "inline content" that's just WS.)
+        blocks: list[Block] = []
+        inlines: list[str | t.ElementT] = []
+        for node in nodes:
+            if not isinstance(node, str) and self.tagInfo(node.tag)[2]:
+                if inlines and not justWS(inlines):
+                    blocks.append(inlines)
+                inlines = []
+                blocks.append(node)
             else:
-                assert isinstance(node, str)
-                write(dom.escapeHTML(node))
-        self.endTag(tag, write)
-
-    def _writeInlineElement(self, tag: str, el: Nodes, write: WriterFn, inline: bool) -> None:
-        self.startTag(tag, el, write)
-        for node in dom.childNodes(el):
-            if self.isElement(node):
-                self._serializeEl(node, write, inline=inline)
+                inlines.append(node)
+        if inlines and not justWS(inlines):
+            blocks.append(inlines)
+        return blocks
+
+    def _writeTree(self, root: t.ElementT, write: WriterFn) -> None:
+        # Walks the tree with an explicit stack rather than recursing,
+        # so deeply-nested documents can't hit the recursion limit.
+        # The stack holds what's left to write, last part first:
+        # strings are written as-is,
+        # and elements still need serializing (see PendingT).
+        stack: list[str | PendingT] = [(root, "block", 0, None)]
+        pop = stack.pop
+        while stack:
+            item = pop()
+            if isinstance(item, str):
+                write(item)
+                continue
+            el, context, indent, nextEl = item
+            name, kind, _ = self.tagInfo(el.tag)
+            if kind == "void":
+                write(" " * indent + self.startTag(name, el))
+            elif kind == "raw":
+                self._writeRawElement(name, el, write)
+            elif kind == "opaque" or context == "opaque":
+                self._startOpaqueElement(name, el, write, indent, stack)
+            elif context == "inline":
+                self._startInlineElement(name, el, write, stack)
             else:
-                assert isinstance(node, str)
-                write(dom.escapeHTML(self.fixWS(node)))
-        self.endTag(tag, write)
-
-    def _blocksFromChildren(self, children: t.Iterable[t.NodeT]) -> Nodes:
-        return t.cast("Nodes", [block for block in self.groupIntoBlocks(children) if not self.justWS(block)])
+                self._startBlockElement(name, el, write, indent, nextEl, stack)
+
+    def _writeRawElement(self, name: str, el: t.ElementT, write: WriterFn) -> None:
+        write(self.startTag(name, el))
+        if el.text:
+            write(el.text)
+        for child in el:
+            if isinstance(child.tag, str):
+                raise Exception(f"Somehow a CDATA element got an element child:\n{dom.outerHTML(el)}")
+            if child.tail:
+                write(child.tail)
+        write("</" + name + ">")
 
-    def _categorizeBlockChildren(self, el: Nodes) -> tuple[str, Nodes | None]:
-        """
-        Figure out what sort of contents the block has,
-        so we know what serialization strategy to use.
-        """
-        if self.isElement(el) and len(el) == 0 and dom.emptyText(el.text):
-            return "empty", None
-        children = dom.childNodes(el, clear=True)
-        for child in children:
-            if self.isElement(child) and self.isBlockElement(child.tag):
-                return "blocks", self._blocksFromChildren(children)
-        return "inlines", children
+    # The _start*Element() methods write the start of the element,
+    # and push the rest of it (its children, tails, and end tag) onto the stack.
 
-    def _writeBlockElement(self, tag: str, el: t.ElementT, write: WriterFn, indent: int, nextEl: Nodes | None) -> None:
-        # Dropping pure-WS anonymous blocks.
-        # This maintains whitespace between *inline* elements, which is required.
-        # It just avoids serializing a line of "inline content" that's just WS.
-        contentsType, contents = self._categorizeBlockChildren(el)
+    def _startOpaqueElement(
+        self, name: str, el: t.ElementT, write: WriterFn, indent: int, stack: list[str | PendingT]
+    ) -> None:
+        # Everything inside is written as-is;
+        # only void elements still get indented.
+        write(self.startTag(name, el))
+        if el.text:
+            write(dom.escapeHTML(el.text))
+        stack.append("</" + name + ">")
+        for child in reversed(el):
+            if child.tail:
+                stack.append(dom.escapeHTML(child.tail))
+            if isinstance(child.tag, str):
+                stack.append((child, "opaque", indent, None))
+
+    def _startInlineElement(self, name: str, el: t.ElementT, write: WriterFn, stack: list[str | PendingT]) -> None:
+        write(self.startTag(name, el))
+        if el.text:
+            write(dom.escapeHTML(fixWS(el.text)))
+        if len(el) == 0:
+            # Most inline elements are just text, so don't bother with the stack.
+            write("</" + name + ">")
+            return
+        stack.append("</" + name + ">")
+        for child in reversed(el):
+            if child.tail:
+                stack.append(dom.escapeHTML(fixWS(child.tail)))
+            if isinstance(child.tag, str):
+                stack.append((child, "inline", 0, None))
+
+    def _pushInlines(self, nodes: list[str | t.ElementT], stack: list[str | PendingT]) -> None:
+        for node in reversed(nodes):
+            if isinstance(node, str):
+                stack.append(dom.escapeHTML(fixWS(node)))
+            else:
+                stack.append((node, "inline", 0, None))
 
-        if contentsType == "empty":
+    def _startBlockElement(
+        self, name: str, el: t.ElementT, write: WriterFn, indent: int, nextEl: Block | None, stack: list[str | PendingT]
+    ) -> None:
+        write(" " * indent + self.startTag(name, el))
+        if len(el) == 0 and dom.emptyText(el.text):
             # Empty of text and children
-            assert self.isElement(el)
-            write(" " * indent)
-            self.startTag(tag, el, write)
             if self.needsEndTag(el, nextEl):
-                self.endTag(tag, write)
-        elif contentsType == "inlines":
+                write("</" + name + ">")
+            return
+
+        children = self.childNodes(el)
+        if not any(not isinstance(child, str) and self.tagInfo(child.tag)[2] for child in children):
             # Contains only inlines, print accordingly
-            assert contents is not None
-            # el might be a list of inline content
-            write(" " * indent)
-            self.startTag(tag, el, write)
-            self._serializeEl(contents, write, inline=True)
             if self.needsEndTag(el, nextEl):
-                self.endTag(tag, write)
+                stack.append("</" + name + ">")
+            self._pushInlines(children, stack)
             return
-        else:
-            # Otherwise I'm a block that contains at least one block
-            assert contents is not None
-            assert self.isElement(el)
-            write(" " * indent)
-            self.startTag(tag, el, write)
-            for block, nextBlock in t.cast("itertools.zip_longest[tuple[Nodes, Nodes|None]]", pairwise(contents)):
-                if isinstance(block, list):
-                    # is an array of inlines
-                    if len(block) > 0:
-                        write("\n" + (" " * (indent + 1)))
-                        self._serializeEl(block, write, inline=True)
-                else:
-                    write("\n")
-                    self._serializeEl(block, write, indent=indent + 1, nextEl=nextBlock)
-            if self.needsEndTag(el, nextEl):
-                write("\n" + (" " * indent))
-                self.endTag(tag, write)
 
-    def _serializeEl(
-        self,
-        el: Nodes,
-        write: WriterFn,
-        indent: int = 0,
-        pre: bool = False,
-        inline: bool = False,
-        nextEl: Nodes | None = None,
-    ) -> None:
-        if isinstance(el, list):
-            tag = "[]"
-        else:
-            tag = self.unfuckName(el.tag)
-
-        if self.isVoidElement(tag):
-            assert self.isElement(el)
-            self._writeVoidElement(tag, el, write, indent)
-        elif self.isRawElement(tag):
-            assert self.isElement(el)
-            self._writeRawElement(tag, el, write)
-        elif pre or self.isOpaqueElement(tag):
-            assert self.isElement(el)
-            self._writeOpaqueElement(tag, el, write, indent)
-        elif inline:
-            self._writeInlineElement(tag, el, write, inline)
-        else:
-            assert self.isElement(el)
-            self._writeBlockElement(tag, el, write, indent, nextEl)
+        # Otherwise I'm a block that contains at least one block
+        blocks = self.groupIntoBlocks(children)
+        if self.needsEndTag(el, nextEl):
+            stack.append("\n" + (" " * indent) + "</" + name + ">")
+        nextBlock = None
+        for block in reversed(blocks):
+            if isinstance(block, list):
+                self._pushInlines(block, stack)
+                stack.append("\n" + (" " * (indent + 1)))
+            else:
+                stack.append((block, "block", indent + 1, nextBlock))
+                stack.append("\n")
+            nextBlock = block
 
 
-if t.TYPE_CHECKING:
-    PairwiseU = t.TypeVar("PairwiseU")
+def fixWS(text: str) -> str:
+    # Collapses leading and trailing whitespace to a single space.
+    t1 = text.lstrip(string.whitespace)
+    if text != t1:
+        t1 = " " + t1
+    t2 = t1.rstrip(string.whitespace)
+    if t1 != t2:
+        t2 = t2 + " "
+    return t2
 
 
-def pairwise(iterable: t.Iterable[PairwiseU]) -> itertools.zip_longest[tuple[PairwiseU, PairwiseU | None]]:
-    # pairwise('ABCDEFG') --> AB BC CD DE EF FG GNone
-    a, b = itertools.tee(iterable)
-    next(b, None)
-    return itertools.zip_longest(a, b)
+def justWS(nodes: list[str | t.ElementT]) -> bool:
+    return len(nodes) == 1 and isinstance(nodes[0], str) and nodes[0].strip() == ""
@@ -17,7 +17,10 @@ def processHeadings(doc: t.SpecT, scope: str = "doc") -> None:
     determineHeadingLevels(doc, headings)
     addHeadingIds(doc, headings)
     addHeadingAlgorithms(headings)
-    h.fixupIDs(doc, headings)
+    if scope == "all":
+        # The boilerplate sections added IDs since the last dedup, and the TOC links to them next.
+        # (The first time through, processDfns() dedups the headings along with everything else.)
+        h.dedupIDs(doc)
     addHeadingBonuses(headings)
     for el in headings:
         h.addClass(doc, el, "settled")
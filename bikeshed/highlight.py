@@ -7,7 +7,7 @@ import dataclasses
 import itertools
 import re
 
-from . import h, messages as m, t
+from . import constants, h, messages as m, t
 
 if t.TYPE_CHECKING:
     import pygments
@@ -37,18 +37,22 @@ def addSyntaxHighlighting(doc: t.SpecT) -> None:
         return
     normalizeHighlightMarkers(doc)
 
+    # Find whether to highlight each element, and what the lang is
+    targets = [(el, determineHighlightLang(doc, el)) for el in h.findAll("xmp, pre, code", doc)]
+    precomputed: dict[int, t.Deque[ColoredText]] = {}
+    if doc.highlightJobs > 1:
+        precomputed = highlightInParallel(doc, targets, doc.highlightJobs)
+
     # Highlight all the appropriate elements
     highlightingOccurred = False
     lineWrappingOccurred = False
     lineHighlightingOccurred = False
-    for el in h.findAll("xmp, pre, code", doc):
-        # Find whether to highlight, and what the lang is
-        lang = determineHighlightLang(doc, el)
+    for i, (el, lang) in enumerate(targets):
         if lang is False:
             # Element was already highlighted, but needs styles
             highlightingOccurred = True
         elif lang:
-            highlightEl(doc, el, lang)
+            highlightEl(doc, el, lang, precomputed.get(i))
             highlightingOccurred = True
         # Find whether to add line numbers
         ln = determineLineNumbers(doc, el)
@@ -59,6 +63,9 @@ def addSyntaxHighlighting(doc: t.SpecT) -> None:
             if ln.highlights:
                 lineHighlightingOccurred = True
 
+    if doc.highlightCache is not None:
+        doc.highlightCache.prune()
+
     if highlightingOccurred:
         doc.extraStyles["style-syntax-highlighting"] += getHighlightStyles()
         doc.extraStyles["style-darkmode"] += getHighlightDarkmodeStyles()
@@ -151,19 +158,103 @@ def determineLineNumbers(doc: t.SpecT, el: t.ElementT) -> LineNumberOptions:
     return LineNumberOptions(addLineNumbers, lineStart, lineHighlights)
 
 
-def highlightEl(doc: t.SpecT, el: t.ElementT, lang: str) -> None:
+def highlightEl(
+    doc: t.SpecT,
+    el: t.ElementT,
+    lang: str,
+    precomputed: t.Deque[ColoredText] | None = None,
+) -> None:
+    # If the element was already highlighted in a worker process (see highlightInParallel()),
+    # the precomputed highlighting is used instead.
     text = h.textContent(el)
-    coloredText: t.Deque[ColoredText] | None
-    if lang == "webidl":
-        coloredText = highlightWithWebIDL(text, el=el)
-    else:
-        coloredText = highlightWithPygments(text, lang, el=el)
+    coloredText: t.Deque[ColoredText] | None = None
+    if doc.highlightCache is not None:
+        coloredText = doc.highlightCache.get(lang, text)
+    if coloredText is None:
+        messageAttempts = m.messageAttempts
+        if precomputed is not None:
+            coloredText = precomputed
+        elif lang == "webidl":
+            coloredText = highlightWithWebIDL(text, el=el)
+        else:
+            coloredText = highlightWithPygments(text, lang, el=el)
+        if coloredText is not None and doc.highlightCache is not None and m.messageAttempts == messageAttempts:
+            doc.highlightCache.put(lang, text, coloredText)
     if coloredText is not None:
         mergeHighlighting(el, coloredText)
         h.addClass(doc, el, "highlight")
 
 
-def highlightWithWebIDL(text: str, el: t.ElementT) -> t.Deque[ColoredText] | None:
+def highlightInParallel(
+    doc: t.SpecT,
+    targets: list[tuple[t.ElementT, str | t.Literal[False] | None]],
+    jobs: int,
+) -> dict[int, t.Deque[ColoredText]]:
+    # Highlighting a block is independent of every other block,
+    # so the lexing can be farmed out to a pool of processes,
+    # leaving only the merging into the tree to be done here, in order.
+    # Returns the highlighting for each index into targets that was highlighted successfully;
+    # anything else (blocks that complained about something, unknown languages, etc)
+    # is left for highlightEl() to redo serially, so its messages come out as normal.
+    import multiprocessing
+
+    if "fork" not in multiprocessing.get_all_start_methods():
+        # Without fork(), every worker would have to re-import and re-set-up everything.
+        return {}
+
+    knownLangs: dict[str, bool] = {}
+    indexes = []
+    work = []
+    for i, (el, lang) in enumerate(targets):
+        if not lang:
+            continue
+        if lang not in knownLangs:
+            knownLangs[lang] = lang == "webidl" or lexerFromLang(lang) is not None
+        if not knownLangs[lang]:
+            continue
+        text = h.textContent(el)
+        if doc.highlightCache is not None and doc.highlightCache.get(lang, text) is not None:
+            continue
+        indexes.append(i)
+        work.append((lang, text))
+    if len(work) < 2:
+        return {}
+
+    with multiprocessing.get_context("fork").Pool(min(jobs, len(work)), initializer=silenceWorker) as pool:
+        results = pool.map(highlightWork, work, chunksize=max(1, len(work) // (jobs * 4)))
+    return {
+        i: collections.deque(ColoredText(text, color) for text, color in runs)
+        for i, runs in zip(indexes, results)
+        if runs is not None
+    }
+
+
+def silenceWorker() -> None:
+    # Workers' messages would be printed out of order and without the element,
+    # and a fatal error would kill the worker rather than the build;
+    # blocks that produce messages get redone in the main process instead.
+    constants.quiet = float("infinity")
+    constants.setErrorLevel("nothing")
+
+
+def highlightWork(work: tuple[str, str]) -> list[tuple[str, str | None]] | None:
+    # Runs in a worker process.
+    # ColoredTexts are sent back as plain tuples, as they're much cheaper to pickle.
+    lang, text = work
+    messageAttempts = m.messageAttempts
+    try:
+        if lang == "webidl":
+            coloredText = highlightWithWebIDL(text, el=None)
+        else:
+            coloredText = highlightWithPygments(text, lang, el=None)
+    except Exception:  # pylint: disable=broad-except
+        return None
+    if coloredText is None or m.messageAttempts != messageAttempts:
+        return None
+    return [(ct.text, ct.color) for ct in coloredText]
+
+
+def highlightWithWebIDL(text: str, el: t.ElementT | None) -> t.Deque[ColoredText] | None:
     """
     Trick the widlparser emitter,
     which wants to output HTML via wrapping with start/end tags,
@@ -260,7 +351,7 @@ def coloredTextFromWidlStack(widlText: str) -> t.Deque[ColoredText]:
     return coloredTexts
 
 
-def highlightWithPygments(text: str, lang: str, el: t.ElementT) -> t.Deque[ColoredText] | None:
+def highlightWithPygments(text: str, lang: str, el: t.ElementT | None) -> t.Deque[ColoredText] | None:
     import pygments  # pylint: disable=redefined-outer-name
     from pygments.formatters.other import RawTokenFormatter
 
@@ -268,7 +359,7 @@ def highlightWithPygments(text: str, lang: str, el: t.ElementT) -> t.Deque[Color
     if lexer is None:
         m.die(
             f"'{lang}' isn't a known syntax-highlighting language. See http://pygments.org/docs/lexers/. Seen on:\n"
-            + h.outerHTML(el),
+            + (h.outerHTML(el) if el is not None else text),
             el=el,
         )
         return None
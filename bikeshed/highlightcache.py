@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import collections
+import hashlib
+import json
+
+from . import t
+from .cachestore import CacheStore, codeFingerprint
+from .highlight import ColoredText
+
+# A cache of syntax-highlighting results,
+# so code blocks that haven't changed since the last build aren't re-lexed.
+#
+# Each entry is keyed by a hash of the highlighting language,
+# the versions of everything that does the highlighting
+# (Pygments, widlparser, and Bikeshed's own highlighting code),
+# and the exact text of the block,
+# and stores the list of colored runs that gets merged back into the block's markup.
+#
+# Entries are kept in a cachestore.CacheStore:
+# in memory, and with a cache folder (`bikeshed spec --cache-dir`),
+# also on disk, one small JSON file per entry.
+#
+# Highlighting that printed any messages is never stored,
+# so a cached block never silently drops a warning.
+
+FORMAT_VERSION = 1
+
+# Total size of the on-disk entries, past which the least-recently-used ones are deleted.
+MAX_DISK_BYTES = 64 * 2**20
+# Entries held in memory, past which the least-recently-used ones are dropped.
+MAX_MEMORY_ENTRIES = 10000
+
+if t.TYPE_CHECKING:
+    RunsT: t.TypeAlias = list[tuple[str, str | None]]
+
+
+class HighlightCache:
+    def __init__(self, cacheDir: str | None = None) -> None:
+        self.store = CacheStore(
+            cacheDir,
+            name="highlighting",
+            suffix=".json",
+            decode=decodeRuns,
+            maxDiskBytes=MAX_DISK_BYTES,
+            maxMemoryEntries=MAX_MEMORY_ENTRIES,
+        )
+
+    def get(self, lang: str, text: str) -> t.Deque[ColoredText] | None:
+        runs: RunsT | None = self.store.get(entryKey(lang, text))
+        if runs is None:
+            return None
+        # Merging the highlighting consumes the ColoredTexts, so always hand out fresh ones.
+        return collections.deque(ColoredText(text, color) for text, color in runs)
+
+    def put(self, lang: str, text: str, coloredText: t.Iterable[ColoredText]) -> None:
+        runs = [(ct.text, ct.color) for ct in coloredText]
+        data = json.dumps({"version": FORMAT_VERSION, "runs": runs}).encode("utf-8")
+        self.store.put(entryKey(lang, text), runs, data)
+
+    def prune(self) -> None:
+        self.store.prune()
+
+
+def decodeRuns(data: bytes) -> RunsT | None:
+    try:
+        entry = json.loads(data)
+    except ValueError:
+        return None
+    if not isinstance(entry, dict) or entry.get("version") != FORMAT_VERSION:
+        return None
+    try:
+        # (JSON turned the runs' tuples into lists.)
+        runs = t.cast("RunsT", list(map(tuple, entry["runs"])))
+    except (KeyError, TypeError):
+        return None
+    if not all(len(run) == 2 for run in runs):
+        return None
+    return runs
+
+
+def entryKey(lang: str, text: str) -> str:
+    hasher = hashlib.sha256()
+    hasher.update(json.dumps([FORMAT_VERSION, highlighterFingerprint(), lang, text]).encode("utf-8"))
+    return hasher.hexdigest()
+
+
+def highlighterFingerprint() -> str:
+    # Everything whose version can change the highlighting of a given block of text.
+    return codeFingerprint(("Pygments", "widlparser"), ("highlight.py", "lexers.py"))
@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+import dataclasses
+import html
 import re
 
 import widlparser
@@ -23,6 +25,86 @@ class IDLSilent:
         pass
 
 
+class IDLRecorder:
+    # Holds onto the messages from a parse,
+    # so they can be reported later, once it's known they're wanted.
+    def __init__(self) -> None:
+        self.messages: list[tuple[str, str]] = []
+
+    def warn(self, msg: str) -> None:
+        self.messages.append(("warn", msg))
+
+    def note(self, msg: str) -> None:
+        self.messages.append(("note", msg))
+
+
+class IDLRecordingParser(widlparser.parser.Parser):
+    # A Parser that logs every use of its symbol table,
+    # so markupIDL() can tell whether a block would've parsed differently
+    # against a different symbol table, without parsing it again.
+    # The only thing widlparser looks types up for is whether they're dictionaries
+    # that have to be passed as optional arguments,
+    # so that's all that's logged for lookups.
+    def __init__(self, text: str, ui: IDLRecorder, symbolTable: dict[str, widlparser.Construct] | None) -> None:
+        self.symbolLog: list[tuple[str, str, t.Any]] = []
+        super().__init__(text, ui=ui, symbol_table=symbolTable)
+
+    def add_type(self, type: widlparser.Construct) -> None:
+        super().add_type(type)
+        if type.name:
+            self.symbolLog.append(("add", type.name, type))
+
+    def get_type(self, name: str) -> widlparser.Construct | None:
+        type = super().get_type(name)
+        self.symbolLog.append(("get", name, isOptionalOnlyDictionary(type)))
+        return type
+
+
+@dataclasses.dataclass
+class ParsedIDL:
+    # Everything markupIDL() needs from parsing one IDL block with an IDLRecordingParser,
+    # which is also what gets saved in an idlcache.IDLCache.
+    constructs: list[widlparser.Construct]
+    # The parser's IDLRecordingParser.symbolLog.
+    symbolLog: list[tuple[str, str, t.Any]]
+    # The parser's IDLRecorder.messages.
+    messages: list[tuple[str, str]]
+    # The block's markup (as given by freezeNodes()), once it's been built.
+    markup: list[t.Any] | None = None
+
+    def addSymbols(self, symbolTable: dict[str, widlparser.Construct]) -> None:
+        # Makes the same additions to the symbol table that parsing the block would.
+        for kind, name, value in self.symbolLog:
+            if kind == "add":
+                symbolTable[name] = value
+
+    def replaySymbolLog(self, symbolTable: dict[str, widlparser.Construct]) -> bool:
+        # Checks whether every type lookup would've come out the same against the given table
+        # (updated by this block's own additions as it goes, like a real parse would),
+        # and if so, makes those additions to it.
+        added: dict[str, widlparser.Construct] = {}
+        for kind, name, value in self.symbolLog:
+            if kind == "add":
+                added[name] = value
+            else:
+                type = added[name] if name in added else symbolTable.get(name)
+                if isOptionalOnlyDictionary(type) != value:
+                    return False
+        symbolTable.update(added)
+        return True
+
+    def replayMessages(self, ui: IDLUI) -> None:
+        for kind, msg in self.messages:
+            if kind == "warn":
+                ui.warn(msg)
+            else:
+                ui.note(msg)
+
+
+def isOptionalOnlyDictionary(type: widlparser.Construct | None) -> bool:
+    return type is not None and type.idl_type == "dictionary" and not type.required  # type: ignore[attr-defined]
+
+
 if t.TYPE_CHECKING:
     MarkupReturnT = tuple[str | None, str | None]
 
@@ -338,25 +420,63 @@ def markupIDL(doc: t.SpecT) -> None:
         el.tag = "pre"
         h.removeAttr(el, "type")
         h.addClass(doc, el, "idl")
-    # One pass with a silent parser to collect the symbol table.
-    symbolTable = None
-    for el in idlEls:
-        p = widlparser.parser.Parser(h.textContent(el), ui=IDLSilent(), symbol_table=symbolTable)
-        symbolTable = p.symbol_table
-    # Then a real pass to actually mark up the IDL,
-    # and collect it for the index.
-    for el in idlEls:
+    # Parse every block once, collecting the symbol table as we go.
+    # (Even non-normative blocks can define types that normative ones use.)
+    # Blocks that haven't changed since an earlier build come from the cache instead.
+    texts = [h.textContent(el) for el in idlEls]
+    symbolTable: dict[str, widlparser.Construct] = {}
+    blocks: list[ParsedIDL] = []
+    # The blocks whose cache entries need saving (or re-saving, with their markup).
+    unsaved: set[int] = set()
+    for i, text in enumerate(texts):
+        parsed = doc.idlCache.get(text) if doc.idlCache is not None else None
+        if parsed is None:
+            recorder = IDLRecorder()
+            recorded = IDLRecordingParser(text, ui=recorder, symbolTable=symbolTable)
+            symbolTable = recorded.symbol_table
+            parsed = ParsedIDL(recorded.constructs, recorded.symbolLog, recorder.messages)
+            unsaved.add(i)
+        else:
+            parsed.addSymbols(symbolTable)
+        blocks.append(parsed)
+    # Then mark up the normative blocks, and collect them for the index.
+    # Type lookups are supposed to see the whole document's symbol table,
+    # not just the blocks before them,
+    # so any block whose lookups would've come out differently
+    # (which just means a later dictionary type)
+    # has to be parsed again to get its messages right.
+    fullSymbolTable = dict(symbolTable)
+    for i, (el, text, parsed) in enumerate(zip(idlEls, texts, blocks)):
         if h.isNormative(doc, el):
-            text = h.textContent(el)
-            # Parse once with a fresh parser, so I can spit out just this <pre>'s markup.
-            widl = widlparser.parser.Parser(text, ui=IDLUI(), symbol_table=symbolTable)
+            constructs = parsed.constructs
+            if parsed.replaySymbolLog(fullSymbolTable):
+                parsed.replayMessages(IDLUI())
+            else:
+                constructs = widlparser.parser.Parser(text, ui=IDLUI(), symbol_table=fullSymbolTable).constructs
             marker = DebugMarker() if doc.debug else IDLMarker()
-
-            h.replaceContents(el, h.parseHTML(str(widl.markup(marker))))
-            # Parse a second time with the global one, which collects all data in the doc.
-            doc.widl.parse(text)
+            if isinstance(marker, IDLMarker) and parsed.markup is not None:
+                nodes = thawNodes(parsed.markup)
+            else:
+                messageAttempts = m.messageAttempts
+                nodes = None
+                if isinstance(marker, IDLMarker):
+                    nodes = nodesFromMarkup(constructs, marker)
+                if nodes is None:
+                    nodes = h.parseHTML(markupGenerator(constructs).markup(marker))
+                # The symbol table doesn't affect the markup, just the messages,
+                # so it can be reused whenever the block is, as long as building it didn't say anything.
+                if doc.idlCache is not None and isinstance(marker, IDLMarker) and m.messageAttempts == messageAttempts:
+                    parsed.markup = freezeNodes(nodes)
+                    unsaved.add(i)
+            h.replaceContents(el, nodes)
+            # And add it to the global parser, which collects all the IDL in the doc.
+            doc.widl.constructs.extend(constructs)
         h.addClass(doc, el, "highlight")
         highlightingOccurred = True
+    if doc.idlCache is not None:
+        for i in sorted(unsaved):
+            doc.idlCache.put(texts[i], blocks[i])
+        doc.idlCache.prune()
     if doc.md.slimBuildArtifact:
         # Remove the highlight-only spans
         for el in idlEls:
@@ -374,6 +494,151 @@ def markupIDL(doc: t.SpecT) -> None:
             """
 
 
+# The marker methods for each kind of MarkupText that gets its own markup.
+_textMarkupMethods = {
+    widlparser.markup.MarkupTypeName: "markup_type_name",
+    widlparser.markup.MarkupName: "markup_name",
+    widlparser.markup.MarkupKeyword: "markup_keyword",
+    widlparser.markup.MarkupEnumValue: "markup_enum_value",
+}
+_markupStartTag = re.compile(
+    r"""<([A-Za-z][A-Za-z0-9-]*)((?:[\t\n\f\r ]+[^\t\n\f\r "'>/=]+(?:[\t\n\f\r ]*=[\t\n\f\r ]*(?:"[^"]*"|'[^']*'|[^\t\n\f\r "'=<>`]+))?)*)[\t\n\f\r ]*>$"""
+)
+_markupAttr = re.compile(
+    r"""([^\t\n\f\r "'>/=]+)(?:[\t\n\f\r ]*=[\t\n\f\r ]*(?:"([^"]*)"|'([^']*)'|([^\t\n\f\r "'=<>`]+)))?"""
+)
+# Every & in an attribute value starts a complete, semicolon-terminated character reference.
+_markupAttrName = re.compile(r"[A-Za-z_][A-Za-z0-9_.-]*$")
+_markupAttrRefs = re.compile(r"[^&]*(?:&(?:[A-Za-z][A-Za-z0-9]*|#[0-9]+|#[xX][0-9A-Fa-f]+);[^&]*)*$")
+# Characters the HTML parser would change or drop, or that lxml can't hold.
+_markupOddChars = re.compile(r"[\x00-\x08\x0b-\x1f\ufffe\uffff]")
+_asciiWhitespace = "\t\n\f\r "
+
+
+def markupGenerator(constructs: list[widlparser.Construct]) -> widlparser.markup.MarkupGenerator:
+    # The same markup tree widlparser.parser.Parser.markup() builds, for any list of constructs.
+    generator = widlparser.markup.MarkupGenerator(None)
+    for construct in constructs:
+        construct.define_markup(generator)
+    return generator
+
+
+def nodesFromMarkup(constructs: list[widlparser.Construct], marker: IDLMarker) -> list[t.NodesT] | None:
+    """
+    Builds the same nodes that h.parseHTML(markupGenerator(constructs).markup(marker)) would,
+    straight from widlparser's markup tree,
+    rather than printing it as HTML and parsing it right back.
+    Returns None if the markup does anything the HTML parser would fix up
+    (like nesting <a>s), so the caller can do it the slow way instead.
+    """
+    # pylint: disable=protected-access
+    generator = markupGenerator(constructs)
+    if _markupOddChars.search(generator.text):
+        return None
+
+    container = h.E.div()
+    stack = [container]
+    # Like any other document, leading whitespace gets dropped.
+    atStart = True
+
+    def addText(text: str) -> None:
+        nonlocal atStart
+        if atStart:
+            text = text.lstrip(_asciiWhitespace)
+            if not text:
+                return
+            atStart = False
+        parent = stack[-1]
+        if len(parent):
+            parent[-1].tail = (parent[-1].tail or "") + text
+        else:
+            parent.text = (parent.text or "") + text
+
+    def openTag(head: str | None, tail: str | None) -> bool:
+        # Opens the element a marker asked for, if any, returning whether it did.
+        nonlocal atStart
+        if not head and not tail:
+            return False
+        if not head or not tail or _markupOddChars.search(head):
+            raise _NeedsHTMLParser
+        match = _markupStartTag.match(head)
+        if not match or tail.lower() != f"</{match[1].lower()}>":
+            raise _NeedsHTMLParser
+        tag = match[1].lower()
+        if tag == "a" and any(el.tag == "a" for el in stack):
+            raise _NeedsHTMLParser
+        attrs: dict[str, str] = {}
+        for attrMatch in _markupAttr.finditer(match[2]):
+            name = attrMatch[1].lower()
+            value = (
+                attrMatch[2] if attrMatch[2] is not None else attrMatch[3] if attrMatch[3] is not None else attrMatch[4]
+            )
+            if value is None:
+                value = ""
+            elif "&" in value:
+                if not _markupAttrRefs.match(value):
+                    raise _NeedsHTMLParser
+                value = html.unescape(value)
+            if not _markupAttrName.match(name):
+                raise _NeedsHTMLParser
+            # Like HTML, the first of any duplicate attributes wins.
+            attrs.setdefault(name, value)
+        atStart = False
+        el = h.createElement(tag, attrs)
+        stack[-1].append(el)
+        stack.append(el)
+        return True
+
+    def walk(gen: widlparser.markup.MarkupGenerator, construct: widlparser.Construct | None) -> None:
+        if isinstance(gen, widlparser.markup.MarkupText):
+            # Plain text, rather than one of the subclasses for the specially-marked-up kinds of text.
+            if type(gen) is widlparser.markup.MarkupText:  # pylint: disable=unidiomatic-typecheck
+                addText(gen.text)
+                return
+            methodName = _textMarkupMethods.get(type(gen))
+            if methodName is None:
+                raise _NeedsHTMLParser
+            opened = openTag(*getattr(marker, methodName)(gen.text, construct))
+            addText(gen.text)
+        else:
+            opened = openTag(*gen._markup(marker))
+            for child in gen.children:
+                walk(child, gen.construct)
+        if opened:
+            stack.pop()
+
+    try:
+        walk(generator, None)
+    except _NeedsHTMLParser:
+        return None
+    nodes: list[t.NodesT] = [container.text] if container.text else []
+    nodes.extend(h.childElements(container))
+    return nodes
+
+
+class _NeedsHTMLParser(Exception):
+    pass
+
+
+def freezeNodes(nodes: t.Iterable[t.NodesT]) -> list[t.Any]:
+    # Turns nodes into plain strings, tuples, lists, and dicts,
+    # so they can be pickled (which lxml elements can't),
+    # and rebuilt with thawNodes() as many times as needed.
+    frozen: list[t.Any] = []
+    for node in h.childNodes(list(nodes)):
+        if isinstance(node, str):
+            frozen.append(node)
+        else:
+            frozen.append((node.tag, dict(node.attrib), freezeNodes(h.childNodes(node))))
+    return frozen
+
+
+def thawNodes(frozen: list[t.Any]) -> list[t.NodesT]:
+    return [
+        node if isinstance(node, str) else h.createElement(node[0], node[1], *thawNodes(node[2])) for node in frozen
+    ]
+
+
 def markupIDLBlock(pre: t.ElementT, doc: t.SpecT) -> set[t.ElementT]:
     localDfns = set()
     forcedInterfaces = []
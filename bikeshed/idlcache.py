@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import copyreg
+import hashlib
+import io
+import json
+import os
+import pickle
+
+from . import t
+from .cachestore import CacheStore, codeFingerprint
+
+if t.TYPE_CHECKING:
+    import widlparser
+
+    from .idl import ParsedIDL
+
+# A cache of parsed IDL blocks,
+# so blocks that haven't changed since the last build aren't run through widlparser again.
+#
+# Each entry is keyed by a hash of the versions of everything that parses and marks up IDL
+# (widlparser, and Bikeshed's own IDL code)
+# and the exact text of the block,
+# and stores the block's idl.ParsedIDL:
+# its constructs (for doc.widl), its messages, its symbol-table use, and its markup.
+#
+# How a block parses can depend on the rest of the doc's IDL
+# (whether the types it uses are dictionaries),
+# but that's deliberately not part of the key,
+# so editing one block doesn't throw out all the others.
+# Instead, markupIDL() checks each block's recorded type lookups against the current doc,
+# and parses it again if any of them would come out differently.
+#
+# Entries are pickled, since widlparser's constructs are plain Python objects,
+# and kept in a cachestore.CacheStore:
+# in memory, and with a cache folder (`bikeshed spec --cache-dir`),
+# also on disk, one file per entry.
+# Unpickling can run arbitrary code,
+# so the on-disk entries are only read from a folder that only the current user can write to.
+# Every get() unpickles a fresh copy,
+# so nothing one build does to its constructs can leak into another.
+
+FORMAT_VERSION = 1
+
+# Total size of the on-disk entries, past which the least-recently-used ones are deleted.
+MAX_DISK_BYTES = 64 * 2**20
+# Entries held in memory, past which the least-recently-used ones are dropped.
+MAX_MEMORY_ENTRIES = 2000
+
+
+class IDLCache:
+    def __init__(self, cacheDir: str | None = None) -> None:
+        self.store = CacheStore(
+            cacheDir,
+            name="parsed IDL",
+            suffix=".pickle",
+            decode=bytes,
+            maxDiskBytes=MAX_DISK_BYTES,
+            maxMemoryEntries=MAX_MEMORY_ENTRIES,
+            private=True,
+        )
+
+    def get(self, text: str) -> ParsedIDL | None:
+        key = entryKey(text)
+        data: bytes | None = self.store.get(key)
+        if data is None:
+            return None
+        try:
+            return t.cast("ParsedIDL", pickle.loads(data))
+        except Exception:  # pylint: disable=broad-except
+            # A corrupted file can fail to unpickle in all sorts of ways;
+            # just treat it as missing.
+            self.store.forget(key)
+            return None
+
+    def put(self, text: str, parsed: ParsedIDL) -> None:
+        data = pickleParsedIDL(parsed)
+        self.store.put(entryKey(text), data, data)
+
+    def prune(self) -> None:
+        self.store.prune()
+
+
+def pickleParsedIDL(parsed: ParsedIDL) -> bytes:
+    from .idl import IDLRecordingParser
+
+    out = io.BytesIO()
+    pickler = pickle.Pickler(out, protocol=pickle.HIGHEST_PROTOCOL)
+    # Every construct points back at the parser that made it, as its symbol table,
+    # and through that, at every other block's constructs.
+    # It's only used while parsing, though, so leave it out.
+    pickler.dispatch_table = copyreg.dispatch_table.copy()
+    pickler.dispatch_table[IDLRecordingParser] = omitParser
+    pickler.dump(parsed)
+    return out.getvalue()
+
+
+def omitParser(parser: widlparser.parser.Parser) -> tuple[t.Any, ...]:  # pylint: disable=unused-argument
+    # Pickles the parser as a call to noParser().
+    return (noParser, ())
+
+
+def noParser() -> None:
+    return None
+
+
+def entryKey(text: str) -> str:
+    hasher = hashlib.sha256()
+    hasher.update(json.dumps([FORMAT_VERSION, idlFingerprint(), text]).encode("utf-8"))
+    return hasher.hexdigest()
+
+
+def idlFingerprint() -> str:
+    # Everything whose version can change how a given block of IDL is parsed or marked up.
+    return codeFingerprint(("widlparser",), ("idl.py", os.path.join("config", "dfnTypes.py")))
@@ -26,22 +26,21 @@ def addMdnPanels(doc: t.SpecT) -> None:
         return
 
     try:
-        filename = f"{doc.md.vshortname}.json"
-        datafile = doc.dataFile.fetch("mdn", filename, str=True)
-    except OSError:
         try:
-            filename = f"{doc.md.shortname}.json"
-            datafile = doc.dataFile.fetch("mdn", filename, str=True)
+            filename = f"{doc.md.vshortname}.json"
+            data = t.cast("MdnDataT", doc.dataFile.fetchParsed("mdn", filename, parser=loadOrderedJson))
         except OSError:
-            if doc.md.includeMdnPanels == "maybe":
-                # if "maybe", failure is fine, don't complain
-                pass
-            else:
-                m.die(f"Couldn't find the MDN data for '{doc.md.vshortname}' nor '{doc.md.shortname}'.")
-            return
-    try:
-        data = t.cast("MdnDataT", json.loads(datafile, object_pairs_hook=OrderedDict))
-    except Exception as e:
+            try:
+                filename = f"{doc.md.shortname}.json"
+                data = t.cast("MdnDataT", doc.dataFile.fetchParsed("mdn", filename, parser=loadOrderedJson))
+            except OSError:
+                if doc.md.includeMdnPanels == "maybe":
+                    # if "maybe", failure is fine, don't complain
+                    pass
+                else:
+                    m.die(f"Couldn't find the MDN data for '{doc.md.vshortname}' nor '{doc.md.shortname}'.")
+                return
+    except ValueError as e:
         m.die(f"Couldn't load MDN Spec Links data for this spec.\n{e}")
         return
 
@@ -52,6 +51,10 @@ def addMdnPanels(doc: t.SpecT) -> None:
         doc.extraStyles["style-darkmode"] += getModuleFile("mdn-dark.css")
 
 
+def loadOrderedJson(text: str) -> t.Any:
+    return json.loads(text, object_pairs_hook=OrderedDict)
+
+
 def createAnno(className: str, mdnButton: t.ElementT, featureDivs: list[t.ElementT]) -> t.ElementT:
     return h.E.div({"class": className}, mdnButton, featureDivs)
 
@@ -90,131 +93,134 @@ def panelsFromData(doc: t.SpecT, data: MdnDataT) -> bool:
     }
 
     panels = False
-    for elementId, features in data.items():
-        isAnnoForHeadingContent = False
-        isAnnoForListItemOrTableContent = False
-        lessThanTwoEngines = 0
-        onlyTwoEngines = 0
-        allEngines = 0
-        featureDivs = []
-        targetElement = h.find(f"[id='{elementId}']", doc)
-        if targetElement is None:
-            m.warn(f"No '{elementId}' ID found, skipping MDN features that would target it.")
-            continue
+    # Every feature looks up its target by ID,
+    # and everything below only changes the document through the h helpers.
+    with h.ElementIndex(doc):
+        for elementId, features in data.items():
+            isAnnoForHeadingContent = False
+            isAnnoForListItemOrTableContent = False
+            lessThanTwoEngines = 0
+            onlyTwoEngines = 0
+            allEngines = 0
+            featureDivs = []
+            targetElement = h.find(f"[id='{elementId}']", doc)
+            if targetElement is None:
+                m.warn(f"No '{elementId}' ID found, skipping MDN features that would target it.")
+                continue
 
-        panels = True
-        if targetElement.tag in ["h1", "h2", "h3", "h4", "h5", "h6"]:
-            isAnnoForHeadingContent = True
-        else:
-            for ancestor in targetElement.iterancestors():
-                if ancestor.tag in [
-                    "body",
-                    "main",
-                    "article",
-                    "aside",
-                    "nav",
-                    "section",
-                    "header",
-                    "footer",
-                ]:
-                    break
-                targetElement = ancestor
-                if ancestor.tag in ["h1", "h2", "h3", "h4", "h5", "h6"]:
-                    isAnnoForHeadingContent = True
-                    break
-                if ancestor.tag in ["td", "dt", "dd", "li"]:
-                    isAnnoForListItemOrTableContent = True
-                    break
-                if ancestor.tag in ["pre", "xmp", "p"]:
-                    break
-        for feature in features:
-            if "engines" in feature:
-                engines = len(feature["engines"])
-                if engines < 2:
-                    lessThanTwoEngines = lessThanTwoEngines + 1
-                elif engines == 2:
-                    onlyTwoEngines = onlyTwoEngines + 1
-                elif engines >= len(browsersProvidingCurrentEngines):
-                    allEngines = allEngines + 1
-            featureDivs.append(
-                mdnPanelFor(
-                    feature,
-                    mdnBaseUrl,
-                    nameFromCodeName,
-                    browsersProvidingCurrentEngines,
-                    browsersWithBorrowedEngines,
-                    browsersWithRetiredEngines,
-                    browsersForMobileDevices,
+            panels = True
+            if targetElement.tag in ["h1", "h2", "h3", "h4", "h5", "h6"]:
+                isAnnoForHeadingContent = True
+            else:
+                for ancestor in targetElement.iterancestors():
+                    if ancestor.tag in [
+                        "body",
+                        "main",
+                        "article",
+                        "aside",
+                        "nav",
+                        "section",
+                        "header",
+                        "footer",
+                    ]:
+                        break
+                    targetElement = ancestor
+                    if ancestor.tag in ["h1", "h2", "h3", "h4", "h5", "h6"]:
+                        isAnnoForHeadingContent = True
+                        break
+                    if ancestor.tag in ["td", "dt", "dd", "li"]:
+                        isAnnoForListItemOrTableContent = True
+                        break
+                    if ancestor.tag in ["pre", "xmp", "p"]:
+                        break
+            for feature in features:
+                if "engines" in feature:
+                    engines = len(feature["engines"])
+                    if engines < 2:
+                        lessThanTwoEngines = lessThanTwoEngines + 1
+                    elif engines == 2:
+                        onlyTwoEngines = onlyTwoEngines + 1
+                    elif engines >= len(browsersProvidingCurrentEngines):
+                        allEngines = allEngines + 1
+                featureDivs.append(
+                    mdnPanelFor(
+                        feature,
+                        mdnBaseUrl,
+                        nameFromCodeName,
+                        browsersProvidingCurrentEngines,
+                        browsersWithBorrowedEngines,
+                        browsersWithRetiredEngines,
+                        browsersForMobileDevices,
+                    )
                 )
-            )
 
-        mdnButton = h.E.button({"class": "mdn-anno-btn"})
-        if lessThanTwoEngines > 0:
-            h.appendChild(
-                mdnButton,
-                h.E.b(
-                    {
-                        "class": "less-than-two-engines-flag",
-                        "title": _("This feature is in less than two current engines."),
-                    },
-                    "\u26A0",
-                ),
-            )
-        elif allEngines > 0 and lessThanTwoEngines == 0 and onlyTwoEngines == 0:
-            h.appendChild(
-                mdnButton,
-                h.E.b(
-                    {
-                        "class": "all-engines-flag",
-                        "title": _("This feature is in all current engines."),
-                    },
-                    "\u2714",
-                ),
-            )
-        h.appendChild(mdnButton, h.E.span("MDN"))
+            mdnButton = h.E.button({"class": "mdn-anno-btn"})
+            if lessThanTwoEngines > 0:
+                h.appendChild(
+                    mdnButton,
+                    h.E.b(
+                        {
+                            "class": "less-than-two-engines-flag",
+                            "title": _("This feature is in less than two current engines."),
+                        },
+                        "\u26A0",
+                    ),
+                )
+            elif allEngines > 0 and lessThanTwoEngines == 0 and onlyTwoEngines == 0:
+                h.appendChild(
+                    mdnButton,
+                    h.E.b(
+                        {
+                            "class": "all-engines-flag",
+                            "title": _("This feature is in all current engines."),
+                        },
+                        "\u2714",
+                    ),
+                )
+            h.appendChild(mdnButton, h.E.span("MDN"))
 
-        if isAnnoForListItemOrTableContent:
-            firstChild = None
-            if h.hasChildElements(targetElement):
-                firstChild = list(h.childElements(targetElement))[0]
-            if (
-                firstChild is not None
-                and h.hasClass(doc, firstChild, "mdn-anno")
-                and not h.hasClass(doc, firstChild, "after")
-            ):
-                # If there's already an annotation at the point where we want
-                # this, just re-use it (instead of creating another one).
-                h.appendChild(firstChild, featureDivs)
-            else:
-                # For elements we're annotating inside a dt, dd, li, or td, we
-                # prepend the annotation to the dt, dd, li, or td — because in
-                # cases where we have a long table or list, all the annotations
-                # for everything in it otherwise ends up being merged into a
-                # single annotation way up at the top of the table or list.
-                h.prependChild(targetElement, createAnno("mdn-anno wrapped", mdnButton, featureDivs))
-        elif isAnnoForHeadingContent:
-            nextEl = targetElement.getnext()
-            if nextEl is not None and h.hasClass(doc, nextEl, "mdn-anno") and h.hasClass(doc, nextEl, "after"):
-                # If there's already an "after" annotation
-                # at the point where we want this,
-                # just re-use it (instead of creating another one).
-                h.appendChild(nextEl, featureDivs)
-            else:
-                # For elements we're annotating inside an h1-h6 heading, we
-                # insert the annotation as the next sibling of the heading.
-                h.insertAfter(targetElement, createAnno("mdn-anno wrapped after", mdnButton, featureDivs))
-        else:
-            prevEl = targetElement.getprevious()
-            if prevEl is not None and h.hasClass(doc, prevEl, "mdn-anno") and not h.hasClass(doc, prevEl, "after"):
-                # If there's already an annotation at the point where we want
-                # this, just re-use it (instead of creating another one) —
-                # unless it's a class=after annotation (following a heading).
-                h.appendChild(prevEl, featureDivs)
+            if isAnnoForListItemOrTableContent:
+                firstChild = None
+                if h.hasChildElements(targetElement):
+                    firstChild = list(h.childElements(targetElement))[0]
+                if (
+                    firstChild is not None
+                    and h.hasClass(doc, firstChild, "mdn-anno")
+                    and not h.hasClass(doc, firstChild, "after")
+                ):
+                    # If there's already an annotation at the point where we want
+                    # this, just re-use it (instead of creating another one).
+                    h.appendChild(firstChild, featureDivs)
+                else:
+                    # For elements we're annotating inside a dt, dd, li, or td, we
+                    # prepend the annotation to the dt, dd, li, or td — because in
+                    # cases where we have a long table or list, all the annotations
+                    # for everything in it otherwise ends up being merged into a
+                    # single annotation way up at the top of the table or list.
+                    h.prependChild(targetElement, createAnno("mdn-anno wrapped", mdnButton, featureDivs))
+            elif isAnnoForHeadingContent:
+                nextEl = targetElement.getnext()
+                if nextEl is not None and h.hasClass(doc, nextEl, "mdn-anno") and h.hasClass(doc, nextEl, "after"):
+                    # If there's already an "after" annotation
+                    # at the point where we want this,
+                    # just re-use it (instead of creating another one).
+                    h.appendChild(nextEl, featureDivs)
+                else:
+                    # For elements we're annotating inside an h1-h6 heading, we
+                    # insert the annotation as the next sibling of the heading.
+                    h.insertAfter(targetElement, createAnno("mdn-anno wrapped after", mdnButton, featureDivs))
             else:
-                # For elements we're annotating that aren't inside a table or
-                # list or heading, we insert the annotation as the previous
-                # sibling of whatever block-level element holds the element.
-                h.insertBefore(targetElement, createAnno("mdn-anno wrapped", mdnButton, featureDivs))
+                prevEl = targetElement.getprevious()
+                if prevEl is not None and h.hasClass(doc, prevEl, "mdn-anno") and not h.hasClass(doc, prevEl, "after"):
+                    # If there's already an annotation at the point where we want
+                    # this, just re-use it (instead of creating another one) —
+                    # unless it's a class=after annotation (following a heading).
+                    h.appendChild(prevEl, featureDivs)
+                else:
+                    # For elements we're annotating that aren't inside a table or
+                    # list or heading, we insert the annotation as the previous
+                    # sibling of whatever block-level element holds the element.
+                    h.insertBefore(targetElement, createAnno("mdn-anno wrapped", mdnButton, featureDivs))
     return panels
 
 
@@ -13,6 +13,16 @@ messages = set()
 messageCounts: dict[str, int]
 messageCounts = Counter()
 
+# While this is a list, every distinct fatal/link/lint/warning message
+# also gets logged to it, so the output cache can replay them later.
+messageLog: list[tuple[str, str, str | int | None]] | None
+messageLog = None
+
+# Every fatal/link/lint/warning message, even the ones suppressed as duplicates,
+# so callers can tell whether a piece of code complained about anything.
+messageAttempts: int
+messageAttempts = 0
+
 
 def p(msg: str | tuple[str, str], sep: str | None = None, end: str | None = None) -> None:
     if constants.quiet == float("infinity"):
@@ -40,12 +50,16 @@ def p(msg: str | tuple[str, str], sep: str | None = None, end: str | None = None
 
 
 def die(msg: str, el: t.ElementT | None = None, lineNum: str | int | None = None) -> None:
+    global messageAttempts
+    messageAttempts += 1
     if lineNum is None and el is not None and el.get("line-number"):
         lineNum = el.get("line-number")
     formattedMsg = formatMessage("fatal", msg, lineNum=lineNum)
     if formattedMsg not in messages:
         messageCounts["fatal"] += 1
         messages.add(formattedMsg)
+        if messageLog is not None:
+            messageLog.append(("fatal", msg, lineNum))
         if constants.quiet < 3:
             p(formattedMsg)
     if constants.errorLevelAt("fatal"):
@@ -53,6 +67,8 @@ def die(msg: str, el: t.ElementT | None = None, lineNum: str | int | None = None
 
 
 def linkerror(msg: str, el: t.ElementT | None = None, lineNum: str | int | None = None) -> None:
+    global messageAttempts
+    messageAttempts += 1
     if lineNum is None and el is not None and el.get("line-number"):
         lineNum = el.get("line-number")
     suffix = ""
@@ -65,6 +81,8 @@ def linkerror(msg: str, el: t.ElementT | None = None, lineNum: str | int | None
     if formattedMsg not in messages:
         messageCounts["linkerror"] += 1
         messages.add(formattedMsg)
+        if messageLog is not None:
+            messageLog.append(("link", msg + suffix, lineNum))
         if constants.quiet < 2:
             p(formattedMsg)
     if constants.errorLevelAt("link-error"):
@@ -72,6 +90,8 @@ def linkerror(msg: str, el: t.ElementT | None = None, lineNum: str | int | None
 
 
 def lint(msg: str, el: t.ElementT | None = None, lineNum: str | int | None = None) -> None:
+    global messageAttempts
+    messageAttempts += 1
     if lineNum is None and el is not None and el.get("line-number"):
         lineNum = el.get("line-number")
     suffix = ""
@@ -84,6 +104,8 @@ def lint(msg: str, el: t.ElementT | None = None, lineNum: str | int | None = Non
     if formattedMsg not in messages:
         messageCounts["lint"] += 1
         messages.add(formattedMsg)
+        if messageLog is not None:
+            messageLog.append(("lint", msg + suffix, lineNum))
         if constants.quiet < 1:
             p(formattedMsg)
     if constants.errorLevelAt("lint"):
@@ -91,12 +113,16 @@ def lint(msg: str, el: t.ElementT | None = None, lineNum: str | int | None = Non
 
 
 def warn(msg: str, el: t.ElementT | None = None, lineNum: str | int | None = None) -> None:
+    global messageAttempts
+    messageAttempts += 1
     if lineNum is None and el is not None and el.get("line-number"):
         lineNum = el.get("line-number")
     formattedMsg = formatMessage("warning", msg, lineNum=lineNum)
     if formattedMsg not in messages:
         messageCounts["warning"] += 1
         messages.add(formattedMsg)
+        if messageLog is not None:
+            messageLog.append(("warning", msg, lineNum))
         if constants.quiet < 1:
             p(formattedMsg)
     if constants.errorLevelAt("warning"):
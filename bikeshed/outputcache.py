@@ -0,0 +1,262 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+from datetime import datetime
+
+from . import config, constants, InputSource, messages as m, t
+
+# An optional on-disk cache of finished specs, for `bikeshed spec --cache-dir`.
+#
+# Each entry is keyed by a hash of everything that's known before the build starts:
+# the input file, the command-line metadata and options,
+# the Bikeshed code, and the spec-data manifest.
+# The entry then records the content hashes of every file the build read
+# (the doc's transitiveDependencies, plus a few files Bikeshed only looks for),
+# anything else the output turned out to depend on (today's date, the spec's git revision/repository),
+# the build's messages, and the serialized output.
+#
+# On a hit, the messages are replayed (so the counts, result message, and --die-on behave the same)
+# and the stored output is written directly, skipping the whole build.
+#
+# Builds that depend on things the cache can't check
+# (the network, code execution, non-file inputs, files that changed mid-build)
+# are simply never stored.
+
+FORMAT_VERSION = 1
+
+# Files Bikeshed checks for next to the spec without recording them as dependencies.
+localDataFiles = ["anchors.bsdata", "link-defaults.infotree"]
+# Kinds of files Bikeshed might pick up from next to the spec just by them existing.
+siblingSuffixes = (".include", ".bsdata", ".infotree")
+
+
+class OutputCache:
+    def __init__(self, cacheDir: str) -> None:
+        self.cacheDir = cacheDir
+        # The key of the build in progress, if it's one that can be cached.
+        self.key: str | None = None
+        self.buildStart: float = 0
+
+    def replay(self, doc: t.SpecT, outputFilename: str | None) -> bool:
+        """
+        If there's a fresh entry for the doc, replays its messages, writes its output, and returns True.
+        Otherwise, starts recording the build's messages for store() and returns False.
+        """
+        self.key = None
+        m.messageLog = None
+        if not isCacheable(doc):
+            return False
+        key = cacheKey(doc)
+        entry = self.loadEntry(key)
+        if entry is not None and entryIsFresh(entry, doc):
+            replayMessages(entry["messages"])
+            doc.printResultMessage()
+            if not constants.dryRun:
+                doc.saveOutput(entry["output"], doc.fixMissingOutputFilename(outputFilename))
+            return True
+        self.key = key
+        self.buildStart = time.time()
+        m.messageLog = []
+        return False
+
+    def store(self, doc: t.SpecT, rendered: str) -> None:
+        log = m.messageLog
+        m.messageLog = None
+        if self.key is None or log is None:
+            return
+        key = self.key
+        self.key = None
+        if doc.md.inlineGithubIssues or "broken-links" in doc.md.complainAbout:
+            # Depends on the network.
+            return
+
+        dependencies: dict[str, str | None] = {}
+        sources: list[InputSource.InputSource] = list(doc.transitiveDependencies)
+        sources.extend(t.cast(InputSource.InputSource, doc.inputSource.relative(name)) for name in localDataFiles)
+        for source in sources:
+            if not isinstance(source, InputSource.FileInputSource):
+                return
+            path = os.path.abspath(source.sourceName)
+            mtime = source.mtime()
+            if mtime is not None and mtime >= self.buildStart:
+                # Changed while the build was running,
+                # so the output might not match what's on disk now.
+                return
+            dependencies[path] = fileHash(path)
+
+        entry = {
+            "version": FORMAT_VERSION,
+            "dependencies": dependencies,
+            "conditions": buildConditions(doc),
+            "messages": log,
+            "output": rendered,
+        }
+        try:
+            os.makedirs(self.cacheDir, exist_ok=True)
+            # Write to a temp file and swap it in,
+            # so a concurrent build never sees a half-written entry.
+            fd, tempPath = tempfile.mkstemp(dir=self.cacheDir, suffix=".tmp")
+            with open(fd, "w", encoding="utf-8") as fh:
+                json.dump(entry, fh)
+            os.replace(tempPath, self.entryPath(key))
+        except OSError as e:
+            m.say(f"Couldn't save the output to the cache in '{self.cacheDir}':\n{e}")
+
+    def entryPath(self, key: str) -> str:
+        return os.path.join(self.cacheDir, key + ".json")
+
+    def loadEntry(self, key: str) -> dict[str, t.Any] | None:
+        try:
+            with open(self.entryPath(key), encoding="utf-8") as fh:
+                entry = json.load(fh)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(entry, dict) or entry.get("version") != FORMAT_VERSION:
+            return None
+        return entry
+
+
+def isCacheable(doc: t.SpecT) -> bool:
+    if not doc.valid or doc.lineNumbers or constants.executeCode:
+        return False
+    # Other input types can change without anything on disk changing.
+    return isinstance(doc.inputSource, InputSource.FileInputSource)
+
+
+def cacheKey(doc: t.SpecT) -> str:
+    hasher = hashlib.sha256()
+
+    def add(label: str, value: t.Any) -> None:
+        hasher.update(json.dumps([label, value], sort_keys=True, default=str).encode("utf-8"))
+        hasher.update(b"\n")
+
+    add("format", FORMAT_VERSION)
+    add("bikeshed", bikeshedFingerprint())
+    add("spec-data", specDataFingerprint(doc))
+    add("input", os.path.abspath(doc.inputSource.sourceName))
+    add("content", hashlib.sha256("".join(line.text for line in doc.lines).encode("utf-8")).hexdigest())
+    if doc.mdBaseline is not None:
+        add("date", doc.mdBaseline.date)
+    if doc.mdCommandLine is not None:
+        add("command-line", doc.mdCommandLine.allData)
+    add("options", [constants.chroot, constants.htmlParser, doc.debug, doc.testing])
+    # Read from the current directory.
+    add("biblio.json", fileHash("biblio.json"))
+    # New files appearing next to the spec (like a local boilerplate override)
+    # can change the output without being a dependency yet.
+    try:
+        siblings = sorted(name for name in os.listdir(doc.inputSource.directory()) if name.endswith(siblingSuffixes))
+    except OSError:
+        siblings = None
+    add("siblings", siblings)
+    return hasher.hexdigest()
+
+
+def buildConditions(doc: t.SpecT) -> dict[str, str | None]:
+    # Things outside of any file that this particular build's output depended on.
+    conditions: dict[str, str | None] = {}
+    today = datetime.utcnow().date()
+    if doc.md.date == today or doc.md.expires is not None:
+        conditions["date"] = today.isoformat()
+    if "document-revision" in doc.md.boilerplate:
+        conditions["revision"] = specRevision(doc)
+    if "Repository" not in doc.md.manuallySetKeys:
+        conditions["repository"] = specRepository(doc)
+    return conditions
+
+
+def entryIsFresh(entry: dict[str, t.Any], doc: t.SpecT) -> bool:
+    for path, digest in entry["dependencies"].items():
+        if fileHash(path) != digest:
+            return False
+    conditions = entry["conditions"]
+    if "date" in conditions and conditions["date"] != datetime.utcnow().date().isoformat():
+        return False
+    if "revision" in conditions and conditions["revision"] != specRevision(doc):
+        return False
+    if "repository" in conditions and conditions["repository"] != specRepository(doc):
+        return False
+    return True
+
+
+def specRevision(doc: t.SpecT) -> str | None:
+    from . import boilerplate
+
+    return boilerplate.getSpecRevision(doc)
+
+
+def specRepository(doc: t.SpecT) -> str | None:
+    from . import metadata
+
+    repo = metadata.getSpecRepository(doc)
+    return repo.url if repo else None
+
+
+def replayMessages(log: list[list[t.Any]]) -> None:
+    replayers = {
+        "fatal": m.die,
+        "link": m.linkerror,
+        "lint": m.lint,
+        "warning": m.warn,
+    }
+    for kind, msg, lineNum in log:
+        replayers[kind](msg, lineNum=lineNum)
+
+
+def fileHash(path: str) -> str | None:
+    try:
+        with open(path, "rb") as fh:
+            return hashlib.sha256(fh.read()).hexdigest()
+    except OSError:
+        return None
+
+
+_bikeshedFingerprint: str | None = None
+
+
+def bikeshedFingerprint() -> str:
+    # Bikeshed's own files (apart from spec-data, which the manifest covers),
+    # fingerprinted by stat() rather than content, since there are a lot of them.
+    global _bikeshedFingerprint  # pylint: disable=global-statement
+    if _bikeshedFingerprint is None:
+        hasher = hashlib.sha256()
+        root = config.scriptPath()
+        for dirPath, dirNames, fileNames in os.walk(root):
+            dirNames[:] = sorted(d for d in dirNames if d not in ("spec-data", "__pycache__"))
+            for name in sorted(fileNames):
+                path = os.path.join(dirPath, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                hasher.update(f"{os.path.relpath(path, root)} {stat.st_size} {stat.st_mtime_ns}\n".encode("utf-8"))
+        for extra in (config.scriptPath("..", "semver.txt"), config.scriptPath("..", ".git", "logs", "HEAD")):
+            # The generator <meta> can also come from Bikeshed's git history.
+            try:
+                stat = os.stat(extra)
+                hasher.update(f"{extra} {stat.st_size} {stat.st_mtime_ns}\n".encode("utf-8"))
+            except OSError:
+                pass
+        _bikeshedFingerprint = hasher.hexdigest()
+    return _bikeshedFingerprint
+
+
+def specDataFingerprint(doc: t.SpecT) -> list[str | None]:
+    # The manifest lists the hash of every spec-data file;
+    # its first line is just the time it was generated.
+    fingerprints: list[str | None] = []
+    requester: t.DataFileRequester | None = doc.dataFile
+    while requester is not None:
+        try:
+            with open(requester.path("manifest.txt"), encoding="utf-8") as fh:
+                body = fh.read().partition("\n")[2]
+            fingerprints.append(hashlib.sha256(body.encode("utf-8")).hexdigest())
+        except OSError:
+            fingerprints.append(None)
+        fingerprints.append(fileHash(requester.path("bikeshed-version.txt")))
+        requester = requester.fallback
+    return fingerprints
@@ -0,0 +1,374 @@
+from __future__ import annotations
+
+import hashlib
+import mmap
+import os
+import struct
+
+from .. import messages as m, t
+from . import utils, wrapper
+
+if t.TYPE_CHECKING:
+    from ..retrieve import DataFileRequester
+
+# A prebuilt, memory-mappable index over the anchors/anchors-XX.data files,
+# so RefSource can look up a key without parsing the text data.
+#
+# All integers are little-endian u32.
+#
+# header:
+#     magic ("BSAI"), format version,
+#     fingerprint (32 ascii bytes, see anchorDataFingerprint()),
+#     key count, string count, stem count,
+#     key table offset, string table offset, string data offset, record area offset,
+#     stem table offset, stem keys offset
+# key table (sorted by the utf-8 bytes of the key):
+#     key string id, record offset (relative to the record area), ref count
+# stem table (sorted by the utf-8 bytes of the stem, see utils.linkTextStem()),
+# mapping each normalized link text to every key its variations can match:
+#     stem string id, first position in the stem keys, key count
+# stem keys:
+#     key table indexes, grouped by stem
+# string table:
+#     string count + 1 offsets into the string data
+# string data:
+#     all the distinct strings, utf-8 encoded, back to back
+# record area, for each ref:
+#     type, spec, shortname, level, status, url (string ids),
+#     flags (1 = export, 2 = normative),
+#     for count, then that many for-value string ids
+
+MAGIC = b"BSAI"
+VERSION = 2
+FILENAME = "anchors.idx"
+
+_header = struct.Struct("<4sI32s9I")
+_keyEntry = struct.Struct("<3I")
+_stemEntry = struct.Struct("<3I")
+_u32 = struct.Struct("<I")
+_refEntry = struct.Struct("<8I")
+
+_EXPORT = 1
+_NORMATIVE = 2
+
+
+class AnchorIndex:
+    __slots__ = [
+        "_mm",
+        "fingerprint",
+        "keyCount",
+        "stemCount",
+        "_keyTable",
+        "_stringTable",
+        "_stringData",
+        "_records",
+        "_stemTable",
+        "_stemKeys",
+        "_strings",
+        "_keysByStem",
+    ]
+
+    def __init__(self, mm: mmap.mmap | bytes):
+        self._mm = mm
+        self.keyCount: int
+        self.stemCount: int
+        self._keyTable: int
+        self._stringTable: int
+        self._stringData: int
+        self._records: int
+        self._stemTable: int
+        self._stemKeys: int
+        (
+            magic,
+            version,
+            fingerprint,
+            self.keyCount,
+            _,
+            self.stemCount,
+            self._keyTable,
+            self._stringTable,
+            self._stringData,
+            self._records,
+            self._stemTable,
+            self._stemKeys,
+        ) = _header.unpack_from(mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("Not a compatible anchor index.")
+        self.fingerprint: str = fingerprint.decode("ascii")
+        # Decoded strings, by id, as they're requested.
+        self._strings: dict[int, str] = {}
+        # Decoded stem groups, by stem, as they're requested.
+        self._keysByStem: dict[str, frozenset[str]] = {}
+
+    def _rawString(self, id: int) -> bytes:
+        start, end = struct.unpack_from("<2I", self._mm, self._stringTable + id * 4)
+        return self._mm[self._stringData + start : self._stringData + end]
+
+    def _string(self, id: int) -> str:
+        s = self._strings.get(id)
+        if s is None:
+            s = self._rawString(id).decode("utf-8")
+            self._strings[id] = s
+        return s
+
+    def _findKey(self, key: str) -> int | None:
+        # Binary search over the key table,
+        # returning the index of the matching entry.
+        target = key.encode("utf-8")
+        lo = 0
+        hi = self.keyCount
+        while lo < hi:
+            mid = (lo + hi) // 2
+            keyId = _u32.unpack_from(self._mm, self._keyTable + mid * _keyEntry.size)[0]
+            candidate = self._rawString(keyId)
+            if candidate < target:
+                lo = mid + 1
+            elif candidate > target:
+                hi = mid
+            else:
+                return mid
+        return None
+
+    def keysWithStem(self, stem: str) -> frozenset[str]:
+        """
+        Returns every key whose utils.linkTextStem() is the given stem;
+        that is, every key that any variation of a text with that stem could be.
+        """
+        keys = self._keysByStem.get(stem)
+        if keys is not None:
+            return keys
+        target = stem.encode("utf-8")
+        lo = 0
+        hi = self.stemCount
+        keys = frozenset()
+        while lo < hi:
+            mid = (lo + hi) // 2
+            stemId, start, count = _stemEntry.unpack_from(self._mm, self._stemTable + mid * _stemEntry.size)
+            candidate = self._rawString(stemId)
+            if candidate < target:
+                lo = mid + 1
+            elif candidate > target:
+                hi = mid
+            else:
+                positions = struct.unpack_from(f"<{count}I", self._mm, self._stemKeys + start * 4)
+                keys = frozenset(
+                    self._string(_u32.unpack_from(self._mm, self._keyTable + i * _keyEntry.size)[0]) for i in positions
+                )
+                break
+        self._keysByStem[stem] = keys
+        return keys
+
+    def _refsAt(self, i: int, string: t.Callable[[int], str] | None = None) -> tuple[str, list[t.RefWrapper]]:
+        if string is None:
+            string = self._string
+        mm = self._mm
+        keyId, offset, count = _keyEntry.unpack_from(mm, self._keyTable + i * _keyEntry.size)
+        key = string(keyId)
+        pos = self._records + offset
+        refs = []
+        for _ in range(count):
+            typeId, specId, shortnameId, levelId, statusId, urlId, flags, forCount = _refEntry.unpack_from(mm, pos)
+            pos += _refEntry.size
+            if forCount:
+                forVals = [string(x) for x in struct.unpack_from(f"<{forCount}I", mm, pos)]
+                pos += forCount * 4
+            else:
+                forVals = []
+            data: wrapper.RefDataT = {
+                "type": string(typeId),
+                "spec": string(specId),
+                "shortname": string(shortnameId),
+                "level": string(levelId),
+                "status": string(statusId),
+                "url": string(urlId),
+                "export": bool(flags & _EXPORT),
+                "normative": bool(flags & _NORMATIVE),
+                "for_": forVals,
+            }
+            refs.append(wrapper.RefWrapper(key, data))
+        return key, refs
+
+    def refsForKey(self, key: str) -> list[t.RefWrapper]:
+        i = self._findKey(key)
+        if i is None:
+            return []
+        return self._refsAt(i)[1]
+
+    def __contains__(self, key: str) -> bool:
+        return self._findKey(key) is not None
+
+    def items(self) -> t.Generator[tuple[str, list[t.RefWrapper]], None, None]:
+        # Going to touch every string anyway, so decode them all up front.
+        stringCount = _header.unpack_from(self._mm, 0)[4]
+        offsets = struct.unpack_from(f"<{stringCount + 1}I", self._mm, self._stringTable)
+        data = self._mm[self._stringData : self._records]
+        strings = [data[start:end].decode("utf-8") for start, end in zip(offsets, offsets[1:])]
+        for i in range(self.keyCount):
+            yield self._refsAt(i, strings.__getitem__)
+
+
+def anchorDataFingerprint(manifestText: str) -> str | None:
+    """
+    Hashes the anchors/ lines of a spec-data manifest,
+    so an index can tell whether it was built from the anchor data currently on disk.
+    """
+    lines = [line for line in manifestText.splitlines() if " anchors/" in line]
+    if not lines:
+        return None
+    return hashlib.md5("\n".join(lines).encode("utf-8")).hexdigest()
+
+
+def openAnchorIndex(dataFile: DataFileRequester) -> AnchorIndex | None:
+    """
+    Opens the anchor index for the given requester (or its fallbacks),
+    returning None if there isn't one that matches the current anchor data.
+    """
+    requester: DataFileRequester | None = dataFile
+    while requester is not None:
+        index = _openIndexAt(requester.path(FILENAME), requester.path("manifest.txt"))
+        if index is not None:
+            return index
+        requester = requester.fallback
+    return None
+
+
+_openedIndexes: dict[tuple[str, int, int], AnchorIndex] = {}
+
+
+def _openIndexAt(indexPath: str, manifestPath: str) -> AnchorIndex | None:
+    try:
+        stat = os.stat(indexPath)
+        with open(manifestPath, encoding="utf-8") as fh:
+            fingerprint = anchorDataFingerprint(fh.read())
+    except OSError:
+        return None
+    if fingerprint is None:
+        return None
+    cacheKey = (indexPath, stat.st_mtime_ns, stat.st_size)
+    index = _openedIndexes.get(cacheKey)
+    if index is None:
+        try:
+            with open(indexPath, "rb") as fh:
+                mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+            index = AnchorIndex(mm)
+        except (OSError, ValueError, struct.error):
+            return None
+        _openedIndexes[cacheKey] = index
+    if index.fingerprint != fingerprint:
+        # Built from older anchor data; ignore it until the next update rebuilds it.
+        return None
+    return index
+
+
+def buildAnchorIndex(path: str, dryRun: bool = False) -> str | None:
+    """
+    Builds the anchor index from the anchors/ folder and manifest.txt in the given spec-data folder.
+    Returns the path of the written index, or None if it couldn't be built.
+    """
+    try:
+        with open(os.path.join(path, "manifest.txt"), encoding="utf-8") as fh:
+            fingerprint = anchorDataFingerprint(fh.read())
+    except OSError:
+        fingerprint = None
+    if fingerprint is None:
+        m.warn("Couldn't fingerprint the anchor data, so the anchor index wasn't built.")
+        return None
+
+    anchors: dict[str, list[t.RefWrapper]] = {}
+    try:
+        for filename in sorted(os.listdir(os.path.join(path, "anchors"))):
+            with open(os.path.join(path, "anchors", filename), encoding="utf-8") as fh:
+                for key, refs in utils.decodeAnchors(fh).items():
+                    anchors.setdefault(key, []).extend(refs)
+    except OSError as e:
+        m.warn(f"Couldn't read the anchor data, so the anchor index wasn't built.\n{e}")
+        return None
+
+    stringIds: dict[str, int] = {}
+
+    def stringId(s: str | None) -> int:
+        s = (s or "").rstrip("\n")
+        if s not in stringIds:
+            stringIds[s] = len(stringIds)
+        return stringIds[s]
+
+    keyTable = bytearray()
+    records = bytearray()
+    keysByStem: dict[str, list[int]] = {}
+    for i, key in enumerate(sorted(anchors, key=lambda x: x.encode("utf-8"))):
+        refs = anchors[key]
+        stem = utils.linkTextStem(key)
+        if stem is not None:
+            keysByStem.setdefault(stem, []).append(i)
+        keyTable += _keyEntry.pack(stringId(key), len(records), len(refs))
+        for ref in refs:
+            data = ref._ref  # pylint: disable=protected-access
+            forVals = data["for_"]
+            flags = (_EXPORT if data["export"] else 0) | (_NORMATIVE if data["normative"] else 0)
+            records += _refEntry.pack(
+                stringId(data["type"]),
+                stringId(data["spec"]),
+                stringId(data["shortname"]),
+                stringId(data["level"]),
+                stringId(data["status"]),
+                stringId(data["url"]),
+                flags,
+                len(forVals),
+            )
+            records += struct.pack(f"<{len(forVals)}I", *(stringId(x) for x in forVals))
+
+    stemTable = bytearray()
+    stemKeys = bytearray()
+    for stem in sorted(keysByStem, key=lambda x: x.encode("utf-8")):
+        keyIndexes = keysByStem[stem]
+        stemTable += _stemEntry.pack(stringId(stem), len(stemKeys) // 4, len(keyIndexes))
+        stemKeys += struct.pack(f"<{len(keyIndexes)}I", *keyIndexes)
+
+    stringTable = bytearray()
+    stringData = bytearray()
+    for s in stringIds:
+        stringTable += _u32.pack(len(stringData))
+        stringData += s.encode("utf-8")
+    stringTable += _u32.pack(len(stringData))
+
+    keyTableOffset = _header.size
+    stringTableOffset = keyTableOffset + len(keyTable)
+    stringDataOffset = stringTableOffset + len(stringTable)
+    recordsOffset = stringDataOffset + len(stringData)
+    stemTableOffset = recordsOffset + len(records)
+    stemKeysOffset = stemTableOffset + len(stemTable)
+    header = _header.pack(
+        MAGIC,
+        VERSION,
+        fingerprint.encode("ascii"),
+        len(anchors),
+        len(stringIds),
+        len(keysByStem),
+        keyTableOffset,
+        stringTableOffset,
+        stringDataOffset,
+        recordsOffset,
+        stemTableOffset,
+        stemKeysOffset,
+    )
+
+    p = os.path.join(path, FILENAME)
+    if dryRun:
+        return p
+    try:
+        # Write to a temp file and swap it in,
+        # so a concurrent build never sees a half-written index.
+        tempPath = p + ".tmp"
+        with open(tempPath, "wb") as out:
+            out.write(header)
+            out.write(keyTable)
+            out.write(stringTable)
+            out.write(stringData)
+            out.write(records)
+            out.write(stemTable)
+            out.write(stemKeys)
+        os.replace(tempPath, p)
+    except Exception as e:
+        m.warn(f"Couldn't save the anchor index to disk.\n{e}")
+        return None
+    return p
@@ -0,0 +1,247 @@
+from __future__ import annotations
+
+import hashlib
+import mmap
+import os
+import struct
+from collections import defaultdict
+
+from .. import biblio, messages as m, t
+
+if t.TYPE_CHECKING:
+    from ..retrieve import DataFileRequester
+
+# A prebuilt, memory-mappable index over the biblio/biblio-XX.data files,
+# so biblio entries can be looked up (and built) one key at a time,
+# rather than parsing a whole group file for every key in it.
+#
+# All integers are little-endian u32.
+#
+# header:
+#     magic ("BSBI"), format version,
+#     fingerprint (32 ascii bytes, see biblioDataFingerprint()),
+#     key count, key table offset, key data offset, record data offset
+# key table (sorted by the utf-8 bytes of the key):
+#     key offset, key length (into the key data),
+#     record offset, record length (into the record data)
+# key data:
+#     all the keys, utf-8 encoded, back to back
+# record data:
+#     for each key, its entries' lines exactly as they appear in the biblio-XX.data files,
+#     utf-8 encoded, so biblio.loadBiblioDataFile() can build them
+
+MAGIC = b"BSBI"
+VERSION = 1
+FILENAME = "biblio.idx"
+
+_header = struct.Struct("<4sI32s4I")
+_keyEntry = struct.Struct("<4I")
+
+
+class BiblioIndex:
+    __slots__ = [
+        "_mm",
+        "fingerprint",
+        "keyCount",
+        "_keyTable",
+        "_keyData",
+        "_records",
+    ]
+
+    def __init__(self, mm: mmap.mmap | bytes):
+        self._mm = mm
+        self.keyCount: int
+        self._keyTable: int
+        self._keyData: int
+        self._records: int
+        (
+            magic,
+            version,
+            fingerprint,
+            self.keyCount,
+            self._keyTable,
+            self._keyData,
+            self._records,
+        ) = _header.unpack_from(mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("Not a compatible biblio index.")
+        self.fingerprint: str = fingerprint.decode("ascii")
+
+    def _rawKey(self, i: int) -> bytes:
+        keyOffset, keyLength, _, _ = _keyEntry.unpack_from(self._mm, self._keyTable + i * _keyEntry.size)
+        start = self._keyData + keyOffset
+        return self._mm[start : start + keyLength]
+
+    def _lowerBound(self, target: bytes) -> int:
+        # The index of the first key that's >= the target.
+        lo = 0
+        hi = self.keyCount
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._rawKey(mid) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def entriesForKey(self, key: str) -> list[biblio.BiblioEntry]:
+        target = key.encode("utf-8")
+        i = self._lowerBound(target)
+        if i >= self.keyCount or self._rawKey(i) != target:
+            return []
+        _, _, recordOffset, recordLength = _keyEntry.unpack_from(self._mm, self._keyTable + i * _keyEntry.size)
+        start = self._records + recordOffset
+        text = self._mm[start : start + recordLength].decode("utf-8")
+        storage: t.BiblioStorageT = defaultdict(list)
+        biblio.loadBiblioDataFile(iter(biblio.splitLines(text)), storage)
+        return storage[key]
+
+    def keysWithPrefix(self, prefix: str) -> list[str]:
+        # Keys are sorted by their utf-8 bytes,
+        # so all the keys starting with the prefix are in one run.
+        target = prefix.encode("utf-8")
+        keys = []
+        for i in range(self._lowerBound(target), self.keyCount):
+            rawKey = self._rawKey(i)
+            if not rawKey.startswith(target):
+                break
+            keys.append(rawKey.decode("utf-8"))
+        return keys
+
+
+def biblioDataFingerprint(manifestText: str) -> str | None:
+    """
+    Hashes the biblio/ lines of a spec-data manifest,
+    so an index can tell whether it was built from the biblio data currently on disk.
+    """
+    lines = [line for line in manifestText.splitlines() if " biblio/" in line]
+    if not lines:
+        return None
+    return hashlib.md5("\n".join(lines).encode("utf-8")).hexdigest()
+
+
+def openBiblioIndex(dataFile: DataFileRequester) -> BiblioIndex | None:
+    """
+    Opens the biblio index for the given requester (or its fallbacks),
+    returning None if there isn't one that matches the current biblio data.
+    """
+    requester: DataFileRequester | None = dataFile
+    while requester is not None:
+        index = _openIndexAt(requester.path(FILENAME), requester.path("manifest.txt"))
+        if index is not None:
+            return index
+        requester = requester.fallback
+    return None
+
+
+_openedIndexes: dict[tuple[str, int, int], BiblioIndex] = {}
+
+
+def _openIndexAt(indexPath: str, manifestPath: str) -> BiblioIndex | None:
+    try:
+        stat = os.stat(indexPath)
+        with open(manifestPath, encoding="utf-8") as fh:
+            fingerprint = biblioDataFingerprint(fh.read())
+    except OSError:
+        return None
+    if fingerprint is None:
+        return None
+    cacheKey = (indexPath, stat.st_mtime_ns, stat.st_size)
+    index = _openedIndexes.get(cacheKey)
+    if index is None:
+        try:
+            with open(indexPath, "rb") as fh:
+                mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+            index = BiblioIndex(mm)
+        except (OSError, ValueError, struct.error):
+            return None
+        _openedIndexes[cacheKey] = index
+    if index.fingerprint != fingerprint:
+        # Built from older biblio data; ignore it until the next update rebuilds it.
+        return None
+    return index
+
+
+def splitRecords(lines: list[str]) -> t.Generator[tuple[str, list[str]], None, None]:
+    # Splits the lines of a biblio-XX.data file into each entry's key and lines,
+    # consuming them the same way biblio.loadBiblioDataFile() does.
+    i = 0
+    while i < len(lines):
+        fullKey = lines[i]
+        prefix, key = fullKey[0], fullKey[2:].strip()
+        if prefix == "d":
+            # Nine fixed lines, then authors up to the "-".
+            end = i + 10
+            while end < len(lines) and lines[end] != "-\n":
+                end += 1
+        else:
+            # Two fixed lines, then the "-".
+            end = i + 3
+        yield key, lines[i : end + 1]
+        i = end + 1
+
+
+def buildBiblioIndex(path: str, dryRun: bool = False) -> str | None:
+    """
+    Builds the biblio index from the biblio/ folder and manifest.txt in the given spec-data folder.
+    Returns the path of the written index, or None if it couldn't be built.
+    """
+    try:
+        with open(os.path.join(path, "manifest.txt"), encoding="utf-8") as fh:
+            fingerprint = biblioDataFingerprint(fh.read())
+    except OSError:
+        fingerprint = None
+    if fingerprint is None:
+        m.warn("Couldn't fingerprint the biblio data, so the biblio index wasn't built.")
+        return None
+
+    records: defaultdict[str, list[str]] = defaultdict(list)
+    try:
+        for filename in sorted(os.listdir(os.path.join(path, "biblio"))):
+            with open(os.path.join(path, "biblio", filename), encoding="utf-8") as fh:
+                for key, lines in splitRecords(fh.readlines()):
+                    records[key].extend(lines)
+    except OSError as e:
+        m.warn(f"Couldn't read the biblio data, so the biblio index wasn't built.\n{e}")
+        return None
+
+    keyTable = bytearray()
+    keyData = bytearray()
+    recordData = bytearray()
+    for key in sorted(records, key=lambda x: x.encode("utf-8")):
+        rawKey = key.encode("utf-8")
+        rawRecord = "".join(records[key]).encode("utf-8")
+        keyTable += _keyEntry.pack(len(keyData), len(rawKey), len(recordData), len(rawRecord))
+        keyData += rawKey
+        recordData += rawRecord
+
+    keyTableOffset = _header.size
+    keyDataOffset = keyTableOffset + len(keyTable)
+    recordDataOffset = keyDataOffset + len(keyData)
+    header = _header.pack(
+        MAGIC,
+        VERSION,
+        fingerprint.encode("ascii"),
+        len(records),
+        keyTableOffset,
+        keyDataOffset,
+        recordDataOffset,
+    )
+
+    p = os.path.join(path, FILENAME)
+    if dryRun:
+        return p
+    try:
+        # Write to a temp file and swap it in,
+        # so a concurrent build never sees a half-written index.
+        tempPath = p + ".tmp"
+        with open(tempPath, "wb") as out:
+            out.write(header)
+            out.write(keyTable)
+            out.write(keyData)
+            out.write(recordData)
+        os.replace(tempPath, p)
+    except Exception as e:
+        m.warn(f"Couldn't save the biblio index to disk.\n{e}")
+        return None
+    return p
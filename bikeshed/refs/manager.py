@@ -1,13 +1,12 @@
 from __future__ import annotations
 
 import dataclasses
-import json
 import random
 import re
 from collections import defaultdict
 
 from .. import biblio, config, constants, h, messages as m, retrieve, t
-from . import utils, source, headingdata, wrapper
+from . import biblioindex, utils, source, headingdata, wrapper
 
 if t.TYPE_CHECKING:
     from .wrapper import RefWrapper
@@ -24,7 +23,11 @@ class ReferenceManager:
         "replacedSpecs",
         "biblios",
         "loadedBiblioGroups",
+        "indexedBiblioKeys",
+        "localBiblioKeys",
+        "_biblioIndex",
         "biblioKeys",
+        "_biblioKeyBigrams",
         "biblioNumericSuffixes",
         "preferredBiblioNames",
         "headings",
@@ -36,6 +39,7 @@ class ReferenceManager:
         "specLevel",
         "spec",
         "testing",
+        "refCache",
     ]
 
     def __init__(
@@ -68,10 +72,21 @@ class ReferenceManager:
         # Sparsely populated, with more loaded on demand
         self.biblios: defaultdict[str, list[biblio.BiblioEntry]] = defaultdict(list)
         self.loadedBiblioGroups: set[str] = set()
+        # When there's a biblio index, "loading" a group just marks it as loaded,
+        # and each of its keys is pulled from the index when first asked for.
+        self.indexedBiblioKeys: set[str] = set()
+        self._biblioIndex: biblioindex.BiblioIndex | None | t.Literal[False] = False
+        # The keys in self.biblios that came from somewhere other than the biblio data
+        # (biblio.json, the doc's own biblio blocks, the hardcoded RFC2119),
+        # which the index doesn't know about.
+        self.localBiblioKeys: set[str] = set()
 
         # Most of the biblio keys, for biblio near-miss correction
         # (Excludes dated versions, and all huge "foo\d+" groups that can't usefully correct typos.)
         self.biblioKeys: set[str] = set()
+        # The bigram index of biblioKeys, for findCloseBiblios().
+        # Only built once it's first needed (it's just for error messages), then kept up to date.
+        self._biblioKeyBigrams: biblio.BigramPostingsT | None = None
 
         # Dict of {suffixless key => [keys with numeric suffixes]}
         # (So you can tell when it's appropriate to default a numeric-suffix ref to a suffixless one.)
@@ -102,6 +117,19 @@ class ReferenceManager:
         self.specLevel: str | None = None
         self.spec: str | None = None
 
+        # Dict of {getRef() arguments => result}
+        # Cleared whenever the refs that getRef() searches change.
+        self.refCache: dict[tuple, RefWrapper | None] = {}
+
+    def reuseDataFrom(self, other: ReferenceManager) -> None:
+        """
+        Takes over the doc-independent data another ReferenceManager has already loaded,
+        so it doesn't get loaded all over again.
+        Used by watch mode between rebuilds; call it before initializeRefs().
+        """
+        self.foreignRefs.loadedAnchors = other.foreignRefs.loadedAnchors
+        self.foreignRefs.methods = other.foreignRefs.methods
+
     def initializeRefs(self, datablocks: t.ModuleType, doc: t.SpecT | None = None) -> None:
         """
         Load up the xref data
@@ -109,27 +137,29 @@ class ReferenceManager:
         """
 
         def initSpecs() -> None:
-            self.specs.update(json.loads(self.dataFile.fetch("specs.json", str=True)))
+            self.specs.update(self.dataFile.fetchParsed("specs.json"))
 
         initSpecs()
 
         def initMethods() -> None:
-            for arglessSig, argfulls in json.loads(self.dataFile.fetch("methods.json", str=True)).items():
+            for arglessSig, argfulls in self.dataFile.fetchParsed("methods.json").items():
                 variants = source.MethodVariants(arglessSig, {})
                 self.foreignRefs.methods[arglessSig] = variants
                 for argfullSig, data in argfulls.items():
                     variants.variants[argfullSig] = source.MethodVariant(
-                        argfullSig, data["args"], data["for"], data["shortname"]
+                        argfullSig, list(data["args"]), list(data["for"]), data["shortname"]
                     )
 
-        initMethods()
+        # (Already filled in if the data was reused from a previous build.)
+        if not self.foreignRefs.methods:
+            initMethods()
 
         def initFors() -> None:
-            self.foreignRefs.fors.update(json.loads(self.dataFile.fetch("fors.json", str=True)))
+            self.foreignRefs.fors.update(self.dataFile.fetchParsed("fors.json"))
 
         initFors()
         if doc and doc.inputSource and doc.inputSource.hasDirectory:
-            ldLines = self.dataFile.fetch("link-defaults.infotree").read().split("\n")
+            ldLines = self.dataFile.fetchParsed("link-defaults.infotree", parser=str).split("\n")
             datablocks.transformInfo(lines=ldLines, doc=doc, firstLine=ldLines[0], tagName="pre", lineNum=None)
 
             # Get local anchor data
@@ -183,15 +213,14 @@ class ReferenceManager:
     def fetchHeadings(self, spec: str) -> headingdata.SpecHeadings:
         if spec in self.headings:
             return self.headings[spec]
-        with self.dataFile.fetch("headings", f"headings-{spec}.json", okayToFail=True) as fh:
-            try:
-                data = json.load(fh)
-            except ValueError:
-                # JSON couldn't be decoded, *should* only be because of empty file
-                data = {}
-            specHeadings = headingdata.SpecHeadings(spec, data)
-            self.headings[spec] = specHeadings
-            return specHeadings
+        try:
+            data = self.dataFile.fetchParsed("headings", f"headings-{spec}.json")
+        except (OSError, ValueError):
+            # Missing, or JSON couldn't be decoded (*should* only be because of empty file)
+            data = {}
+        specHeadings = headingdata.SpecHeadings(spec, data)
+        self.headings[spec] = specHeadings
+        return specHeadings
 
     def fetchHeading(
         self, spec: str, id: str, status: str | None = None, el: t.ElementT | None = None
@@ -202,8 +231,8 @@ class ReferenceManager:
         return specHeadings.get(id, status, el)
 
     def initializeBiblio(self) -> None:
-        self.biblioKeys.update(json.loads(self.dataFile.fetch("biblio-keys.json", str=True)))
-        self.biblioNumericSuffixes.update(json.loads(self.dataFile.fetch("biblio-numeric-suffixes.json", str=True)))
+        self.addBiblioKeys(self.dataFile.fetchParsed("biblio-keys.json"))
+        self.biblioNumericSuffixes.update(self.dataFile.fetchParsed("biblio-numeric-suffixes.json"))
 
         # Get local bibliography data
         try:
@@ -213,13 +242,12 @@ class ReferenceManager:
         except OSError:
             # Missing file is fine
             pass
-        for k, vs in storage.items():
-            self.biblioKeys.add(k)
-            self.biblios[k].extend(vs)
+        self.addLocalBiblios(storage)
 
         # Hardcode RFC2119, used in most spec's boilerplates,
         # to avoid having to parse the entire biblio-rf.data file for this single reference.
-        self.biblioKeys.add("rfc2119")
+        self.addBiblioKeys(["rfc2119"])
+        self.localBiblioKeys.add("rfc2119")
         self.biblios["rfc2119"].append(
             biblio.NormalBiblioEntry(
                 linkText="rfc2119",
@@ -250,15 +278,22 @@ class ReferenceManager:
         # Need to get a real versioned shortname,
         # with the possibility of overriding the "shortname-level" pattern.
         self.removeSameSpecRefs()
+        self.refCache.clear()
 
     def removeSameSpecRefs(self) -> None:
         # Kill all the non-local anchors with the same shortname as the current spec,
         # so you don't end up accidentally linking to something that's been removed from the local copy.
         # TODO: This is dumb.
-        for _, refs in self.foreignRefs.refs.items():
+        # (The refs are shared with foreignRefs.loadedAnchors, so replace rather than modify them.)
+        for key, refs in self.foreignRefs.refs.items():
+            newRefs = []
             for ref in refs:
                 if ref.status != "local" and ref.shortname.rstrip() == self.shortname:
-                    ref._ref["export"] = False  # pylint: disable=protected-access
+                    data = ref._ref.copy()  # pylint: disable=protected-access
+                    data["export"] = False
+                    ref = wrapper.RefWrapper(ref.text, data)
+                newRefs.append(ref)
+            self.foreignRefs.refs[key] = newRefs
 
     def addLocalDfns(self, doc: t.SpecT, dfns: t.Iterable[t.ElementT]) -> None:
         for el in dfns:
@@ -340,6 +375,7 @@ class ReferenceManager:
                 methodishStart = re.match(r"([^(]+\()[^)]", linkText)
                 if methodishStart:
                     self.localRefs.addMethodVariants(linkText, dfnForList, ref.shortname)
+        self.refCache.clear()
 
     def filterObsoletes(self, refs: list[RefWrapper]) -> list[RefWrapper]:
         return utils.filterObsoletes(
@@ -371,6 +407,53 @@ class ReferenceManager:
         linkForHint: str | None = None,
         error: bool = True,
         el: t.ElementT | None = None,
+    ) -> RefWrapper | None:
+        # The same terms get linked over and over,
+        # so remember the answer for each distinct query.
+        # Queries that emit any messages aren't remembered,
+        # so they still get reported at every element that makes them.
+        key = (
+            linkType,
+            text,
+            spec,
+            status,
+            statusHint,
+            tuple(linkFor) if isinstance(linkFor, list) else linkFor,
+            explicitFor,
+            linkForHint,
+            error,
+        )
+        if key in self.refCache:
+            return self.refCache[key]
+        messageAttempts = m.messageAttempts
+        ref = self._getRef(
+            linkType,
+            text,
+            spec=spec,
+            status=status,
+            statusHint=statusHint,
+            linkFor=linkFor,
+            explicitFor=explicitFor,
+            linkForHint=linkForHint,
+            error=error,
+            el=el,
+        )
+        if m.messageAttempts == messageAttempts:
+            self.refCache[key] = ref
+        return ref
+
+    def _getRef(
+        self,
+        linkType: str,
+        text: str,
+        spec: str | None = None,
+        status: str | None = None,
+        statusHint: str | None = None,
+        linkFor: str | list[str] | None = None,
+        explicitFor: bool = False,
+        linkForHint: str | None = None,
+        error: bool = True,
+        el: t.ElementT | None = None,
     ) -> RefWrapper | None:
         # If error is False, this function just shuts up and returns a reference or None
         # Otherwise, it pops out debug messages for the user.
@@ -708,7 +791,7 @@ class ReferenceManager:
             # then [[foo-2]] is just an error.
             match = re.match(r"(.+)-\d+$", key)
             failFromWrongSuffix = False
-            if match and match.group(1) in self.biblios:
+            if match and self.hasLoadedBiblio(match.group(1)):
                 unversionedKey = match.group(1)
                 if unversionedKey in self.biblioNumericSuffixes:
                     # Nope, there are more numeric-suffixed versions,
@@ -783,15 +866,68 @@ class ReferenceManager:
         # and then actually fetch it.
         # If you don't call this,
         # the current data might not be reliable.
+        index = self.biblioIndex()
+        if index is not None:
+            group = key[0:2]
+            if key not in self.biblios:
+                self.loadedBiblioGroups.add(group)
+            if group in self.loadedBiblioGroups:
+                self._pullIndexedBiblios(index, key)
+            return self.biblios.get(key, [])
         if key not in self.biblios:
             # Try to load the group up, if necessary
             group = key[0:2]
             if group not in self.loadedBiblioGroups:
-                with self.dataFile.fetch("biblio", f"biblio-{group}.data", okayToFail=True) as fh:
-                    biblio.loadBiblioDataFile(fh, self.biblios)
+                try:
+                    lines = self.dataFile.fetchParsed("biblio", f"biblio-{group}.data", parser=biblio.splitLines)
+                except OSError:
+                    lines = []
+                biblio.loadBiblioDataFile(iter(lines), self.biblios)
             self.loadedBiblioGroups.add(group)
         return self.biblios.get(key, [])
 
+    def addLocalBiblios(self, storage: t.BiblioStorageT) -> None:
+        # Adds biblio entries from outside the biblio data, like the doc's own biblio blocks.
+        self.addBiblioKeys(storage)
+        for k, vs in storage.items():
+            self.localBiblioKeys.add(k)
+            self.biblios[k].extend(vs)
+
+    def addBiblioKeys(self, keys: t.Iterable[str]) -> None:
+        newKeys = set(keys) - self.biblioKeys
+        self.biblioKeys.update(newKeys)
+        if self._biblioKeyBigrams is not None:
+            biblio.addBigrams(self._biblioKeyBigrams, newKeys)
+
+    def findCloseBiblios(self, target: str) -> list[str]:
+        if self._biblioKeyBigrams is None:
+            self._biblioKeyBigrams = defaultdict(list)
+            biblio.addBigrams(self._biblioKeyBigrams, self.biblioKeys)
+        return biblio.findCloseBiblios(self.biblioKeys, self._biblioKeyBigrams, target)
+
+    def biblioIndex(self) -> biblioindex.BiblioIndex | None:
+        if self._biblioIndex is False:
+            self._biblioIndex = biblioindex.openBiblioIndex(self.dataFile)
+        return self._biblioIndex
+
+    def hasLoadedBiblio(self, key: str) -> bool:
+        # Whether the key is in the biblio data loaded so far,
+        # without loading its group if it's not already.
+        index = self.biblioIndex()
+        if index is not None and key[0:2] in self.loadedBiblioGroups:
+            self._pullIndexedBiblios(index, key)
+        return key in self.biblios
+
+    def _pullIndexedBiblios(self, index: biblioindex.BiblioIndex, key: str) -> None:
+        # Adds the key's entries from the index to self.biblios,
+        # same as loading its whole group would have.
+        if key in self.indexedBiblioKeys:
+            return
+        self.indexedBiblioKeys.add(key)
+        entries = index.entriesForKey(key)
+        if entries:
+            self.biblios[key].extend(entries)
+
     def _bestCandidateBiblio(self, candidates: list[biblio.BiblioEntry]) -> biblio.BiblioEntry:
         return sorted(candidates, key=lambda x: x.order or 0)[0].strip()
 
@@ -802,19 +938,31 @@ class ReferenceManager:
         candidates = self.bibliosFromKey(key)
         if not candidates:
             return None
+        index = self.biblioIndex()
+        if index is not None:
+            # The index's keys are sorted, so the variants are all in one prefix range.
+            # (Only the keys in loaded groups would be in self.biblios without the index.)
+            keys = [k for k in index.keysWithPrefix(key) if k[0:2] in self.loadedBiblioGroups]
+            keys += [k for k in self.localBiblioKeys if k.startswith(key)]
+        else:
+            keys = [k for k in self.biblios if k.startswith(key)]
         latestDate = None
-        latestRefs = None
-        for k, biblios in self.biblios.items():
-            if not k.startswith(key):
-                continue
+        latestKey = None
+        for k in keys:
             match = re.search(r"(\d{8})$", k)
             if not match:
                 continue
             date = match.group(1)
             if latestDate is None or date > latestDate:
                 latestDate = date
-                latestRefs = biblios
-        if latestRefs is None:
+                latestKey = k
+        if latestKey is None:
+            return None
+        # Only the latest one needs its entries built.
+        if index is not None:
+            self._pullIndexedBiblios(index, latestKey)
+        latestRefs = self.biblios.get(latestKey)
+        if not latestRefs:
             return None
         return self._bestCandidateBiblio(latestRefs)
 
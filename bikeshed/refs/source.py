@@ -6,7 +6,7 @@ import re
 from collections import defaultdict
 
 from .. import config, constants, messages as m, retrieve, t
-from . import utils, wrapper
+from . import anchorindex, utils
 
 
 class RefSource:
@@ -19,7 +19,8 @@ class RefSource:
         "specs",
         "ignoredSpecs",
         "replacedSpecs",
-        "_loadedAnchorGroups",
+        "loadedAnchors",
+        "_anchorIndex",
     ]
 
     # Which sources use lazy-loading; other sources always have all their refs loaded immediately.
@@ -53,7 +54,17 @@ class RefSource:
         self.specs: dict[str, dict[str, str]] = {} if specs is None else specs
         self.ignoredSpecs = set() if ignored is None else ignored
         self.replacedSpecs = set() if replaced is None else replaced
-        self._loadedAnchorGroups: set[str] = set()
+        # The lazily-loaded anchor data, as it is on disk.
+        # (self.refs gets filled from this as keys are requested.)
+        self.loadedAnchors = LoadedAnchors()
+        # The prebuilt anchor index, if there's a usable one.
+        # False means it hasn't been looked for yet.
+        self._anchorIndex: anchorindex.AnchorIndex | None | t.Literal[False] = False
+
+    def anchorIndex(self) -> anchorindex.AnchorIndex | None:
+        if self._anchorIndex is False:
+            self._anchorIndex = anchorindex.openAnchorIndex(self.dataFile)
+        return self._anchorIndex
 
     def fetchRefs(self, key: str) -> list[t.RefWrapper]:
         """Safe, lazy-loading version of self.refs[key]"""
@@ -64,15 +75,42 @@ class RefSource:
         if self.source not in self.lazyLoadedSources:
             return []
 
-        group = config.groupFromKey(key)
-        if group in self._loadedAnchorGroups:
-            # Group was loaded, but previous check didn't find it, so it's just not here.
-            return []
-        # Otherwise, load the group file.
-        with self.dataFile.fetch("anchors", f"anchors-{group}.data", okayToFail=True) as fh:
-            self.refs.update(decodeAnchors(fh))
-            self._loadedAnchorGroups.add(group)
-        return self.refs.get(key, [])
+        loaded = self.loadedAnchors
+        if key not in loaded.refs and not loaded.all:
+            index = self.anchorIndex()
+            if index is not None:
+                # Cache misses too, so repeated lookups don't hit the index again.
+                loaded.refs[key] = index.refsForKey(key)
+            else:
+                group = config.groupFromKey(key)
+                # If the group was already loaded, the key just isn't there.
+                if group not in loaded.groups:
+                    with self.dataFile.fetch("anchors", f"anchors-{group}.data", okayToFail=True) as fh:
+                        loaded.refs.update(utils.decodeAnchors(fh))
+                        loaded.groups.add(group)
+        refs = loaded.refs.get(key, [])
+        self.refs[key] = refs
+        return refs
+
+    def textsWithRefs(self, text: str, texts: list[str], unstemmed: t.AbstractSet[str] = frozenset()) -> list[str]:
+        """
+        Filters some variations of the given link text down to the ones that have refs.
+        All of a text's variations share its utils.linkTextStem(),
+        so the anchor index's stem table gives every key they could match in one lookup,
+        rather than fetching each variation in turn.
+        Texts in `unstemmed` don't come from linkTextVariations(),
+        so they're always kept.
+        """
+        if self.source not in self.lazyLoadedSources:
+            return texts
+        index = self.anchorIndex()
+        if index is None:
+            return texts
+        stem = utils.linkTextStem(text)
+        if stem is None:
+            return texts
+        keys = index.keysWithStem(stem)
+        return [x for x in texts if x in keys or x in unstemmed]
 
     def fetchAllRefs(self) -> list[tuple[str, list[t.RefWrapper]]]:
         """Nuts to lazy-loading, just load everything at once."""
@@ -80,15 +118,26 @@ class RefSource:
         if self.source not in self.lazyLoadedSources:
             return list(self.refs.items())
 
-        for file in self.dataFile.walkFiles("anchors"):
-            group = t.cast(re.Match, re.match(r"anchors-(.{2})", file)).group(1)
-            if group in self._loadedAnchorGroups:
-                # Already loaded
-                continue
-            with self.dataFile.fetch("anchors", file) as fh:
-                self.refs.update(decodeAnchors(fh))
-                self._loadedAnchorGroups.add(group)
-        return list(self.refs.items())
+        loaded = self.loadedAnchors
+        if not loaded.all:
+            index = self.anchorIndex()
+            if index is not None:
+                for key, refs in index.items():
+                    loaded.refs.setdefault(key, refs)
+            else:
+                for file in self.dataFile.walkFiles("anchors"):
+                    group = t.cast(re.Match, re.match(r"anchors-(.{2})", file)).group(1)
+                    if group in loaded.groups:
+                        # Already loaded
+                        continue
+                    with self.dataFile.fetch("anchors", file) as fh:
+                        loaded.refs.update(utils.decodeAnchors(fh))
+                        loaded.groups.add(group)
+            loaded.all = True
+        for key, refs in loaded.refs.items():
+            if key not in self.refs:
+                self.refs[key] = refs
+        return [(key, refs) for key, refs in self.refs.items() if refs]
 
     def queryRefs(
         self,
@@ -213,11 +262,14 @@ class RefSource:
                 refs = list(textRefsIterator([text]))
             else:
                 textsToSearch = list(utils.linkTextVariations(text, linkType))
+                methodTexts: set[str] = set()
                 if text.endswith("()") and text in self.methods:
+                    methodTexts.update(self.methods[text].variants.keys())
                     textsToSearch += list(self.methods[text].variants.keys())
                 if (linkType is None or linkType in config.lowercaseTypes) and text.lower() != text:
+                    methodTexts.update([t.lower() for t in methodTexts])
                     textsToSearch += [t.lower() for t in textsToSearch]
-                refs = list(textRefsIterator(textsToSearch))
+                refs = list(textRefsIterator(self.textsWithRefs(text, textsToSearch, methodTexts)))
         elif linkFor:
             refs = list(forRefsIterator(linkFor))
         else:
@@ -373,31 +425,19 @@ class RefSource:
         variants[methodSig].for_.extend(forVals)
 
 
-def decodeAnchors(linesIter: t.Iterator[str]) -> defaultdict[str, list[t.RefWrapper]]:
-    # Decodes the anchor storage format into {key: [{anchor-data}]}
-    anchors = defaultdict(list)
-    try:
-        while True:
-            key = next(linesIter)[:-1]
-            a: wrapper.RefDataT = {
-                "type": next(linesIter),
-                "spec": next(linesIter),
-                "shortname": next(linesIter),
-                "level": next(linesIter),
-                "status": next(linesIter),
-                "url": next(linesIter),
-                "export": next(linesIter) != "\n",
-                "normative": next(linesIter) != "\n",
-                "for_": [],
-            }
-            while True:
-                line = next(linesIter)
-                if line == "-\n":
-                    break
-                t.cast("list", a["for_"]).append(line)
-            anchors[key].append(wrapper.RefWrapper(key, a))
-    except StopIteration:
-        return anchors
+@dataclasses.dataclass
+class LoadedAnchors:
+    # The anchor data a lazy-loading RefSource has read so far.
+    # Nothing in here gets modified once loaded
+    # (unlike RefSource.refs, which a build can alter),
+    # so watch mode hands it to each rebuild's RefSource rather than reloading it.
+
+    # Dict of {linking text => [anchor data]}, including known misses as empty lists
+    refs: dict[str, list[t.RefWrapper]] = dataclasses.field(default_factory=dict)
+    # Anchor group files that have been fully read into refs
+    groups: set[str] = dataclasses.field(default_factory=set)
+    # Whether every anchor has been read in
+    all: bool = False
 
 
 @dataclasses.dataclass
@@ -3,6 +3,7 @@ from __future__ import annotations
 from collections import defaultdict
 
 from .. import config, t
+from . import wrapper
 
 
 def filterObsoletes(
@@ -182,6 +183,64 @@ def linkTextVariations(str: str, linkType: str | None) -> t.Generator[str, None,
             yield '"' + str + '"'
 
 
+def linkTextStem(text: str) -> str | None:
+    """
+    Collapses link text down to a rough stem,
+    which is the same for the text, all of its linkTextVariations(),
+    and their lowercased versions.
+    The anchor index files each key under its stem,
+    so a fuzzy lookup can find every key its variations might hit with a single lookup.
+
+    Returns None for an opening quote with no closing one,
+    since stripping an enum-value's quotes there cuts off a real character
+    and the variations don't all share a stem.
+    """
+    text = text.strip()
+    if text[:1] == '"' and (len(text) == 1 or text[-1] != '"'):
+        return None
+    words = text.lower().lstrip('_"').split()
+    return " ".join(stem for stem in (_wordStem(word) for word in words) if stem)
+
+
+def _wordStem(word: str) -> str:
+    # Strips off anything that a conjugation might have added or removed,
+    # and collapses doubled letters, so "snapped", "snapping", and "snaps" all become "snap".
+    while True:
+        stripped = word.rstrip("iesydngl'’\"()")
+        while len(stripped) >= 2 and stripped[-1] == stripped[-2]:
+            stripped = stripped[:-1]
+        if stripped == word:
+            return word
+        word = stripped
+
+
+def decodeAnchors(linesIter: t.Iterator[str]) -> defaultdict[str, list[t.RefWrapper]]:
+    # Decodes the anchor storage format into {key: [{anchor-data}]}
+    anchors = defaultdict(list)
+    try:
+        while True:
+            key = next(linesIter)[:-1]
+            a: wrapper.RefDataT = {
+                "type": next(linesIter),
+                "spec": next(linesIter),
+                "shortname": next(linesIter),
+                "level": next(linesIter),
+                "status": next(linesIter),
+                "url": next(linesIter),
+                "export": next(linesIter) != "\n",
+                "normative": next(linesIter) != "\n",
+                "for_": [],
+            }
+            while True:
+                line = next(linesIter)
+                if line == "-\n":
+                    break
+                t.cast("list", a["for_"]).append(line)
+            anchors[key].append(wrapper.RefWrapper(key, a))
+    except StopIteration:
+        return anchors
+
+
 if t.TYPE_CHECKING:
     U = t.TypeVar("U", bound="t.MutableMapping|t.MutableSequence")
 
@@ -3,7 +3,9 @@
 from __future__ import annotations
 
 import io
+import json
 import os
+import time
 
 from . import config, InputSource, messages as m, t
 
@@ -57,6 +59,41 @@ class DataFileRequester:
                         return self._fail(location, str=False, okayToFail=okayToFail)
             return self._fail(location, str, okayToFail)
 
+    def fetchParsed(
+        self,
+        *segs: str,
+        parser: t.Callable[[str], t.Any] = json.loads,
+        fileType: str | None = None,
+    ) -> t.Any:
+        """
+        Like fetch(str=True), but returns the file after running it thru parser (JSON by default),
+        reusing an earlier result if the file hasn't changed since.
+        The cache is shared by every requester in the process,
+        so long-lived processes (like the daemon) only parse each data file once;
+        the returned value is shared too, so callers must copy anything they want to mutate.
+        """
+        location = self._resolvePath(segs=segs, fileType=fileType or self.fileType)
+        try:
+            mtime = os.stat(location).st_mtime_ns
+        except OSError:
+            # Let fetch() produce the usual error.
+            return parser(self.fetch(*segs, str=True, fileType=fileType))
+        cacheKey = (location, parser)
+        cached = _parsedFiles.get(cacheKey)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        with open(location, encoding="utf-8") as fh:
+            data = parser(fh.read())
+        _parsedFiles[cacheKey] = (mtime, data)
+        return data
+
+    def _resolvePath(self, segs: t.Sequence[str], fileType: str | None = None) -> str:
+        # The path fetch() would end up reading from, following the fallback if needed.
+        location = self._buildPath(segs=segs, fileType=fileType)
+        if self.fallback and not os.path.exists(location):
+            return self.fallback._resolvePath(segs=segs)  # pylint: disable=protected-access
+        return location
+
     def walkFiles(self, *segs: str, fileType: str | None = None) -> t.Generator[str, None, None]:
         for _, _, files in os.walk(self._buildPath(segs, fileType=fileType or self.fileType)):
             yield from files
@@ -92,6 +129,20 @@ class DataFileRequester:
 
 defaultRequester = DataFileRequester(fileType="latest", fallback=DataFileRequester(fileType="readonly"))
 
+# {(file location, parser) => (mtime, parsed data)}, see DataFileRequester.fetchParsed()
+_parsedFiles: dict[tuple[str, t.Callable[[str], t.Any]], tuple[int, t.Any]] = {}
+
+# {folder => (its statKey(), casefolded filenames)}, see listFolder()
+_folderListings: dict[str, tuple[tuple[int, int, int], frozenset[str]]] = {}
+
+# {file location => (its statKey(), content)}, see readBoilerplateSource()
+_boilerplateContents: dict[str, tuple[tuple[int, int, int], str]] = {}
+
+# Filesystems only keep timestamps so precisely (FAT only to 2 seconds),
+# so something changed twice in the same tick looks like it was only changed once.
+# To be safe, listFolder() and readBoilerplateSource() only cache what hadn't changed for this long before it was read.
+_settleTimeNs = 2 * 10**9
+
 
 def retrieveBoilerplateFile(
     doc: t.SpecT,
@@ -122,8 +173,10 @@ def retrieveBoilerplateFile(
 
     searchLocally = allowLocal and doc.md.localBoilerplate[name]
 
+    boilerplateFolder = dataFile.path("boilerplate")
+
     def boilerplatePath(*segs: str) -> str:
-        return dataFile.path("boilerplate", *segs)
+        return os.path.join(boilerplateFolder, *segs)
 
     statusFile = f"{name}-{status}.include"
     genericFile = f"{name}.include"
@@ -133,7 +186,7 @@ def retrieveBoilerplateFile(
         sources.append(doc.inputSource.relative(genericFile))
     else:
         for f in (statusFile, genericFile):
-            if doc.inputSource.cheaplyExists(f):
+            if sourceExists(doc.inputSource, f):
                 m.warn(
                     f"Found {f} next to the specification without a matching\n"
                     + f"Local Boilerplate: {name} yes\n"
@@ -156,13 +209,95 @@ def retrieveBoilerplateFile(
 
     for source in sources:
         if source is not None:
-            try:
-                return source.read().content
-            except OSError:
-                # That input doesn't exist.
-                pass
+            content = readBoilerplateSource(source)
+            if content is not None:
+                return content
     if error:
         m.die(
             f"Couldn't find an appropriate include file for the {name} inclusion, given group='{group}' and status='{status}'."
         )
     return ""
+
+
+def readBoilerplateSource(source: InputSource.InputSource) -> str | None:
+    # Returns the source's content, or None if it doesn't exist.
+    # Most of the places boilerplate is looked for don't have the file,
+    # and every spec looks up the same few files,
+    # so for plain files, check the folder's (cached) listing rather than trying to open it,
+    # and reuse the content if the file hasn't changed since it was last read.
+    if not isinstance(source, InputSource.FileInputSource):
+        try:
+            return source.read().content
+        except OSError:
+            return None
+    path = source.sourceName
+    if not mightExist(path):
+        return None
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    fileKey = statKey(stat)
+    cached = _boilerplateContents.get(path)
+    if cached is not None and cached[0] == fileKey:
+        return cached[1]
+    readAt = time.time_ns()
+    try:
+        content = source.read().content
+    except OSError:
+        return None
+    if isSettled(stat, readAt):
+        _boilerplateContents[path] = (fileKey, content)
+    return content
+
+
+def sourceExists(inputSource: InputSource.InputSource, relativePath: str) -> bool:
+    # Like inputSource.cheaplyExists(relativePath), but skipping the check for files that can't exist.
+    if isinstance(inputSource, InputSource.FileInputSource) and not mightExist(
+        inputSource.relative(relativePath).sourceName
+    ):
+        return False
+    return bool(inputSource.cheaplyExists(relativePath))
+
+
+def mightExist(path: str) -> bool:
+    # Whether the file might exist, going by its folder's listing.
+    # (The names are casefolded, in case the filesystem is case-insensitive,
+    # so a True still needs checking.)
+    folder, filename = os.path.split(path)
+    return filename.casefold() in listFolder(folder)
+
+
+def listFolder(folder: str) -> frozenset[str]:
+    """
+    Returns the casefolded names of the files in the folder (or nothing, if it doesn't exist),
+    reusing an earlier listing if the folder hasn't changed since.
+    Adding, removing, or renaming a file changes its folder's mtime and ctime,
+    so this is always up to date.
+    """
+    try:
+        stat = os.stat(folder)
+    except OSError:
+        return frozenset()
+    folderKey = statKey(stat)
+    cached = _folderListings.get(folder)
+    if cached is not None and cached[0] == folderKey:
+        return cached[1]
+    listedAt = time.time_ns()
+    try:
+        filenames = frozenset(filename.casefold() for filename in os.listdir(folder))
+    except OSError:
+        filenames = frozenset()
+    if isSettled(stat, listedAt):
+        _folderListings[folder] = (folderKey, filenames)
+    return filenames
+
+
+def statKey(stat: os.stat_result) -> tuple[int, int, int]:
+    return (stat.st_mtime_ns, stat.st_ctime_ns, stat.st_size)
+
+
+def isSettled(stat: os.stat_result, readAt: int) -> bool:
+    # Whether the file hadn't changed in the last timestamp tick before readAt,
+    # so any later change is sure to change its statKey().
+    return readAt - max(stat.st_mtime_ns, stat.st_ctime_ns) >= _settleTimeNs
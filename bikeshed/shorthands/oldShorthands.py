@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import functools
 import re
 
 from .. import config, h, messages as m, t
@@ -172,11 +173,37 @@ def transformAutolinkShortcuts(doc: t.SpecT) -> None:
     # Do the remaining textual replacements
 
     addedNodes = []
+    shortcuts = autolinkShortcuts(doc.md.markupShorthands)
+    # Matches wherever any of the shortcuts would,
+    # so text without any shorthands in it is ruled out with a single scan.
+    anyShortcutRe = combinedRegex([regex for regex, _ in shortcuts])
+
+    def needsRewrite(parentEl: t.ElementT) -> bool:
+        # Whether any of the element's own text has a shorthand in it
+        # (or it has comments/etc, which the rewrite drops).
+        if anyShortcutRe is None:
+            return any(not h.isElement(child) for child in parentEl)
+        if parentEl.text and anyShortcutRe.search(parentEl.text):
+            return True
+        for child in parentEl:
+            if not h.isElement(child):
+                return True
+            if child.tail and anyShortcutRe.search(child.tail):
+                return True
+        return False
 
     def transformElement(parentEl: t.ElementT) -> None:
         processContents = h.isElement(parentEl) and not doc.isOpaqueElement(parentEl)
         if not processContents:
             return
+        if not needsRewrite(parentEl):
+            # Rewriting would put everything back as it was
+            # (apart from the emptied text), so just recurse.
+            if parentEl.text is None:
+                parentEl.text = ""
+            for el in parentEl:
+                transformElement(el)
+            return
         children = h.childNodes(parentEl, clear=True)
         newChildren = []
         for el in children:
@@ -189,27 +216,8 @@ def transformAutolinkShortcuts(doc: t.SpecT) -> None:
 
     def transformText(text: str) -> list[t.NodeT]:
         nodes: list[t.NodeT] = [text]
-        if "css" in doc.md.markupShorthands:
-            nodes = config.processTextNodes(nodes, propdescRe, propdescReplacer)
-        if "dfn" in doc.md.markupShorthands:
-            nodes = config.processTextNodes(nodes, dfnRe, dfnReplacer)
-            nodes = config.processTextNodes(nodes, abstractRe, abstractReplacer)
-        if "http" in doc.md.markupShorthands:
-            nodes = config.processTextNodes(nodes, headerRe, headerReplacer)
-        if "idl" in doc.md.markupShorthands:
-            nodes = config.processTextNodes(nodes, idlRe, idlReplacer)
-        if "markup" in doc.md.markupShorthands:
-            nodes = config.processTextNodes(nodes, elementRe, elementReplacer)
-        if "biblio" in doc.md.markupShorthands:
-            nodes = config.processTextNodes(nodes, biblioRe, biblioReplacer)
-            nodes = config.processTextNodes(nodes, sectionRe, sectionReplacer)
-        if "algorithm" in doc.md.markupShorthands:
-            nodes = config.processTextNodes(nodes, varRe, varReplacer)
-        if "markdown" in doc.md.markupShorthands:
-            nodes = config.processTextNodes(nodes, inlineLinkRe, inlineLinkReplacer)
-            nodes = config.processTextNodes(nodes, strongRe, strongReplacer)
-            nodes = config.processTextNodes(nodes, emRe, emReplacer)
-            nodes = config.processTextNodes(nodes, escapedRe, escapedReplacer)
+        for regex, replacer in shortcuts:
+            nodes = config.processTextNodes(nodes, regex, replacer)
         for node in nodes:
             if h.isElement(node):
                 addedNodes.append(node)
@@ -224,6 +232,56 @@ def transformAutolinkShortcuts(doc: t.SpecT) -> None:
         h.fixSurroundingTypography(el)
 
 
+def autolinkShortcuts(markupShorthands: config.BoolSet) -> list[tuple[re.Pattern, t.Callable[[re.Match], t.NodeT]]]:
+    # The enabled textual shortcuts, in the order they're applied.
+    # Each one only sees the text the earlier ones left alone.
+    shortcuts: list[tuple[re.Pattern, t.Callable[[re.Match], t.NodeT]]] = []
+    if "css" in markupShorthands:
+        shortcuts.append((propdescRe, propdescReplacer))
+    if "dfn" in markupShorthands:
+        shortcuts.append((dfnRe, dfnReplacer))
+        shortcuts.append((abstractRe, abstractReplacer))
+    if "http" in markupShorthands:
+        shortcuts.append((headerRe, headerReplacer))
+    if "idl" in markupShorthands:
+        shortcuts.append((idlRe, idlReplacer))
+    if "markup" in markupShorthands:
+        shortcuts.append((elementRe, elementReplacer))
+    if "biblio" in markupShorthands:
+        shortcuts.append((biblioRe, biblioReplacer))
+        shortcuts.append((sectionRe, sectionReplacer))
+    if "algorithm" in markupShorthands:
+        shortcuts.append((varRe, varReplacer))
+    if "markdown" in markupShorthands:
+        shortcuts.append((inlineLinkRe, inlineLinkReplacer))
+        shortcuts.append((strongRe, strongReplacer))
+        shortcuts.append((emRe, emReplacer))
+        shortcuts.append((escapedRe, escapedReplacer))
+    return shortcuts
+
+
+@functools.lru_cache(maxsize=None)
+def _combinedRegex(patterns: tuple[tuple[str, int], ...]) -> re.Pattern:
+    alternatives = []
+    for pattern, flags in patterns:
+        # Scope each pattern's own flags (mostly re.X) to its alternative.
+        scopedFlags = "x" if flags & re.X else ""
+        alternatives.append(f"(?{scopedFlags}:{pattern}\n)" if scopedFlags else f"(?:{pattern})")
+    return re.compile("|".join(alternatives))
+
+
+def combinedRegex(regexes: list[re.Pattern]) -> re.Pattern | None:
+    """
+    Returns a regex that matches somewhere in a string
+    iff at least one of the regexes does, or None if there are none.
+    Only meant for ruling out strings quickly;
+    the match itself doesn't say which regex matched.
+    """
+    if not regexes:
+        return None
+    return _combinedRegex(tuple((regex.pattern, regex.flags) for regex in regexes))
+
+
 def transformShorthandElements(doc: t.SpecT) -> None:
     """
     The <l> element can contain any shorthand,